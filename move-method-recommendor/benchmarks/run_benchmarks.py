@@ -0,0 +1,301 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from tabulate import tabulate
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+from metrics import peak_rss_mb
+from synthetic_project import generate_project
+
+"""
+    Scaling benchmarks for llm_generator.py and refactor_recommendation.py on synthetic java projects.
+
+    Run from move-method-recommendor:
+        python benchmarks/run_benchmarks.py --sizes 50,200,1000 --embedding random --ast-workers 4
+        python benchmarks/run_benchmarks.py --sizes 50,200,1000 --embedding random --ast-workers 4 --update-baseline
+
+    For each size (number of classes) a project is generated (see synthetic_project.py), then every stage runs in
+    its own process, so the reported peak RSS belongs to that stage alone:
+        ast        GenerateAST --batch over the java files (skipped when java / test_out are not available)
+        summarize  llm_generator's class and method prompts through SummaryEngine against the ollama_stub.py
+                   server, from the ast stage's records
+        embed      summary and code vectors (the real models, or deterministic random vectors with --embedding random)
+        score      rule based decisions + candidate scoring (recommend)
+    Stages hand their outputs to the next one through files in the work directory.
+
+    Results are compared with benchmarks/baseline.json: a stage whose throughput dropped, or whose peak RSS grew, by
+    more than --tolerance fails the run (exit code 1). So does a run that cannot be compared: no baseline file, a
+    baseline recorded with other options, or none of the sizes in it. --no-compare only reports the results.
+    The committed baseline was recorded with the second command above; its numbers belong to the machine it ran on,
+    so re-record it (same options) before comparing on another one.
+"""
+
+STAGES = ["ast", "summarize", "embed", "score"]
+BASELINE_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+def read_ast_records(workdir: str):
+    with open(os.path.join(workdir, "ast.jsonl"), encoding="utf-8") as file:
+        for line in file:
+            yield json.loads(line)
+
+def bench_ast(workdir: str, options: dict) -> dict:
+    from llm_generator import ASTServer, get_java_files
+
+    root = os.path.abspath(os.path.join(SCRIPTS_DIR, ".."))
+    if shutil.which("java") is None or not os.path.isdir(os.path.join(root, "test_out")):
+        return {"skipped": "java or compiled test_out/ not available"}
+
+    java_files = list(get_java_files(os.path.join(workdir, "src")))
+    parsed = 0
+    start = time.perf_counter()
+    with ASTServer(threads=options["ast_workers"]) as server:
+        for _, ast in server.parse_many(java_files):
+            parsed += bool(ast)
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "items": len(java_files), "unit": "files", "failed": len(java_files) - parsed}
+
+def bench_summarize(workdir: str, options: dict) -> dict:
+    import llm_generator
+    from ollama_client import OllamaClient, SummaryEngine
+    from ollama_stub import make_stub_server
+    from summary_records import SummaryRecordWriter
+
+    server = make_stub_server(port=0, delay=options["stub_delay"])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OllamaClient(f"http://127.0.0.1:{server.server_address[1]}")
+    engine = SummaryEngine(client, "stub", workers=options["llm_workers"], retries=1)
+    settings = llm_generator.summary_settings("stub")
+
+    def iter_java_asts(java_files):
+        # The records of the ast stage stand in for the JVM (measured on its own), in the order of java_files
+        for java_file, ast in zip(java_files, read_ast_records(workdir)):
+            assert ast.pop("path") == java_file
+            yield java_file, ast
+
+    # llm_generator's own job stream (iter_summary_jobs), only parsing is replaced
+    llm_generator.iter_java_asts = iter_java_asts
+    java_files = [ast["path"] for ast in read_ast_records(workdir)]
+    jobs = llm_generator.iter_summary_jobs(java_files, os.path.join(workdir, "src"))
+
+    prompts = 0
+    current_file = None
+    start = time.perf_counter()
+    with SummaryRecordWriter(os.path.join(workdir, "summaries.jsonl"), resume=False) as writer:
+        for (kind, name, item), summary in engine.map(jobs):
+            if kind == "source":
+                current_file = name
+                writer.write_source(name, *item)
+            elif kind == "class":
+                prompts += 1
+                item["summary"] = summary
+                writer.write_class(current_file, name, item)
+            elif kind == "method":
+                prompts += summary is not None
+                writer.write_method(current_file, name, summary or "", {
+                    key: item.get(key) for key in ("name", "parameters", "methodCalls", "methodFieldAccess", "methodBody")})
+            else:
+                writer.finish_file(name, item, settings)
+    seconds = time.perf_counter() - start
+    server.shutdown()
+    return {"seconds": seconds, "items": prompts, "unit": "prompts", "failed": engine.failures}
+
+def random_embedder(dim: int):
+    """
+    Deterministic stand-in for the embedding models: a random vector seeded by the text
+    """
+    import zlib
+
+    def encode(batch):
+        rows = [np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(dim) for text in batch]
+        return np.asarray(rows, dtype=np.float32)
+    return encode
+
+def bench_embed(workdir: str, options: dict) -> dict:
+    import refactor_recommendation as rr
+
+    classes, methods = rr.load_llm_summaries(os.path.join(workdir, "summaries.jsonl"))
+
+    models = rr.LazyModels()
+    if options["embedding"] == "random":
+        # Replace the model loaders, everything else (batching, stores) runs as in a real run
+        class RandomSummaryModel:
+            encode = staticmethod(lambda batch, batch_size=None: random_embedder(384)(batch))
+        models._loaders = {"summary": lambda: RandomSummaryModel(), "code": lambda: (None, None)}
+        rr.encode_codebert = lambda code, tokenizer, model: random_embedder(768)(code)
+
+    # As in refactor_recommendation.py, methods decided by the rules are not embedded
+    scored = {key: methods[key] for key in rr.rule_based_decisions(classes, methods)[1]}
+    start = time.perf_counter()
+    embeddings = rr.embed_classes_and_methods(classes, scored, models, batch_size=options["batch_size"],
+                                              all_methods=methods)
+    seconds = time.perf_counter() - start
+
+    np.savez(os.path.join(workdir, "embeddings.npz"),
+             **{name: embeddings[name] for name in ("class_summary", "class_code", "method_summary", "method_code")})
+    return {"seconds": seconds, "items": len(classes) + len(scored), "unit": "texts",
+            "backend": options["embedding"]}
+
+def bench_score(workdir: str, options: dict) -> dict:
+    import refactor_recommendation as rr
+
+    classes, methods = rr.load_llm_summaries(os.path.join(workdir, "summaries.jsonl"))
+    with np.load(os.path.join(workdir, "embeddings.npz")) as stored:
+        embeddings = {name: stored[name] for name in stored.files}
+    embeddings["class_index"] = {cls: row for row, cls in enumerate(classes)}
+    embeddings["method_index"] = {key: row for row, key in enumerate(rr.rule_based_decisions(classes, methods)[1])}
+
+    start = time.perf_counter()
+    recommendations = rr.recommend(classes, methods, embeddings, candidate_mode=options["candidates"])
+    seconds = time.perf_counter() - start
+
+    moves = sum(r["action"].startswith("MOVE") for r in recommendations)
+    return {"seconds": seconds, "items": len(methods), "unit": "methods", "moves": moves}
+
+STAGE_FUNCTIONS = {"ast": bench_ast, "summarize": bench_summarize, "embed": bench_embed, "score": bench_score}
+
+def run_stage(stage: str, workdir: str, options: dict) -> dict:
+    """
+    Runs in a fresh process: returns the stage result plus its throughput and the process peak RSS
+    """
+    result = STAGE_FUNCTIONS[stage](workdir, options)
+    if "skipped" not in result:
+        result["throughput"] = round(result["items"] / result["seconds"], 2) if result["seconds"] else float("inf")
+        result["seconds"] = round(result["seconds"], 3)
+        result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def run_benchmarks(sizes, stages, options: dict, workdir: str) -> dict:
+    results = {}
+    context = get_context("spawn")
+    for size in sizes:
+        size_dir = os.path.join(workdir, f"classes-{size}")
+        os.makedirs(size_dir, exist_ok=True)
+        counts = generate_project(size_dir, size, options["methods_per_class"], options["coupling"],
+                                  options["packages"], options["seed"])
+        print(f"Size {size}: {counts['classes']} classes, {counts['methods']} methods")
+
+        results[str(size)] = {}
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                result = pool.submit(run_stage, stage, size_dir, options).result()
+            results[str(size)][stage] = result
+            if "skipped" in result:
+                print(f"  {stage:<10} skipped: {result['skipped']}")
+            else:
+                print(f"  {stage:<10} {result['seconds']:>9.3f}s  {result['throughput']:>10.1f} {result['unit']}/s  "
+                      f"peak RSS {result['peak_rss_mb']:.1f} MB")
+    return results
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Stages (present in both runs) that got slower or bigger than the baseline allows
+    """
+    regressions = []
+    for size, stages in results.items():
+        for stage, result in stages.items():
+            expected = baseline.get(size, {}).get(stage)
+            if not expected or "skipped" in result or "skipped" in expected:
+                continue
+            if result["throughput"] < expected["throughput"] * (1 - tolerance):
+                regressions.append((size, stage, "throughput", expected["throughput"], result["throughput"]))
+            if result["peak_rss_mb"] > expected["peak_rss_mb"] * (1 + tolerance):
+                regressions.append((size, stage, "peak RSS MB", expected["peak_rss_mb"], result["peak_rss_mb"]))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmarks on synthetic java projects")
+    parser.add_argument("--sizes", default="50,200,1000", help="comma separated project sizes (number of classes)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma separated subset of {','.join(STAGES)}")
+    parser.add_argument("--methods-per-class", type=int, default=8, help="business methods per class (plus 4 accessors)")
+    parser.add_argument("--coupling", type=float, default=0.3, help="0..1, how much classes use each other")
+    parser.add_argument("--packages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ast-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--llm-workers", type=int, default=8)
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="seconds the stub LLM waits per request")
+    parser.add_argument("--embedding", choices=["models", "random"], default="models",
+                        help="real SentenceTransformer/CodeBERT, or deterministic random vectors")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--candidates", choices=["exhaustive", "pruned", "ann"], default="exhaustive")
+    parser.add_argument("--workdir", default=None, help="keep the generated projects and stage outputs here")
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    parser.add_argument("--baseline", default=BASELINE_JSON)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--no-compare", action="store_true", help="only report the results, without the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression vs the baseline")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    stages = [stage for stage in args.stages.split(",") if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        sys.exit(f"Unknown stages: {', '.join(sorted(unknown))}")
+    # Stages in pipeline order, each one reads the files of the one before
+    stages = [stage for stage in STAGES if stage in stages]
+
+    options = {
+        "methods_per_class": args.methods_per_class, "coupling": args.coupling, "packages": args.packages,
+        "seed": args.seed, "ast_workers": args.ast_workers, "llm_workers": args.llm_workers,
+        "stub_delay": args.stub_delay, "embedding": args.embedding, "batch_size": args.batch_size,
+        "candidates": args.candidates,
+    }
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="move-method-bench-")
+    try:
+        results = run_benchmarks(sizes, stages, options, workdir)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(tabulate(
+        [(size, stage, r.get("seconds", "-"), r.get("throughput", "-"), r.get("unit", ""), r.get("peak_rss_mb", "-"))
+         for size, stages_results in results.items() for stage, r in stages_results.items()],
+        headers=["Classes", "Stage", "Seconds", "Throughput", "Unit", "Peak RSS MB"],
+        tablefmt="github"
+    ))
+
+    report = {"options": options, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file_out:
+            json.dump(report, file_out, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file_out:
+            json.dump(report, file_out, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+    if args.no_compare:
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}: run with --update-baseline to store one, or pass --no-compare")
+
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    baseline_options = baseline.get("options", {})
+    differences = [f"{name}={options[name]!r} (baseline: {baseline_options.get(name)!r})"
+                   for name in options if baseline_options.get(name) != options[name]]
+    if differences:
+        sys.exit(f"Baseline was recorded with other options: {', '.join(differences)}. "
+                 f"Run with the baseline's options, or pass --no-compare")
+    if not set(results) & set(baseline["results"]):
+        sys.exit(f"Baseline has none of the sizes {args.sizes} (it has {','.join(baseline['results'])}), "
+                 f"pass --no-compare to only report them")
+
+    regressions = compare_with_baseline(results, baseline["results"], args.tolerance)
+    if regressions:
+        print(tabulate(regressions, headers=["Classes", "Stage", "Metric", "Baseline", "Now"], tablefmt="github"),
+              file=sys.stderr)
+        sys.exit(f"{len(regressions)} benchmark regressions beyond {args.tolerance:.0%}")
+    print(f"No regression beyond {args.tolerance:.0%} of the baseline")
@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import random
+
+"""
+    Synthetic java project generator for the scaling benchmarks.
+
+    Writes `classes` java files spread over `packages` packages. Every class has an id/name pair with
+    getters/setters (the KEEP-by-rule methods of entity heavy code) plus `methods_per_class` business methods
+    that call and read through collaborator fields; `coupling` (0..1) sets how many collaborators a class has
+    and how often its methods use them.
+
+    Next to the sources, ast.jsonl holds the records GenerateAST --batch produces for those files, so the
+    stages after AST extraction can run on machines without a JDK.
+"""
+
+def _collaborators(index: int, classes: int, coupling: float, rng: random.Random) -> list:
+    count = min(classes - 1, max(1, round(coupling * 6)))
+    others = [j for j in range(classes) if j != index]
+    return sorted(rng.sample(others, count)) if others else []
+
+def _method_body(statements: list) -> str:
+    # Same layout as JavaParser's pretty printer (methodBody in the AST)
+    return "{\n" + "".join(f"    {statement}\n" for statement in statements) + "}"
+
+def generate_class(index: int, classes: int, methods_per_class: int, coupling: float, packages: int, seed: int):
+    """
+    Returns (relative path, java source, GenerateAST record) of class C<index>
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    name = f"C{index}"
+    package = f"bench.p{index % max(1, packages)}"
+    collaborators = _collaborators(index, classes, coupling, rng)
+
+    fields = [("int", "id"), ("String", "name")] + [(f"C{j}", f"c{j}") for j in collaborators]
+    methods = []
+
+    for field_type, field_name in fields[:2]:
+        capitalized = field_name[0].upper() + field_name[1:]
+        methods.append({"name": f"get{capitalized}", "returnType": field_type, "parameters": [],
+                        "methodCalls": [], "methodLocalVariables": [], "methodFieldAccess": [],
+                        "methodBody": _method_body([f"return {field_name};"]),
+                        "signature": f"public {field_type} get{capitalized}()"})
+        methods.append({"name": f"set{capitalized}", "returnType": "void", "parameters": [field_type],
+                        "methodCalls": [], "methodLocalVariables": [], "methodFieldAccess": [f"this.{field_name}"],
+                        "methodBody": _method_body([f"this.{field_name} = value;"]),
+                        "signature": f"public void set{capitalized}({field_type} value)"})
+
+    for m in range(methods_per_class):
+        statements, calls, accesses, local_vars = [f"int total = id + {m};"], [], [], [{"var_name": "total", "var_type": "int"}]
+        for j in collaborators:
+            if rng.random() < coupling:
+                target = rng.randrange(methods_per_class) if methods_per_class else 0
+                statements.append(f"total += c{j}.op{target}();")
+                calls.append(f"c{j}.op{target}")
+            if rng.random() < coupling / 2:
+                statements.append(f"c{j}.setName(c{j}.getName() + name);")
+                calls.extend([f"c{j}.setName", f"c{j}.getName"])
+        if rng.random() < 0.3:
+            statements.append("System.out.println(total);")
+            calls.append("System.out.println")
+        statements.append("return total;")
+        methods.append({"name": f"op{m}", "returnType": "int", "parameters": [],
+                        "methodCalls": calls, "methodLocalVariables": local_vars, "methodFieldAccess": accesses,
+                        "methodBody": _method_body(statements),
+                        "signature": f"public int op{m}()"})
+
+    lines = [f"package {package};", ""]
+    imports = sorted({f"bench.p{j % max(1, packages)}.C{j}" for j in collaborators
+                      if j % max(1, packages) != index % max(1, packages)})
+    lines += [f"import {imported};" for imported in imports]
+    if imports:
+        lines.append("")
+    begin_line = len(lines) + 1
+    lines.append(f"public class {name} {{")
+    lines += [f"    private {field_type} {field_name};" for field_type, field_name in fields]
+    for method in methods:
+        lines.append("")
+        body_lines = method["methodBody"].splitlines()
+        lines.append(f"    {method['signature']} {body_lines[0]}")
+        lines += [f"    {line}" for line in body_lines[1:]]
+    lines.append("}")
+    source = "\n".join(lines) + "\n"
+
+    record = {
+        "package": package,
+        "classes": [{
+            "class": name,
+            "beginLine": begin_line,
+            "endLine": len(lines),
+            "methods": [{k: v for k, v in method.items() if k != "signature"} for method in methods],
+            "classFields": [{"var_type": field_type, "var_name": field_name} for field_type, field_name in fields],
+        }],
+    }
+    rel_path = os.path.join(*package.split("."), f"{name}.java")
+    return rel_path, source, record
+
+def generate_project(out_dir: str, classes: int, methods_per_class: int = 8, coupling: float = 0.3,
+                     packages: int = 10, seed: int = 0) -> dict:
+    """
+    Write the java sources under out_dir/src and their AST records to out_dir/ast.jsonl.
+    Returns counts of the generated project.
+    """
+    src_dir = os.path.join(out_dir, "src")
+    method_count = 0
+    with open(os.path.join(out_dir, "ast.jsonl"), "w", encoding="utf-8") as ast_file:
+        for index in range(classes):
+            rel_path, source, record = generate_class(index, classes, methods_per_class, coupling, packages, seed)
+            path = os.path.join(src_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as java_file:
+                java_file.write(source)
+            ast_file.write(json.dumps({"path": os.path.abspath(path), **record}) + "\n")
+            method_count += len(record["classes"][0]["methods"])
+    return {"classes": classes, "methods": method_count, "src_dir": src_dir}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic java project for the benchmarks")
+    parser.add_argument("out_dir")
+    parser.add_argument("--classes", type=int, default=100)
+    parser.add_argument("--methods-per-class", type=int, default=8)
+    parser.add_argument("--coupling", type=float, default=0.3)
+    parser.add_argument("--packages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    counts = generate_project(args.out_dir, args.classes, args.methods_per_class, args.coupling, args.packages, args.seed)
+    print(f"Generated {counts['classes']} classes / {counts['methods']} methods under {counts['src_dir']}")
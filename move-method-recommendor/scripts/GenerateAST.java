@@ -4,6 +4,7 @@
  *      https://github.com/javaparser/javaparser/releases?
  * Compile this java file from the root : javac -cp "libs/gson-2.10.1.jar:libs/javaparser-core-3.25.4.jar" -d test_out scripts/GenerateAST.java
  * Run : java -cp "test_out:libs/gson-2.10.1.jar:libs/javaparser-core-3.25.4.jar" scripts/GenerateAST java/AssignmentServiceImpl.java
+ * Batch : java -cp "test_out:libs/gson-2.10.1.jar:libs/javaparser-core-3.25.4.jar" scripts/GenerateAST --batch [--threads N] [files...]  (paths from stdin if none given)
  */
 
 package scripts;
@@ -17,6 +18,8 @@ import com.google.gson.*;
 
 import java.io.*;
 import java.util.*;
+import java.util.concurrent.*;
+import java.util.function.Consumer;
 
 /* References
  * https://www.baeldung.com/javaparser
@@ -24,14 +27,107 @@ import java.util.*;
  */
 public class GenerateAST {
 
-    public static void main(String[] args) throws IOException{
+    // One parser per thread : batch mode may parse several files at once
+    private static final ThreadLocal<JavaParser> PARSER = ThreadLocal.withInitial(JavaParser::new);
+
+    public static void main(String[] args) throws IOException, InterruptedException{
+        if(args.length >= 1 && args[0].equals("--batch")){
+            int threads = 1;
+            int firstPath = 1;
+            if(args.length >= 3 && args[1].equals("--threads")){
+                threads = Math.max(1, Integer.parseInt(args[2]));
+                firstPath = 3;
+            }
+            runBatch(Arrays.copyOfRange(args, firstPath, args.length), threads);
+            return;
+        }
         if(args.length != 1){
-            System.err.println("Expected usage is : java GenerateAST <JavaCode_FilePath>'");
+            System.err.println("Expected usage is : java GenerateAST <JavaCode_FilePath> | --batch [--threads N] [<JavaCode_FilePath> ...]'");
             return;
         }
 
+        Gson gson = new GsonBuilder().disableHtmlEscaping().setPrettyPrinting().create();
+        System.out.println(gson.toJson(generate(new File(args[0]))));
+    }
+
+    /*
+     * Batch mode : keeps a single JVM (and the loaded JavaParser classes) alive for many files.
+     * Paths are taken from the arguments, or read line by line from stdin when no argument is given.
+     * One compact JSON record is written per line and flushed, so the caller can feed paths one at a time.
+     * With threads > 1 files are parsed by a pool of that size and records are written as soon as they are
+     * ready, i.e. not necessarily in input order. Every record carries its "path" and its request "index" (0 for
+     * the first path read, 1 for the next one, ...), which callers match replies with.
+     */
+    private static void runBatch(String[] paths, int threads) throws IOException, InterruptedException{
+        Gson gson = new GsonBuilder().disableHtmlEscaping().create();
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), false, "UTF-8");
+
+        ExecutorService pool = threads > 1 ? Executors.newFixedThreadPool(threads) : null;
+        long[] requests = {0};
+        Consumer<String> submit = path -> {
+            long index = requests[0]++;
+            if(pool == null){
+                writeRecord(out, gson, path, index);
+            }
+            else{
+                pool.execute(() -> writeRecord(out, gson, path, index));
+            }
+        };
+
+        if(paths.length > 0){
+            for(String path : paths){
+                submit.accept(path);
+            }
+        }
+        else{
+            BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+            String line;
+            while((line = in.readLine()) != null){
+                line = line.trim();
+                if(!line.isEmpty()){
+                    submit.accept(line);
+                }
+            }
+        }
+
+        // stdin closed : finish the files still being parsed before exiting
+        if(pool != null){
+            pool.shutdown();
+            pool.awaitTermination(Long.MAX_VALUE, TimeUnit.DAYS);
+        }
+    }
+
+    private static void writeRecord(PrintStream out, Gson gson, String path, long index){
+        String json;
+        try{
+            Map<String, Object> record = new LinkedHashMap<>();
+            record.put("path", path);
+            record.put("index", index);
+            record.putAll(generate(new File(path)));
+            json = gson.toJson(record);
+        }
+        // A file that fails to parse must not stop the whole batch, and every path must get exactly one record (the
+        // Python side waits for it) : any Throwable, OutOfMemoryError included, is reported in the file's own record
+        catch(Throwable e){
+            Map<String, Object> record = new LinkedHashMap<>();
+            record.put("path", path);
+            record.put("index", index);
+            record.put("error", e.getClass().getSimpleName() + ": " + e.getMessage());
+            json = gson.toJson(record);
+        }
+        synchronized(out){
+            out.println(json);
+            out.flush();
+        }
+    }
+
+    /* Parses a single java file and returns its package and class/method info */
+    private static Map<String, Object> generate(File javaFile) throws IOException{
         //Parsing Source Files -> provide a source code and generate a compilationUnit as result
-        CompilationUnit parsed = StaticJavaParser.parse(new File(args[0]));
+        ParseResult<CompilationUnit> result = PARSER.get().parse(javaFile);
+        CompilationUnit parsed = result.getResult()
+                                       .filter(cu -> result.isSuccessful())
+                                       .orElseThrow(() -> new ParseProblemException(result.getProblems()));
 
         // Visitor Design Pattern is used to visit the parsed objects contents
         ClassVisitor visitor = new ClassVisitor();
@@ -40,9 +136,7 @@ public class GenerateAST {
         Map<String, Object> output = new LinkedHashMap<>();
         output.put("package", parsed.getPackageDeclaration().map(pd -> pd.getName().toString()).orElse(""));
         output.put("classes", visitor.getClasses());
-
-        Gson gson = new GsonBuilder().disableHtmlEscaping().setPrettyPrinting().create();
-        System.out.println(gson.toJson(output));
+        return output;
     }
 
     private static class ClassVisitor extends VoidVisitorAdapter<Void>{
@@ -60,6 +154,11 @@ public class GenerateAST {
             Map<String, Object> classInfo = new LinkedHashMap<>();
             classInfo.put("class", cid.getNameAsString());
 
+            // Lines of the class in its file, so the summarizer can send only this class's source
+            cid.getRange().ifPresent(range -> {
+                classInfo.put("beginLine", range.begin.line);
+                classInfo.put("endLine", range.end.line);
+            });
 
             List<Map<String, Object>> methods = new ArrayList<>();
 
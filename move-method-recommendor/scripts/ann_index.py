@@ -0,0 +1,107 @@
+import numpy as np
+
+"""
+    Approximate nearest neighbour search over class vectors, in NumPy (no external service or library).
+
+    IVFIndex is an inverted file index: the vectors are clustered with spherical k-means into `lists` lists, and a
+    query only compares itself with the vectors of the `probes` lists whose centroids are closest. Scores are inner
+    products, so with unit (or scaled unit) vectors they are cosine similarities. With probes >= lists the search is
+    exact.
+
+    refactor_recommendation.py (--candidates ann) indexes [summary | code] class vectors and queries with
+    0.5 * [summary | code] method vectors: the inner product is then exactly the 0.50 / 0.50 semantic part of
+    the candidate score.
+"""
+
+def kmeans_lists(vectors: np.ndarray, lists: int, iterations: int = 10, seed: int = 0):
+    """
+    Spherical k-means: returns (unit centroids, list number of every vector). Seeded, so the same vectors always
+    give the same index (sharded or parallel runs build identical indexes).
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].astype(np.float32)
+    assignment = np.zeros(len(vectors), dtype=np.intp)
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # An empty list takes a random vector again rather than disappearing
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        norms[empty] = np.linalg.norm(sums[empty], axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids, assignment
+
+class IVFIndex:
+    def __init__(self, vectors: np.ndarray, lists: int = None, iterations: int = 10, seed: int = 0):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        count = len(self.vectors)
+        # sqrt(n) lists of about sqrt(n) vectors each
+        self.lists = max(1, min(count, lists or int(round(np.sqrt(count)))))
+        self._set_lists(*kmeans_lists(self.vectors, self.lists, iterations, seed))
+
+    @classmethod
+    def from_lists(cls, vectors: np.ndarray, centroids: np.ndarray, assignment: np.ndarray):
+        """
+        The index built earlier over the same vectors, from its `centroids` and `assignment` (no k-means): lets
+        worker processes share the index of their parent.
+        """
+        index = cls.__new__(cls)
+        index.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        index.lists = len(centroids)
+        index._set_lists(np.asarray(centroids, dtype=np.float32), np.asarray(assignment, dtype=np.intp))
+        return index
+
+    def _set_lists(self, centroids: np.ndarray, assignment: np.ndarray):
+        self.centroids = centroids
+        self.assignment = assignment
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(self.lists + 1))
+        self.members = [order[bounds[i]:bounds[i + 1]] for i in range(self.lists)]
+
+    def search(self, queries: np.ndarray, k: int, probes: int = 16) -> list:
+        """
+        Rows of the (up to) k vectors with the highest inner product with each query, best first.
+        Returns one array per query.
+
+        Vectorized per list: the queries probing a list are scored against its vectors with one matrix product, and
+        only the pairs that can make a query's top k are kept and sorted, so the work and memory follow the probed
+        lists rather than the whole index. Ties go to the lowest row.
+        """
+        probes = max(1, min(probes, self.lists))
+        k = max(1, min(k, len(self.vectors)))
+        centroid_scores = queries @ self.centroids.T
+        if probes < self.lists:
+            probed = np.argpartition(-centroid_scores, probes - 1, axis=1)[:, :probes]
+        else:
+            probed = np.broadcast_to(np.arange(self.lists), centroid_scores.shape)
+        probed_lists = np.zeros((len(queries), self.lists), dtype=bool)
+        probed_lists[np.arange(len(queries))[:, None], probed] = True
+
+        # (query, vector row, score) of the pairs that can make a query's top k: per list, the vectors scoring at
+        # least the query's k-th best score in that list (ties included, so the lowest rows can win them below)
+        pair_queries, pair_rows, pair_scores = [], [], []
+        for i, members in enumerate(self.members):
+            rows = np.flatnonzero(probed_lists[:, i])
+            if not len(rows) or not len(members):
+                continue
+            scores = queries[rows] @ self.vectors[members].T
+            if len(members) > k:
+                kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+                query_at, member_at = np.nonzero(scores >= kth)
+            else:
+                query_at, member_at = np.divmod(np.arange(scores.size), len(members))
+            pair_queries.append(rows[query_at])
+            pair_rows.append(members[member_at])
+            pair_scores.append(scores[query_at, member_at])
+        if not pair_queries:
+            return [np.empty(0, dtype=np.intp) for _ in range(len(queries))]
+        pair_queries, pair_rows, pair_scores = (np.concatenate(parts) for parts in (pair_queries, pair_rows, pair_scores))
+
+        # Per query, best score first, then lowest row; the first k pairs of each query are its results
+        order = np.lexsort((pair_rows, -pair_scores, pair_queries))
+        pair_queries, pair_rows = pair_queries[order], pair_rows[order]
+        bounds = np.searchsorted(pair_queries, np.arange(len(queries) + 1))
+        return [pair_rows[bounds[q]:min(bounds[q] + k, bounds[q + 1])] for q in range(len(queries))]
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:     # Windows: saves are not serialized between processes
+    fcntl = None
+
+"""
+    On-disk store of embedding vectors, reused across refactor_recommendation.py runs (and by the recommender daemon,
+    possibly at the same time).
+
+    <directory>/<space>.index.json     {"version": 2, "generation": g, "vectors": "<space>.<g>.npy", "dim": d,
+                                         "keys": [...]}, row i of the vectors file holds the vector of keys[i]
+    <directory>/<space>.<g>.npy        float16 matrix, opened memory-mapped (no copy on load)
+    <directory>/<space>.lock           held while saving
+
+    A key is (class, method, content hash, model name), so a vector is only reused for the exact text and model
+    that produced it; changed summaries or code get a new row.
+
+    A save writes a new vectors file and then swaps in the index naming it with a single os.replace: a reader
+    sees either the old or the new (index, vectors) pair, never a mix. A store whose index and vectors disagree
+    raises EmbeddingStoreError instead of being treated as empty (a later save would drop every stored vector).
+    Old vectors files (and the version 1 <space>.npy) are removed once no index names them.
+
+    Saves are serialized by the lock and merge with what other processes saved meanwhile. Stale rows are dropped
+    by `compact` (only the vectors looked up this run are kept) or, past `max_rows`, least recently added unused
+    rows first.
+"""
+
+STORE_VERSION = 2
+DEFAULT_MAX_ROWS = 1_000_000        # about 770 MB of 384-dim float16 vectors per space
+
+class EmbeddingStoreError(ValueError):
+    pass
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+def store_key(class_name: str, method_name: str, text: str, model_name: str) -> str:
+    return "\x1f".join((class_name, method_name or "", content_hash(text), model_name))
+
+class EmbeddingStore:
+    """
+    Vector store for one embedding space (e.g. "summary" or "code").
+    Vectors added during a run are kept in memory until `save` writes a new vectors file and swaps in its index.
+    """
+    def __init__(self, directory: str, space: str, max_rows: int = DEFAULT_MAX_ROWS):
+        self.directory = directory
+        self.space = space
+        self.max_rows = max_rows
+        self.index_path = os.path.join(directory, f"{space}.index.json")
+        self.lock_path = os.path.join(directory, f"{space}.lock")
+
+        self.dim = None
+        self.generation = 0
+        self._keys = []
+        self._rows = {}
+        self._vectors = None        # memory-mapped rows already on disk
+        self._pending = []          # arrays added since the last save
+        self._pending_count = 0
+        self._used = set()          # keys looked up since the last save
+        self.reused = 0             # vectors served from the store this run
+        self.encoded = 0            # vectors that had to be computed this run
+        self.dropped = 0            # rows removed by compaction or max_rows this run
+
+        index, vectors = self._read()
+        if index is not None:
+            self._load(index, vectors)
+
+    def _read(self):
+        """
+        (index, memory-mapped vectors) on disk, (None, None) for a new store. A save by another process can remove
+        the vectors file between reading the index and opening it: the index is read again then.
+        """
+        for attempt in range(5):
+            if not os.path.exists(self.index_path):
+                return None, None
+            with open(self.index_path, encoding="utf-8") as file:
+                index = json.load(file)
+            vectors_path = os.path.join(self.directory, index.get("vectors", f"{self.space}.npy"))
+            try:
+                vectors = np.load(vectors_path, mmap_mode="r")
+            except FileNotFoundError:
+                time.sleep(0.05 * (attempt + 1))
+                continue
+            if len(index["keys"]) != len(vectors):
+                raise EmbeddingStoreError(f"{self.index_path} names {len(index['keys'])} vectors but {vectors_path} "
+                                          f"holds {len(vectors)}: the store is damaged, remove {self.directory} "
+                                          f"(or use another --embedding-store) to start over")
+            return index, vectors
+        raise EmbeddingStoreError(f"{self.index_path} names a vectors file that does not exist")
+
+    def _load(self, index: dict, vectors):
+        self.dim = index["dim"]
+        self.generation = index.get("generation", 0)
+        self._keys = list(index["keys"])
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        self._vectors = vectors
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def disk_rows(self) -> int:
+        return 0 if self._vectors is None else len(self._vectors)
+
+    def lookup(self, keys) -> np.ndarray:
+        """
+        Row of each key, -1 when the key has no vector yet
+        """
+        self._used.update(keys)
+        return np.array([self._rows.get(key, -1) for key in keys], dtype=np.int64)
+
+    def add(self, keys, matrix: np.ndarray):
+        if len(keys) == 0:
+            return
+        matrix = np.asarray(matrix, dtype=np.float16)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"{self.space} store holds {self.dim}-dim vectors, got {matrix.shape[1]}")
+
+        for key in keys:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+        self._pending.append(matrix)
+        self._pending_count += len(keys)
+
+    def take(self, rows) -> np.ndarray:
+        """
+        Gather rows (from disk or added this run) into a contiguous float32 matrix
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self.dim or 0), dtype=np.float32)
+        on_disk = rows < self.disk_rows
+        if on_disk.any():
+            out[on_disk] = self._vectors[rows[on_disk]]
+        if (~on_disk).any():
+            pending = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+            self._pending = [pending]
+            out[~on_disk] = pending[rows[~on_disk] - self.disk_rows]
+        return out
+
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(self.lock_path, "a")
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def save(self, compact: bool = False):
+        """
+        Write the vectors added this run into the store. Under the lock, the store as last saved (by this or another
+        process) is read again, so vectors saved meanwhile by another process are kept. With `compact`, only the
+        vectors looked up since the last save are kept; otherwise rows past max_rows are dropped, least recently
+        added first among the ones not looked up.
+        """
+        if not self._pending_count and not compact and (not self.max_rows or len(self._keys) <= self.max_rows):
+            self._used = set()
+            return
+
+        pending_keys = self._keys[self.disk_rows:]
+        pending = (np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]) if self._pending \
+            else np.empty((0, self.dim or 0), dtype=np.float16)
+
+        with self._locked():
+            index, vectors = self._read()
+            base_keys = list(index["keys"]) if index is not None else []
+            generation = index.get("generation", 0) if index is not None else 0
+            dim = index["dim"] if index is not None else self.dim
+            if self._pending_count and dim != self.dim:
+                raise EmbeddingStoreError(f"{self.index_path} holds {dim}-dim vectors, this run added {self.dim}-dim ones")
+
+            base_set = set(base_keys)
+            new_rows = [i for i, key in enumerate(pending_keys) if key not in base_set]
+            keep = list(range(len(base_keys)))
+            if compact:
+                keep = [row for row in keep if base_keys[row] in self._used]
+            elif self.max_rows and len(keep) + len(new_rows) > self.max_rows:
+                excess = len(keep) + len(new_rows) - self.max_rows
+                unused = {row for row in keep if base_keys[row] not in self._used}
+                dropped = set(sorted(unused)[:excess])
+                keep = [row for row in keep if row not in dropped]
+            self.dropped += len(base_keys) - len(keep)
+
+            keys = [base_keys[row] for row in keep] + [pending_keys[i] for i in new_rows]
+            if not keys and index is None:
+                self._used = set()
+                return
+            name = f"{self.space}.{generation + 1}.npy"
+            tmp_vectors = os.path.join(self.directory, name + ".tmp.npy")
+            out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float16, shape=(len(keys), dim))
+            chunk = 65536
+            for start in range(0, len(keep), chunk):
+                rows = np.asarray(keep[start:start + chunk], dtype=np.int64)
+                out[start:start + len(rows)] = vectors[rows]
+            if new_rows:
+                out[len(keep):] = pending[new_rows]
+            out.flush()
+            del out
+            os.replace(tmp_vectors, os.path.join(self.directory, name))
+
+            tmp_index = self.index_path + ".tmp"
+            with open(tmp_index, "w", encoding="utf-8") as file:
+                json.dump({"version": STORE_VERSION, "generation": generation + 1, "vectors": name, "dim": dim,
+                           "keys": keys}, file)
+                file.flush()
+                os.fsync(file.fileno())
+            # The single swap: readers see the previous pair or this one
+            os.replace(tmp_index, self.index_path)
+
+            for file_name in os.listdir(self.directory):
+                if (file_name.startswith(f"{self.space}.") and file_name.endswith(".npy") and file_name != name
+                        and not file_name.endswith(".tmp.npy")):
+                    try:
+                        os.remove(os.path.join(self.directory, file_name))
+                    except OSError:     # still mapped by a reader on Windows: removed by a later save
+                        pass
+
+            index, vectors = self._read()
+        self._load(index, vectors)
+        self._pending = []
+        self._pending_count = 0
+        self._used = set()
+
+class MemoryEmbeddingStore:
+    """
+    EmbeddingStore interface kept in memory, in float32 and never written: lets a long running process (the
+    recommender daemon without --embedding-store) reuse the vectors of unchanged texts between reloads.
+    `retain` drops the vectors not looked up since the previous call, so only the current version is held.
+    """
+    def __init__(self, space: str):
+        self.space = space
+        self.dim = None
+        self._keys = []
+        self._rows = {}
+        self._matrix = None
+        self._used = set()
+        self.reused = 0
+        self.encoded = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, keys) -> np.ndarray:
+        self._used.update(keys)
+        return np.array([self._rows.get(key, -1) for key in keys], dtype=np.int64)
+
+    def add(self, keys, matrix: np.ndarray):
+        if len(keys) == 0:
+            return
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.dim = self.dim or matrix.shape[1]
+        for key in keys:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+        self._matrix = matrix if self._matrix is None else np.concatenate([self._matrix, matrix])
+
+    def take(self, rows) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((len(rows), self.dim or 0), dtype=np.float32)
+        return self._matrix[np.asarray(rows, dtype=np.int64)]
+
+    def retain(self):
+        keep = [key for key in self._keys if key in self._used]
+        if len(keep) != len(self._keys):
+            rows = np.array([self._rows[key] for key in keep], dtype=np.int64)
+            self._matrix = self._matrix[rows] if self._matrix is not None else None
+            self._keys = keep
+            self._rows = {key: row for row, key in enumerate(keep)}
+        self._used = set()
+
+    def save(self):
+        pass
@@ -1,11 +1,27 @@
+import argparse
+import atexit
+import hashlib
+import queue
 import subprocess
 import os
 import sys
 import json
+import threading
+from tabulate import tabulate
+
+from method_rules import is_interface, rule_action
+from metrics import METRICS, enable_profiling
+from ollama_client import DEFAULT_OLLAMA_HOST, OllamaClient, StructuredJob, SummaryEngine
+from prompt_builder import (MAX_CLASSES_PER_GROUP, RESPONSE_TOKENS, PromptBuilder, class_source, model_context_tokens,
+                            parse_structured_response, used_classes)
+from summary_cache import SummaryCache
+from summary_records import SUMMARIES_JSONL, SummaryRecordWriter
 
 def get_java_files(java_dir: str):
-    for root, _, files in os.walk(java_dir):
-        for file in files:
+    # Sorted walk so the summaries come out in the same order on every machine
+    for root, dirs, files in os.walk(java_dir):
+        dirs.sort()
+        for file in sorted(files):
             if file.endswith(".java"):
                 yield os.path.join(root, file)
 
@@ -13,43 +29,226 @@ def read_java_file(java_file_path: str) -> str:
     with open(java_file_path, 'r', encoding="utf-8") as file:
         return file.read()
     
-def run_ast_generator(java_file_path: str) -> dict:
-
+def ast_generator_cmd(*args: str) -> list:
+    """
+    Build the java command line for scripts.GenerateAST (compiled under test_out, see GenerateAST.java)
+    """
     root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
-    cmd = ["java",
-           "-cp",
-           f"{root}/test_out:{root}/libs/gson-2.10.1.jar:{root}/libs/javaparser-core-3.25.4.jar",
-           "scripts.GenerateAST",
-           java_file_path
-           ]
-    
-    java_process = subprocess.run(cmd, capture_output=True, text=True)
-    
-    if java_process.returncode != 0:
-        print(f"[AST Error] {java_file_path}:\n {java_process.stderr}", file=sys.stderr)
-        return {}
-    return json.loads(java_process.stdout)
+    return ["java",
+            "-cp",
+            f"{root}/test_out:{root}/libs/gson-2.10.1.jar:{root}/libs/javaparser-core-3.25.4.jar",
+            "scripts.GenerateAST",
+            *args
+            ]
+
+AST_RECORD_TIMEOUT = 300.0     # seconds without any record from the JVM before giving up on it
+
+class ASTServer:
+    """
+    Keeps a single `GenerateAST --batch` JVM alive and feeds it java file paths over stdin.
+    Each path gets back exactly one JSON line, so JVM startup and JavaParser class loading are paid once per run
+    instead of once per file. With threads > 1 the JVM parses that many files at once (see parse_many).
+    A JVM that stops answering for `record_timeout` seconds is treated as dead.
+    """
+    def __init__(self, threads: int = 1, record_timeout: float = AST_RECORD_TIMEOUT):
+        self.threads = threads
+        self.record_timeout = record_timeout
+        self._process = None
+        self._requests = 0          # paths sent to the current JVM, i.e. the index of the next request
+
+    def start(self):
+        if self._process is None or self._process.poll() is not None:
+            args = ["--batch"] + (["--threads", str(self.threads)] if self.threads > 1 else [])
+            self._requests = 0
+            self._process = subprocess.Popen(ast_generator_cmd(*args),
+                                             stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE,
+                                             text=True,
+                                             encoding="utf-8",
+                                             bufsize=1)
+        return self
+
+    @staticmethod
+    def _ast_from_record(java_file_path: str, record: dict) -> dict:
+        METRICS.count("ast.files")
+        if "error" in record:
+            METRICS.count("ast.errors")
+            print(f"[AST Error] {java_file_path}:\n {record['error']}", file=sys.stderr)
+            return {}
+        record.pop("path", None)
+        return record
+
+    @staticmethod
+    def _request_path(java_file_path: str):
+        """
+        Absolute path sent to the JVM, None when it would not come back as sent (GenerateAST reads one path per
+        line and trims it)
+        """
+        abs_path = os.path.abspath(java_file_path)
+        if abs_path != abs_path.strip() or "\n" in abs_path or "\r" in abs_path:
+            return None
+        return abs_path
+
+    def _unsendable(self, java_file_path: str) -> dict:
+        return self._ast_from_record(java_file_path, {"error": "path has leading/trailing whitespace or a line "
+                                                               "break, it cannot be sent to the AST server"})
+
+    def parse(self, java_file_path: str) -> dict:
+        abs_path = self._request_path(java_file_path)
+        if abs_path is None:
+            return self._unsendable(java_file_path)
+        self.start()
+        index = self._requests
+        self._requests += 1
+        try:
+            with METRICS.timer("ast.parse"):
+                self._process.stdin.write(abs_path + "\n")
+                self._process.stdin.flush()
+                line = self._process.stdout.readline()
+        except (BrokenPipeError, OSError):
+            line = ""
+
+        record = json.loads(line) if line else None
+        if record is None or record.get("index") != index:
+            # The JVM died (crash, OOM, ...) or answered another request : drop it so the next file starts a
+            # fresh one
+            self.close(kill=record is not None)
+            print(f"[AST Error] {java_file_path}:\n AST server exited unexpectedly", file=sys.stderr)
+            return {}
+
+        return self._ast_from_record(java_file_path, record)
+
+    def parse_many(self, java_file_paths, read_ahead: int = 256):
+        """
+        Parse many files with the JVM's parser pool. Yields (path, ast) in input order, each one as soon as it and
+        all the files before it are parsed, so the caller can start working before the whole tree is parsed.
+        Out-of-order records (threads > 1) are held back until their turn, matched by their request index: the
+        output does not depend on the thread count. At most `read_ahead` parsed files wait in memory for the caller.
+        """
+        paths = list(java_file_paths)
+        if not paths:
+            return
+        self.start()
+        process = self._process
+        # Request index of every path (GenerateAST numbers the paths it reads), None for paths that cannot be sent
+        requests, sent = [], []
+        for path in paths:
+            abs_path = self._request_path(path)
+            requests.append(None if abs_path is None else self._requests + len(sent))
+            if abs_path is not None:
+                sent.append(abs_path)
+        self._requests += len(sent)
+
+        def feed():
+            try:
+                for abs_path in sent:
+                    process.stdin.write(abs_path + "\n")
+                process.stdin.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                pass
+
+        records = queue.Queue(maxsize=read_ahead)
+
+        def drain():
+            for _ in sent:
+                line = process.stdout.readline()
+                records.put(json.loads(line) if line else None)
+                if not line:
+                    return
+
+        drainer = threading.Thread(target=drain, daemon=True)
+        threading.Thread(target=feed, daemon=True).start()
+        drainer.start()
+
+        def next_record():
+            # A record the JVM never writes (a parser thread lost to an uncaught error) must not block the run
+            # forever: give up once the JVM has exited or has been silent for record_timeout seconds
+            interval = min(1.0, self.record_timeout)
+            waited = 0.0
+            while True:
+                try:
+                    return records.get(timeout=interval)
+                except queue.Empty:
+                    waited += interval
+                    if process.poll() is not None and not drainer.is_alive() and records.empty():
+                        raise EOFError("AST server exited unexpectedly")
+                    if waited >= self.record_timeout:
+                        raise EOFError(f"AST server sent nothing for {self.record_timeout:g}s")
+
+        ready = {}
+        finished = False
+        try:
+            for path, index in zip(paths, requests):
+                if index is None:
+                    yield path, self._unsendable(path)
+                    continue
+                # Time the caller spends waiting on the JVM (parsing is slower than consuming)
+                with METRICS.timer("ast.wait"):
+                    while index not in ready:
+                        record = next_record()
+                        if record is None:
+                            raise EOFError("AST server exited unexpectedly")
+                        ready[record.get("index")] = record
+                yield path, self._ast_from_record(path, ready.pop(index))
+            finished = True
+        except EOFError as error:
+            print(f"[AST Error] {error}, {len(paths)} files were not all parsed", file=sys.stderr)
+        finally:
+            if not finished:
+                # Records still owed by the JVM would desynchronize the next request : start over with a new one
+                self.close(kill=True)
+
+    def close(self, kill: bool = False):
+        if self._process is None:
+            return
+        try:
+            if kill:
+                self._process.kill()
+            else:
+                self._process.stdin.close()
+            self._process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+_ast_server = ASTServer()
+atexit.register(_ast_server.close)
+
+def run_ast_generator(java_file_path: str) -> dict:
+    return _ast_server.parse(java_file_path)
 
-def get_summary_with_ollama(llm_model_name: str, llm_prompt: str) -> str:
+def iter_java_asts(java_files):
+    """
+    (java_file, ast) for each file, in input order, parsed in parallel by the AST server
+    """
+    return _ast_server.parse_many(java_files)
 
-    cmd = ["ollama", "run", llm_model_name]
+_ollama_client = OllamaClient()
 
-    llm_process = subprocess.run(cmd, input=llm_prompt.encode("utf-8"), capture_output=True, check = True)
+def get_summary_with_ollama(llm_model_name: str, llm_prompt: str, client: OllamaClient = None) -> str:
 
-    return llm_process.stdout.decode("utf-8").strip()
+    client = client or _ollama_client
 
+    return client.generate(llm_model_name, llm_prompt).strip()
 
-def get_class_summary(llm_model_name: str, pkg_name: str, cls_name: str, methods_meta: list, code: str) -> dict:
+
+def build_class_prompt(pkg_name: str, cls_name: str, methods_meta: list, code: str) -> tuple:
+    """
+    Returns the class summarization prompt and the classes used by the class (fields, params, call targets)
+    """
     methods = ""
-    method_calls = set()
-    used_classes = set()
     cls_fields = methods_meta[0].get("classFields", []) if methods_meta else []
 
     fields = ""
     for f in cls_fields:
         fields += f"  - `{f['var_type']} {f['var_name']}`\n"
-        used_classes.add(f['var_type'])
 
     for method in methods_meta:
         method_name = method.get('name', '')
@@ -58,14 +257,6 @@ def get_class_summary(llm_model_name: str, pkg_name: str, cls_name: str, methods
         param_str = ", ".join(params)
         methods += f"- `{return_type} {method_name}({param_str})`\n"
 
-        for call in method.get('methodCalls', []):
-            if "." in call:
-                prefix = call.split(".")[0]
-                used_classes.add(prefix)  #  the prefix is an object of another class
-
-        for param in params:
-            used_classes.add(param)
-
     # Construct LLM prompt
     # Build a comma-separated list of method names
     method_list = ", ".join(m.get("name", "") for m in methods_meta) or "None"
@@ -102,15 +293,21 @@ def get_class_summary(llm_model_name: str, pkg_name: str, cls_name: str, methods
                         - Keep it concise and human-readable (2–4 sentences).
                         """.strip()
 
+    # Call prefixes are objects of other classes
+    return llm_prompt, used_classes(cls_name, methods_meta, cls_fields)
+
+def get_class_summary(llm_model_name: str, pkg_name: str, cls_name: str, methods_meta: list, code: str) -> dict:
+    llm_prompt, uses_classes = build_class_prompt(pkg_name, cls_name, methods_meta, code)
+
     # LLM response (summary text)
     summary_text = get_summary_with_ollama(llm_model_name, llm_prompt)
 
     return {
         "summary": summary_text.strip(),
-        "uses_classes": sorted(used_classes - {cls_name})  
+        "uses_classes": uses_classes
     }
 
-def get_method_summary(llm_model_name: str, pkg_name: str, class_summary:str, method: dict, code: str) -> str:
+def build_method_prompt(pkg_name: str, method: dict) -> str:
     method_name = method.get("name", "")
     param_list = ", ".join(method.get("parameters", []))
     return_type = method.get("returnType", "void")
@@ -151,67 +348,378 @@ def get_method_summary(llm_model_name: str, pkg_name: str, class_summary:str, me
 
                     Output format: A single sentence starting with a verb.
                 """.strip()
-    
-    return get_summary_with_ollama(llm_model_name, llm_prompt)
-
-if __name__ == "__main__":
 
-    # Define the llm model used for summarization of java code + ast
-    llm_model_name = "codellama:13b"
-
-    # Specify the directory containing the java codes to be refactored
-    java_dir = input("Enter path to folder containing Java files: ").strip()
-    if not os.path.isdir(java_dir):
-        print(f"Not a valid directory: {java_dir}",file=sys.stderr)
-        sys.exit(1)
-
-    summaries = {}
-
-    for java_file in get_java_files(java_dir):
-        code = read_java_file(java_file)
-        ast = run_ast_generator(java_file)
-
-        print(ast)
+    return llm_prompt
 
+def get_method_summary(llm_model_name: str, pkg_name: str, class_summary:str, method: dict, code: str) -> str:
+    return get_summary_with_ollama(llm_model_name, build_method_prompt(pkg_name, method))
+
+def file_sha256(java_file_path: str) -> str:
+    return hashlib.sha256(read_java_file(java_file_path).encode("utf-8")).hexdigest()
+
+def changed_files_from_git(java_dir: str, revision: str) -> set:
+    """
+    java files (relative to java_dir) that differ from `revision` in git: committed, staged or unstaged changes
+    and untracked files
+    """
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=java_dir, capture_output=True, text=True, check=True)
+        return [line for line in result.stdout.splitlines() if line.endswith(".java")]
+
+    # Paths printed relative to java_dir
+    changed = git("diff", "--name-only", "--relative", revision, "--", ".")
+    changed += git("ls-files", "--others", "--exclude-standard", "--", ".")
+    return {os.path.normpath(path) for path in changed}
+
+def summary_settings(model: str, prompts: PromptBuilder = None, structured: bool = False,
+                     summarize_all: bool = False) -> dict:
+    """
+    Everything besides the source that decides a file's summaries, stored in its "done" record: a file summarized
+    with other settings is summarized again
+    """
+    return {"model": model, "prompt_style": "full" if prompts is None else "compact",
+            "prompt_budget": None if prompts is None else prompts.budget, "structured": structured,
+            "summarize_all": summarize_all}
+
+def plan_incremental_run(java_files, java_dir: str, completed_files: dict, git_changed=None,
+                         completed_settings: dict = None, settings: dict = None):
+    """
+    Compare the current java sources with the manifest of an earlier run (rel path -> sha256).
+    Returns (files to skip, files whose records are stale : changed, deleted or summarized with other settings).
+    With `git_changed` (see changed_files_from_git), files outside that set are trusted without hashing them.
+    With `settings` (see summary_settings), files whose completed_settings differ are stale too.
+    """
+    current = {os.path.relpath(java_file, java_dir): java_file for java_file in java_files}
+
+    skip, stale = set(), set()
+    for rel_path, sha256 in completed_files.items():
+        if rel_path not in current:
+            stale.add(rel_path)
+        elif settings is not None and (completed_settings or {}).get(rel_path) != settings:
+            stale.add(rel_path)
+        elif git_changed is not None and rel_path not in git_changed:
+            skip.add(rel_path)
+        elif file_sha256(current[rel_path]) == sha256:
+            skip.add(rel_path)
+        else:
+            stale.add(rel_path)
+    return skip, stale
+
+def iter_parsed_files(java_files, java_dir: str, completed_files=()):
+    """
+    (rel_path, sha256, code, package, classes) of every java file not in completed_files, parsed in parallel and
+    yielded in file order
+    """
+    to_parse = [java_file for java_file in java_files if os.path.relpath(java_file, java_dir) not in completed_files]
+
+    for java_file, ast in iter_java_asts(to_parse):
         if not ast:
             continue
 
-        package_name = ast.get("package","")
-        classes = ast.get("classes", [])
+        rel_path = os.path.relpath(java_file, java_dir)
+        code = read_java_file(java_file)
+
+        sha256 = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        yield rel_path, sha256, code, ast.get("package",""), ast.get("classes", [])
+
+def summarized_methods(code: str, methods_meta: list, skip_rules: bool = True) -> list:
+    """
+    (index, method) of the methods that need an LLM summary: with skip_rules, methods the structural rules decide
+    (method_rules.rule_action: interface methods, one-line delegates, getters / setters) are left out, the
+    recommender keeps them whatever their summary
+    """
+    in_interface = skip_rules and is_interface(code)
+    return [(mi, method) for mi, method in enumerate(methods_meta)
+            if not skip_rules or rule_action(method, method.get("name", ""), in_interface) is None]
+
+def iter_summary_jobs(java_files, java_dir: str, completed_files=(), prompts: PromptBuilder = None,
+                      skip_rules: bool = True):
+    """
+    Parses the java files (in parallel, results in file order) and yields (key, prompt) jobs for SummaryEngine.map,
+    per file:
+      - (("source", rel_path, (sha256, code)), None)
+      - (("class", cls_name, class_entry), class_prompt) once per class, followed by
+      - (("method", cls_name, method_meta), method_prompt) for each of its methods
+      - (("done", rel_path, sha256), None)
+    class_entry is the (not yet summarized) class record. Files listed in completed_files (relative paths, from
+    an earlier or interrupted run) are not parsed again.
+    With `prompts` (prompt_builder.PromptBuilder) the compact budgeted prompts are used instead of the original ones.
+    With skip_rules, methods decided by the structural rules get no prompt (summary None, see summarized_methods).
+    """
+    for rel_path, sha256, code, package_name, classes in iter_parsed_files(java_files, java_dir, completed_files):
+        yield ("source", rel_path, (sha256, code)), None
 
         for cls in classes:
             cls_name = cls.get("class", "UnknownClass")
             methods_meta = cls.get("methods", [])
-
-            class_summary_dict = get_class_summary(llm_model_name, package_name, cls_name, methods_meta, code)
-            print(f"Class {cls_name}: {class_summary_dict['summary']}")
-
-            summaries[cls_name] = {
-                "summary" : class_summary_dict["summary"],
-                "uses_classes": class_summary_dict["uses_classes"],
+            summarized = {mi for mi, _ in summarized_methods(code, methods_meta, skip_rules)}
+
+            if prompts is None:
+                class_prompt, uses_classes = build_class_prompt(package_name, cls_name, methods_meta, code)
+            else:
+                original = build_class_prompt(package_name, cls_name, methods_meta, code)[0] if prompts.report else None
+                class_prompt, uses_classes = prompts.class_prompt(package_name, cls_name, cls.get("classFields", []),
+                                                                  methods_meta, class_source(code, cls), original)
+            class_entry = {
+                "summary" : None,
+                "uses_classes": uses_classes,
                 "package" : package_name,
-                "classBody":code,
                 "classFields"  : cls.get("classFields", []),
-                "methods": {},
-                "methods_meta": []
             }
+            yield ("class", cls_name, class_entry), class_prompt
+
+            for mi, method in enumerate(methods_meta):
+                if mi not in summarized:
+                    yield ("method", cls_name, method), None
+                elif prompts is None:
+                    yield ("method", cls_name, method), build_method_prompt(package_name, method)
+                else:
+                    original = build_method_prompt(package_name, method) if prompts.report else None
+                    yield ("method", cls_name, method), prompts.method_prompt(package_name, cls_name, method, original)
+
+        yield ("done", rel_path, sha256), None
+
+def structured_item(rel_path: str, ci: int, code: str, package_name: str, cls: dict, skip_rules: bool = True) -> dict:
+    """
+    A class as prompt_builder.structured_prompt takes it: "methods" are the methods to summarize (at their
+    "method_indices" in the class), "rule_methods" the ones the structural rules decide
+    """
+    methods_meta = cls.get("methods", [])
+    summarized = summarized_methods(code, methods_meta, skip_rules)
+    indices = {mi for mi, _ in summarized}
+    return {"file": rel_path, "index": ci, "package": package_name, "class": cls.get("class", "UnknownClass"),
+            "classFields": cls.get("classFields", []), "methods": [method for _, method in summarized],
+            "method_indices": [mi for mi, _ in summarized],
+            "rule_methods": [method for mi, method in enumerate(methods_meta) if mi not in indices],
+            "source": class_source(code, cls)}
+
+def structured_job(files: list, prompts: PromptBuilder, skip_rules: bool = True) -> StructuredJob:
+    """
+    StructuredJob summarizing every class and method of the parsed files: one JSON request per class group, with
+    the single compact prompts as fallbacks. Entries are ("class", rel_path, class index) and
+    ("method", rel_path, class index, method index), so same-named classes or overloads never collide.
+    With skip_rules, methods decided by the structural rules are not asked for (no entry).
+    """
+    fallbacks, items = {}, []
+    for rel_path, sha256, code, package_name, classes in files:
+        for ci, cls in enumerate(classes):
+            item = structured_item(rel_path, ci, code, package_name, cls, skip_rules)
+            fallbacks[("class", rel_path, ci)] = prompts.class_prompt(package_name, item["class"], item["classFields"],
+                                                                      cls.get("methods", []), item["source"],
+                                                                      record=False)[0]
+            for mi, method in zip(item["method_indices"], item["methods"]):
+                fallbacks[("method", rel_path, ci, mi)] = prompts.method_prompt(package_name, item["class"], method,
+                                                                                record=False)
+            items.append(item)
+
+    def parser_for(group):
+        expected = {item["class"]: [m.get("name", "") for m in item["methods"]] for item in group}
+
+        def parse(response):
+            parsed = parse_structured_response(response, expected)
+            summaries = {}
+            for item in group:
+                name = item["class"]
+                if ("class", name) in parsed:
+                    summaries[("class", item["file"], item["index"])] = parsed[("class", name)]
+                for mi, method in zip(item["method_indices"], item["methods"]):
+                    # Overloads share the summary given for their name
+                    if ("method", name, method.get("name", "")) in parsed:
+                        summaries[("method", item["file"], item["index"], mi)] = parsed[("method", name, method.get("name", ""))]
+            return summaries
+        return parse
+
+    requests = [(prompts.structured_prompt(group), parser_for(group)) for group in prompts.group_classes(items)]
+    return StructuredJob(requests, fallbacks)
+
+def iter_structured_jobs(java_files, java_dir: str, completed_files=(), prompts: PromptBuilder = None,
+                         skip_rules: bool = True):
+    """
+    Structured mode of iter_summary_jobs: consecutive files are batched while their classes fit about one structured
+    request (a large file gets several), and each batch is a single (("group", None, files), StructuredJob) job.
+    expand_structured_job turns its result back into the entries iter_summary_jobs would have yielded.
+    """
+    batch, used, class_count = [], 0, 0
+    for parsed in iter_parsed_files(java_files, java_dir, completed_files):
+        rel_path, sha256, code, package_name, classes = parsed
+        cost = sum(prompts.structured_cost(structured_item(rel_path, ci, code, package_name, cls, skip_rules)) or 0
+                   for ci, cls in enumerate(classes))
+        if batch and (used + cost > prompts.context or class_count + len(classes) > MAX_CLASSES_PER_GROUP):
+            yield ("group", None, batch), structured_job(batch, prompts, skip_rules)
+            batch, used, class_count = [], 0, 0
+        batch.append(parsed)
+        used += cost
+        class_count += len(classes)
+    if batch:
+        yield ("group", None, batch), structured_job(batch, prompts, skip_rules)
+
+def expand_structured_job(files: list, summaries: dict, skip_rules: bool = True):
+    """
+    ((kind, name, item), summary) entries of a finished structured job, in the order iter_summary_jobs yields them
+    (summary None for the methods decided by the rules)
+    """
+    for rel_path, sha256, code, package_name, classes in files:
+        yield ("source", rel_path, (sha256, code)), None
+        for ci, cls in enumerate(classes):
+            cls_name = cls.get("class", "UnknownClass")
+            methods_meta = cls.get("methods", [])
+            summarized = {mi for mi, _ in summarized_methods(code, methods_meta, skip_rules)}
+            class_entry = {
+                "summary" : None,
+                "uses_classes": used_classes(cls_name, methods_meta, cls.get("classFields", [])),
+                "package" : package_name,
+                "classFields"  : cls.get("classFields", []),
+            }
+            yield ("class", cls_name, class_entry), summaries.get(("class", rel_path, ci), "")
+            for mi, method in enumerate(methods_meta):
+                summary = summaries.get(("method", rel_path, ci, mi), "") if mi in summarized else None
+                yield ("method", cls_name, method), summary
+        yield ("done", rel_path, sha256), None
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Summarize java classes and methods with a local LLM (Ollama)")
+    parser.add_argument("java_dir", nargs="?", help="folder containing the java files (prompted for if omitted)")
+    # Define the llm model used for summarization of java code + ast
+    parser.add_argument("--model", default="codellama:13b", help="ollama model used for the summaries")
+    parser.add_argument("--ollama-host", default=None, help=f"ollama server url (default: $OLLAMA_HOST or {DEFAULT_OLLAMA_HOST})")
+    parser.add_argument("--workers", type=int, default=4, help="number of LLM requests in flight at once")
+    parser.add_argument("--ast-workers", type=int, default=os.cpu_count() or 1,
+                        help="java files parsed at once by the AST server")
+    parser.add_argument("--retries", type=int, default=3, help="attempts per LLM request before giving up on it")
+    parser.add_argument("--output", default=SUMMARIES_JSONL, help="JSONL summaries file, appended to as the run goes")
+    parser.add_argument("--fresh", action="store_true",
+                        help="start a new output file; by default only new or changed files are summarized again")
+    parser.add_argument("--git-diff", metavar="REV", default=None,
+                        help="only check files changed since this git revision (others are trusted as summarized)")
+    parser.add_argument("--cache", default="llm_summary_cache.sqlite", help="on-disk summary cache (reused across runs)")
+    parser.add_argument("--no-cache", action="store_true", help="always ask the LLM, ignore and do not fill the cache")
+    parser.add_argument("--cache-max-entries", type=int, default=100_000, help="LRU limit on cached summaries")
+    parser.add_argument("--cache-max-mb", type=float, default=512, help="LRU limit on total cached summary size")
+    parser.add_argument("--prompt-style", choices=["compact", "full"], default="full",
+                        help="full: the original prompts with the whole file source; compact (opt-in, the summaries "
+                             "and so the recommendations differ): per-class source, no indentation, degraded to fit "
+                             "--prompt-budget")
+    parser.add_argument("--prompt-budget", type=int, default=None,
+                        help="with --prompt-style compact, estimated prompt tokens allowed "
+                             "(default: the model's context minus room for the answer)")
+    parser.add_argument("--prompt-report", metavar="PATH", default=None,
+                        help="write the estimated token count of every prompt (and of the original prompt) as JSONL")
+    parser.add_argument("--structured", action="store_true",
+                        help="summarize a group of classes and all their methods with one JSON request "
+                             "(needs --prompt-style compact; missing summaries fall back to single requests)")
+    parser.add_argument("--summarize-all", action="store_true",
+                        help="also summarize the methods the recommender keeps by rule (interface methods, one-line "
+                             "delegates, getters/setters); by default they get an empty summary without an LLM call")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="write timers, counters and peak memory of the run as JSON")
+    parser.add_argument("--cprofile", metavar="PATH", default=None, help="run under cProfile and dump the stats here")
+    args = parser.parse_args()
+    if args.structured and args.prompt_style != "compact":
+        parser.error("--structured needs --prompt-style compact")
+
+    enable_profiling(args.profile, args.cprofile)
+
+    llm_model_name = args.model
+
+    # Specify the directory containing the java codes to be refactored
+    java_dir = (args.java_dir or input("Enter path to folder containing Java files: ")).strip()
+    if not os.path.isdir(java_dir):
+        print(f"Not a valid directory: {java_dir}",file=sys.stderr)
+        sys.exit(1)
 
-            for method in methods_meta:
-                method_summary = get_method_summary(llm_model_name, package_name, class_summary_dict["summary"], method, code)
-                print(f" \u21b3 {method['name']}: {method_summary}")
-
-                summaries[cls_name]["methods"][method['name']] = method_summary
-                summaries[cls_name]["methods_meta"].append({
-                    "name": method.get("name", ""),
-                    "parameters": method.get("parameters", []),
-                    "methodCalls": method.get("methodCalls", []),
-                    "methodFieldAccess": method.get("methodFieldAccess", []),
-                    "classFields"  : cls.get("classFields", []),
-                    "methodBody": method.get("methodBody", "")
-                })                
-
-        print("-" * 60)
-
-    with open("llm_code_summaries.json","w", encoding="utf-8") as out:
-        json.dump(summaries, out, indent=2, ensure_ascii=False)
-    print("Saved all java code summaries to llm_code_summaries.json")
\ No newline at end of file
+    cache = None if args.no_cache else SummaryCache(args.cache,
+                                                    max_entries=args.cache_max_entries,
+                                                    max_bytes=int(args.cache_max_mb * 1024 * 1024))
+
+    prompts = prompt_report = None
+    model_options = None
+    if args.prompt_style == "compact":
+        prompt_report = open(args.prompt_report, "w", encoding="utf-8") if args.prompt_report else None
+        prompts = PromptBuilder(llm_model_name, args.prompt_budget, prompt_report)
+        # Run the model with a context large enough for the budget
+        model_options = {"num_ctx": max(model_context_tokens(llm_model_name), prompts.budget + RESPONSE_TOKENS)}
+
+    engine = SummaryEngine(OllamaClient(args.ollama_host), llm_model_name, workers=args.workers, retries=args.retries,
+                           cache=cache, options=model_options)
+
+    java_files = list(get_java_files(java_dir))
+    _ast_server.threads = max(1, args.ast_workers)
+
+    # Incremental run : an existing output is the manifest of what was already summarized (file -> source sha256)
+    settings = summary_settings(llm_model_name, prompts, args.structured, args.summarize_all)
+    writer = SummaryRecordWriter(args.output, resume=not args.fresh)
+    skip_files = set()
+    resumed = bool(writer.completed_files)
+    if resumed:
+        git_changed = changed_files_from_git(java_dir, args.git_diff) if args.git_diff else None
+        skip_files, stale_files = plan_incremental_run(java_files, java_dir, writer.completed_files, git_changed,
+                                                       writer.completed_settings, settings)
+        writer.drop_files(stale_files)
+        print(f"Incremental run on {args.output}: {len(skip_files)} files unchanged, "
+              f"{len(stale_files)} changed, deleted or summarized with other settings, "
+              f"{len(java_files) - len(skip_files)} to summarize")
+
+    current_file = None
+    with _ast_server, writer, METRICS.timer("summarize"):
+        iter_jobs = iter_structured_jobs if args.structured else iter_summary_jobs
+        skip_rules = not args.summarize_all
+        for key, summary in engine.map(iter_jobs(java_files, java_dir, skip_files, prompts, skip_rules)):
+            entries = expand_structured_job(key[2], summary, skip_rules) if key[0] == "group" else [(key, summary)]
+            for (kind, name, item), summary in entries:
+                if kind == "source":
+                    current_file = name
+                    writer.write_source(current_file, *item)
+                elif kind == "class":
+                    print("-" * 60)
+                    print(f"Class {name}: {summary}")
+                    item["summary"] = summary
+                    writer.write_class(current_file, name, item)
+                elif kind == "method":
+                    method = item
+                    if summary is None:
+                        # Decided by the structural rules : no LLM call, the record says so instead of a summary
+                        METRICS.count("rules.skipped_summaries")
+                        print(f" \u21b3 {method['name']}: (kept by rule, not summarized)")
+                    else:
+                        print(f" \u21b3 {method['name']}: {summary}")
+                    writer.write_method(current_file, name, summary or "", {
+                        "name": method.get("name", ""),
+                        "parameters": method.get("parameters", []),
+                        "methodCalls": method.get("methodCalls", []),
+                        "methodFieldAccess": method.get("methodFieldAccess", []),
+                        "methodBody": method.get("methodBody", "")
+                    }, decided_by="rule" if summary is None else None)
+                else:
+                    writer.finish_file(name, item, settings)
+
+        if resumed:
+            # Files summarized again were appended : same record order as a fresh run
+            writer.sort_files([os.path.relpath(java_file, java_dir) for java_file in java_files])
+
+    if prompt_report is not None:
+        prompt_report.close()
+        print(f"Prompt token report written to {args.prompt_report}")
+    if prompts is not None and METRICS.counters.get("prompt.count"):
+        print(f"Prompts: {METRICS.counters['prompt.count']}, "
+              f"~{METRICS.counters['prompt.tokens'] / METRICS.counters['prompt.count']:.0f} tokens on average "
+              f"(budget {prompts.budget})")
+    if args.structured:
+        print(f"Structured requests: {METRICS.counters.get('llm.structured_requests', 0)}, "
+              f"{METRICS.counters.get('llm.structured_fallbacks', 0)} summaries asked for on their own")
+
+    if not args.summarize_all:
+        print(f"Methods decided by rules (not summarized): {METRICS.counters.get('rules.skipped_summaries', 0)}")
+
+    if engine.failures:
+        print(f"{engine.failures} summaries failed after retries and were left empty", file=sys.stderr)
+
+    if cache is not None:
+        cache.close()
+        stats = cache.stats()
+        print(f"Summary cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"(hit rate {stats['hit_rate']:.1%}), {stats['evictions']} evicted")
+
+    print(f"Saved all java code summaries to {args.output}")
+
+    print(tabulate(METRICS.table(), headers=["Timer", "Calls", "Seconds"], tablefmt="github", floatfmt=".3f"))
@@ -0,0 +1,78 @@
+import re
+
+"""
+    Structural rules deciding KEEP for a method from its AST metadata alone: methods of an interface, one-line
+    delegates and one-line getters / setters. They need no summary and no vector, so they are applied right after
+    parsing: llm_generator.py does not summarize these methods and refactor_recommendation.py does not embed them.
+"""
+
+GETTER_SETTER_PATTERN = re.compile(r"^(get|set|is)[A-Z].*")
+
+def is_interface(class_body: str) -> bool:
+    """
+        if the code is part of a java interface then return true (no move method for it as it is just a contract)
+    """
+    lines = class_body.splitlines()
+    for line in lines:
+        if line.strip():
+            if re.search(r'\binterface\b', line, re.IGNORECASE):
+                return True
+            break
+    return False
+
+def is_simple_delegate(method_meta):
+    """
+     return True if the method is a one-line delegate (ie. a method having a single return or assignment statement)
+    """
+    if not method_meta:
+        return False
+    body = method_meta.get("methodBody","")
+    lines = [line.strip() for line in body.splitlines() if line.strip()]
+    return len(lines) == 1 and ("return" in lines[0] or "=" in lines[0] and ";" in lines[0])
+
+def is_getter_setter(method_meta, method_name):
+    """
+     Checks if a method is a simple getter or setter with only one line of code.
+    """
+    if not GETTER_SETTER_PATTERN.match(method_name):
+        return False
+    body = method_meta.get("methodBody","")
+    lines = [l.strip() for l in body.splitlines() if l.strip() not in ["{", "}"]]
+    return len(lines) == 1 and ("return" in lines[0] or "=" in lines[0])
+
+def rule_action(method_meta, method_name, in_interface=False):
+    """
+        Action of the first rule matching the method, or None when it has to go through the scoring engine
+    """
+    if in_interface:
+        return "KEEP (inteface)"
+    if is_simple_delegate(method_meta):
+        return "KEEP (simple delegate)"
+    if is_getter_setter(method_meta, method_name):
+        return "KEEP"
+    return None
+
+def rule_based_decisions(classes, methods):
+    """
+        Actions decided by the structural rules alone (interface, simple delegate, getter/setter).
+        Returns ({(class, method): action}, [methods left for the scoring engine])
+    """
+    interface_classes = set()
+
+    for class_name, info in classes.items():
+        class_body = info.get("classBody", "")
+        if is_interface(class_body):
+            interface_classes.add(class_name)
+
+    if len(interface_classes) != 0 :
+        print(f'Interfaces found : {interface_classes}')
+
+    decisions = {}
+    to_score = []
+    for (cls_name, method_name), method_meta in methods.items():
+        action = rule_action(method_meta, method_name, cls_name in interface_classes)
+        if action is not None:
+            decisions[(cls_name, method_name)] = action
+        else:
+            to_score.append((cls_name, method_name))
+    return decisions, to_score
@@ -0,0 +1,112 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+"""
+    Run metrics shared by llm_generator.py and refactor_recommendation.py: named timers, counters and peak memory.
+
+    METRICS is the process wide instance. Code that does measurable work wraps it in `METRICS.timer(name)` and bumps
+    counters with `METRICS.count(name, n)`; both are thread safe, and a timer used from several threads at once
+    (e.g. LLM requests) adds up the time of every thread. `--profile PATH` on either script writes `snapshot()` as
+    JSON, and `--cprofile PATH` additionally runs the whole script under cProfile (a pstats file, readable with
+    `python -m pstats` or snakeviz). Sampling profilers such as py-spy need no hook: `py-spy record --pid <pid>`.
+"""
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB (None where the platform does not report it)
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+class Metrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timers = {}     # name -> {"calls", "seconds", "max_seconds"}
+        self.counters = {}   # name -> number
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            timer = self.timers.setdefault(name, {"calls": 0, "seconds": 0.0, "max_seconds": 0.0})
+            timer["calls"] += 1
+            timer["seconds"] += seconds
+            timer["max_seconds"] = max(timer["max_seconds"], seconds)
+
+    def count(self, name: str, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value):
+        with self._lock:
+            self.counters[name] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "script": os.path.basename(sys.argv[0]),
+                "wall_seconds": round(time.perf_counter() - self.started, 3),
+                "peak_rss_mb": peak_rss_mb(),
+                "timers": {name: {"calls": timer["calls"],
+                                  "seconds": round(timer["seconds"], 6),
+                                  "max_seconds": round(timer["max_seconds"], 6)}
+                           for name, timer in sorted(self.timers.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as file_out:
+            json.dump(self.snapshot(), file_out, indent=2)
+
+    def table(self):
+        """
+        (name, calls, seconds) rows, slowest first, for a tabulate summary
+        """
+        with self._lock:
+            return sorted(((name, timer["calls"], timer["seconds"]) for name, timer in self.timers.items()),
+                          key=lambda row: -row[2])
+
+METRICS = Metrics()
+
+def enable_profiling(metrics_path: str = None, cprofile_path: str = None):
+    """
+    Start cProfile now (when cprofile_path is given) and write the profile and the metrics file (when metrics_path
+    is given) when the script exits, also when the run fails half way.
+    """
+    profiler = None
+    if cprofile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish():
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+            print(f"cProfile stats written to {cprofile_path}")
+        if metrics_path:
+            METRICS.write(metrics_path)
+            print(f"Metrics written to {metrics_path}")
+
+    if profiler is not None or metrics_path:
+        atexit.register(finish)
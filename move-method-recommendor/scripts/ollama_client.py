@@ -0,0 +1,236 @@
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import METRICS
+from summary_cache import summary_cache_key
+
+"""
+    Ollama HTTP client and a bounded, ordered summarization engine used by llm_generator.py
+
+    References
+      https://github.com/ollama/ollama/blob/main/docs/api.md#generate-a-completion
+"""
+
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+
+class OllamaError(RuntimeError):
+    """
+    Raised when the Ollama server answers with a non 200 status or an unexpected payload
+    """
+
+class OllamaClient:
+    """
+    Talks to the local Ollama HTTP API (/api/generate) instead of spawning `ollama run` for every prompt.
+    Each thread keeps its own persistent (keep-alive) connection, so a pool of workers can share one client.
+    """
+    def __init__(self, host: str = None, timeout: float = 600.0):
+        host = host or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST
+        if "://" not in host:
+            host = f"http://{host}"
+        parsed = urllib.parse.urlsplit(host)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 11434
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def generate(self, model: str, prompt: str, **options) -> str:
+        """
+        Send one non-streaming completion request and return the generated text
+        """
+        body = json.dumps({"model": model, "prompt": prompt, "stream": False, **options})
+        METRICS.count("ollama.requests")
+        METRICS.count("ollama.prompt_chars", len(prompt))
+        conn = self._connection()
+        try:
+            with METRICS.timer("ollama.generate"):
+                conn.request("POST", "/api/generate", body=body.encode("utf-8"),
+                             headers={"Content-Type": "application/json"})
+                response = conn.getresponse()
+                payload = response.read()
+        except (OSError, http.client.HTTPException):
+            # Stale keep-alive connection or server restart : reconnect on the next attempt
+            self._reset_connection()
+            METRICS.count("ollama.errors")
+            raise
+
+        if response.status != 200:
+            METRICS.count("ollama.errors")
+            raise OllamaError(f"HTTP {response.status}: {payload[:200].decode('utf-8', 'replace')}")
+        try:
+            result = json.loads(payload)
+            text = result["response"]
+        except (ValueError, KeyError) as e:
+            METRICS.count("ollama.errors")
+            raise OllamaError(f"Unexpected response payload: {payload[:200]!r}") from e
+
+        # Token counts reported by Ollama for the prompt and the generated text
+        METRICS.count("ollama.prompt_tokens", result.get("prompt_eval_count") or 0)
+        METRICS.count("ollama.response_tokens", result.get("eval_count") or 0)
+        return text
+
+class StructuredJob:
+    """
+    Summaries of several entries asked for in a few requests answered as JSON (Ollama `format: "json"`).
+    `requests` is a list of (prompt, parse), where parse turns a response into {entry: summary} and leaves out
+    missing or invalid entries. `fallbacks` maps every expected entry to the prompt summarizing it on its own,
+    used for the entries no request answered.
+    """
+    def __init__(self, requests: list, fallbacks: dict):
+        self.requests = requests
+        self.fallbacks = fallbacks
+
+def structured_cache_key(model: str, prompt: str) -> str:
+    """
+    Cache key of an entry of a StructuredJob (its single request's prompt): a group answer is not the answer that
+    prompt gets on its own, so the two never share a cache entry
+    """
+    return summary_cache_key(model, "structured\0" + prompt)
+
+class SummaryEngine:
+    """
+    Runs summarization prompts through a bounded thread pool.
+
+    - `workers` requests are sent to the model at once (Ollama queues/parallelizes them on its side)
+    - failed requests are retried with a linear backoff; after `retries` attempts the entry gets an
+      empty summary and the run continues
+    - `map` yields results in the same order as the submitted jobs, so the output stays deterministic
+    - with a `cache` (summary_cache.SummaryCache), prompts already summarized in an earlier run skip the LLM
+    - `options` are Ollama model options sent with every request (e.g. {"num_ctx": 4096})
+    - a StructuredJob gets its JSON requests (one per class group), then single requests only for the entries
+      the answer is missing; the result is {entry: summary}, cached per entry under the single request's prompt
+      in a namespace of its own (structured_cache_key), apart from the answers of plain single requests
+    """
+    def __init__(self, client: OllamaClient, model: str, workers: int = 4, retries: int = 3, backoff: float = 2.0,
+                 cache=None, options: dict = None):
+        self.client = client
+        self.cache = cache
+        self.options = options
+        self.model = model
+        self.workers = max(1, workers)
+        self.retries = max(1, retries)
+        self.backoff = backoff
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def summarize(self, prompt: str, **request) -> str:
+        if self.options:
+            request["options"] = self.options
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                return self.client.generate(self.model, prompt, **request).strip()
+            except (OSError, http.client.HTTPException, OllamaError) as e:
+                last_error = e
+                print(f"[LLM Retry] attempt {attempt}/{self.retries} failed: {e}", file=sys.stderr)
+                if attempt < self.retries:
+                    time.sleep(self.backoff * attempt)
+
+        with self._lock:
+            self.failures += 1
+        METRICS.count("llm.failures")
+        print(f"[LLM Error] giving up after {self.retries} attempts: {last_error}", file=sys.stderr)
+        return ""
+
+    def summarize_structured(self, job: StructuredJob, known: dict) -> dict:
+        """
+        Summaries of every entry of the job; `known` entries (from the cache) are not asked for again
+        """
+        results = dict(known)
+        for prompt, parse in job.requests:
+            if len(results) == len(job.fallbacks):
+                break
+            METRICS.count("llm.structured_requests")
+            response = self.summarize(prompt, format="json")
+            parsed = parse(response) if response else {}
+            for entry, summary in parsed.items():
+                if entry in job.fallbacks and entry not in results and summary:
+                    results[entry] = summary
+
+        missing = [entry for entry in job.fallbacks if entry not in results]
+        METRICS.count("llm.structured_fallbacks", len(missing))
+        for entry in missing:
+            results[entry] = self.summarize(job.fallbacks[entry])
+        return results
+
+    def map(self, jobs):
+        """
+        jobs: iterable of (key, prompt). Yields (key, summary) in job order; a None prompt is a marker job
+        that is passed through (summary None) without calling the LLM.
+        At most `workers * 4` jobs are pending at once, so a lazy job generator is never fully materialized.
+        """
+        max_in_flight = self.workers * 4
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for key, prompt in jobs:
+                pending.append((key, self._submit(pool, prompt)))
+                if len(pending) >= max_in_flight:
+                    yield self._collect(*pending.popleft())
+            while pending:
+                yield self._collect(*pending.popleft())
+
+    def _submit(self, pool: ThreadPoolExecutor, prompt: str):
+        if prompt is None:
+            future = Future()
+            future.set_result(None)
+            return None, False, future
+        if isinstance(prompt, StructuredJob):
+            return self._submit_structured(pool, prompt)
+        cache_key = summary_cache_key(self.model, prompt) if self.cache is not None else None
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cache_key:
+            METRICS.count("summary_cache.hits" if cached is not None else "summary_cache.misses")
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return cache_key, False, future
+        return cache_key, True, pool.submit(self.summarize, prompt)
+
+    def _submit_structured(self, pool: ThreadPoolExecutor, job: StructuredJob):
+        cache_keys, known = {}, {}
+        if self.cache is not None:
+            for entry, prompt in job.fallbacks.items():
+                cache_key = structured_cache_key(self.model, prompt)
+                cached = self.cache.get(cache_key)
+                METRICS.count("summary_cache.hits" if cached is not None else "summary_cache.misses")
+                if cached is None:
+                    cache_keys[entry] = cache_key
+                else:
+                    known[entry] = cached
+        if len(known) == len(job.fallbacks):
+            future = Future()
+            future.set_result(known)
+            return None, False, future
+        # cache_keys : the entries the LLM is asked for, cached once answered
+        return cache_keys, True, pool.submit(self.summarize_structured, job, known)
+
+    def _collect(self, key, submitted):
+        # Cache writes stay on the consuming thread (sqlite connections are not shared across threads)
+        cache_key, from_llm, future = submitted
+        summary = future.result()
+        if from_llm and isinstance(summary, dict):
+            for entry, entry_key in cache_key.items():
+                if summary.get(entry):
+                    self.cache.put(entry_key, summary[entry])
+        elif from_llm and cache_key and summary:
+            self.cache.put(cache_key, summary)
+        return key, summary
@@ -0,0 +1,124 @@
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+    Deterministic stand-in for the Ollama HTTP API, used to exercise llm_generator.py without a real model.
+
+    Run : python scripts/ollama_stub.py --port 11435 [--delay 0.05] [--fail-every 7]
+    Then: OLLAMA_HOST=http://localhost:11435 python scripts/llm_generator.py <java_dir>
+
+    Responses only depend on the prompt text, so two runs over the same code give identical summaries.
+"""
+
+def stub_summary(prompt: str) -> str:
+    """
+    Builds a fake one sentence summary from the class/method name found in the prompt
+    """
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:10]
+    match = re.search(r"Method: (\w+)", prompt) or re.search(r"Class: (\w+)", prompt)
+    name = match.group(1) if match else "code"
+    return f"Handles {name} logic (stub {digest})."
+
+def stub_structured_summary(prompt: str) -> str:
+    """
+    JSON answer to a structured prompt (prompt_builder.structured_prompt) for the classes and method signatures it
+    lists. Like a small model, it leaves out about one method summary in sixteen (those fall back to single requests).
+    """
+    classes = {}
+    for section in re.split(r"^### ", prompt, flags=re.M)[1:]:
+        cls_name = re.match(r"Class (\w+)", section).group(1)
+        methods = {}
+        for method_name in re.findall(r"^- [^\n(]*?(\w+)\(", section.split("Methods:\n", 1)[-1], flags=re.M):
+            summary = stub_summary(f"Method: {method_name}\n{cls_name}\n{section}")
+            if not summary.rsplit("stub ", 1)[1].startswith("0"):
+                methods[method_name] = summary
+        classes[cls_name] = {"summary": stub_summary(f"Class: {cls_name}\n{section}"), "methods": methods}
+    return json.dumps({"classes": classes})
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep their connection alive between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes : without TCP_NODELAY every response waits on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": []})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            request_number = server.request_count
+
+        # Deterministic failure injection, to exercise client retries
+        if server.fail_every and request_number % server.fail_every == 0:
+            self._send_json(500, {"error": "injected failure"})
+            return
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        prompt = request.get("prompt", "")
+        self._send_json(200, {
+            "model": request.get("model", ""),
+            "response": stub_structured_summary(prompt) if request.get("format") == "json" else stub_summary(prompt),
+            "done": True,
+            "prompt_eval_count": len(prompt.split()),
+        })
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_stub_server(host: str = "127.0.0.1", port: int = 11435, delay: float = 0.0,
+                     fail_every: int = 0, verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Creates (but does not start) the stub server; port 0 picks a free port (see server.server_address)
+    """
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.fail_every = fail_every
+    server.verbose = verbose
+    server.request_count = 0
+    server.lock = threading.Lock()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deterministic Ollama API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to sleep per generate request")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer HTTP 500 to every Nth request")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    stub = make_stub_server(args.host, args.port, args.delay, args.fail_every, args.verbose)
+    print(f"Ollama stub listening on http://{args.host}:{stub.server_address[1]}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,306 @@
+import json
+import re
+
+from metrics import METRICS
+
+"""
+    Compact class / method summarization prompts, kept under a per-model token budget (used by llm_generator.py).
+
+    Compared to the original prompts (llm_generator.build_class_prompt / build_method_prompt):
+      - a class prompt carries the source of that class only (lines beginLine..endLine from GenerateAST), not
+        the whole file once per class, and lists the method signatures once
+      - code is sent without indentation or blank lines, AST lists without duplicates
+      - when a prompt does not fit the budget it degrades step by step:
+            class:  source -> signatures + source excerpt -> AST only (signatures, trimmed if needed)
+            method: body   -> body excerpt
+    Token counts are estimated (no tokenizer for the Ollama models here); Ollama's own prompt_eval_count is
+    recorded separately by ollama_client.
+
+    Structured mode (llm_generator --structured) asks for a whole group of classes and all their methods in one
+    request answered as JSON (structured_prompt / parse_structured_response); classes are grouped while they fit
+    the model context, and any summary missing from the answer falls back to the single prompts above.
+"""
+
+# Context window Ollama runs a model with unless num_ctx is given, and models given a larger one (llm_generator
+# passes num_ctx along, so the budget is really available)
+DEFAULT_CONTEXT_TOKENS = 2048
+MODEL_CONTEXT_TOKENS = {
+    "codellama": 4096,
+    "deepseek-coder": 4096,
+    "qwen2.5-coder": 4096,
+}
+# Part of the context left for the generated summary
+RESPONSE_TOKENS = 256
+# Structured (one request per class group) answers: room left per class summary and per method summary, and the
+# largest group asked for at once (small models lose track of long JSON answers)
+RESPONSE_TOKENS_PER_CLASS = 120
+RESPONSE_TOKENS_PER_METHOD = 50
+MAX_CLASSES_PER_GROUP = 8
+STRUCTURED_HEADER_TOKENS = 128
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def model_context_tokens(model: str) -> int:
+    family = model.split(":")[0].split("/")[-1]
+    return MODEL_CONTEXT_TOKENS.get(family, DEFAULT_CONTEXT_TOKENS)
+
+def prompt_token_budget(model: str) -> int:
+    return model_context_tokens(model) - RESPONSE_TOKENS
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough BPE token count: one per symbol, one per 4 characters of each word (long identifiers split up)
+    """
+    return sum((len(token) + 3) // 4 if token[0].isalnum() or token[0] == "_" else 1
+               for token in TOKEN_PATTERN.findall(text))
+
+def compact_code(code: str) -> str:
+    """
+    Code without indentation, trailing spaces or blank lines (Java reads the same without them)
+    """
+    return "\n".join(line.strip() for line in code.splitlines() if line.strip())
+
+def excerpt(text: str, max_tokens: int) -> str:
+    """
+    Leading lines of text that fit in max_tokens, with a marker telling how many lines were left out
+    """
+    lines = text.splitlines()
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if len(kept) < len(lines):
+        kept.append(f"// ... {len(lines) - len(kept)} more lines")
+    return "\n".join(kept)
+
+def class_source(code: str, cls: dict) -> str:
+    """
+    Source lines of one class of a file, from the beginLine/endLine GenerateAST gives it (whole file without them)
+    """
+    begin, end = cls.get("beginLine"), cls.get("endLine")
+    if not begin or not end:
+        return code
+    return "\n".join(code.splitlines()[begin - 1:end])
+
+def used_classes(cls_name: str, methods_meta: list, class_fields: list) -> list:
+    """
+    Classes a class uses: field types, parameter types and the objects its methods call
+    """
+    used = {field["var_type"] for field in class_fields}
+    for method in methods_meta:
+        used.update(call.split(".")[0] for call in method.get("methodCalls", []) if "." in call)
+        used.update(method.get("parameters", []))
+    return sorted(used - {cls_name})
+
+def unique(items):
+    return list(dict.fromkeys(items))
+
+def method_signatures(methods_meta: list) -> list:
+    return unique(f"- {m.get('returnType', 'void')} {m.get('name', '')}({', '.join(m.get('parameters', []))})"
+                  for m in methods_meta)
+
+def structured_response_tokens(classes: list) -> int:
+    return sum(RESPONSE_TOKENS_PER_CLASS + RESPONSE_TOKENS_PER_METHOD * len(unique(m.get("name", "") for m in cls["methods"]))
+               for cls in classes)
+
+def parse_structured_response(response: str, expected: dict) -> dict:
+    """
+    Summaries found in a structured answer, for the expected {class name: [method names]} only:
+    {("class", class name): summary, ("method", class name, method name): summary}. Anything missing, empty or
+    not a string is left out (and summarized with a single request instead).
+    """
+    try:
+        answer = json.loads(response)
+    except ValueError:
+        return {}
+    classes = answer.get("classes") if isinstance(answer, dict) else None
+    if not isinstance(classes, dict):
+        return {}
+
+    summaries = {}
+    for cls_name, method_names in expected.items():
+        entry = classes.get(cls_name)
+        if not isinstance(entry, dict):
+            continue
+        if isinstance(entry.get("summary"), str) and entry["summary"].strip():
+            summaries[("class", cls_name)] = entry["summary"].strip()
+        methods = entry.get("methods") if isinstance(entry.get("methods"), dict) else {}
+        for method_name in method_names:
+            summary = methods.get(method_name)
+            if isinstance(summary, str) and summary.strip():
+                summaries[("method", cls_name, method_name)] = summary.strip()
+    return summaries
+
+class PromptBuilder:
+    """
+    Builds budgeted prompts for one model. Every prompt is counted in METRICS (prompt.tokens, prompt.<kind>.<level>)
+    and, with a `report` file, described by one JSON line: kind, class, method, level, tokens and, when the
+    original prompt is given, its token count.
+    """
+    def __init__(self, model: str, budget: int = None, report=None):
+        self.model = model
+        self.budget = budget or prompt_token_budget(model)
+        self.report = report
+        # Whole context (prompt + answer), what structured prompts are sized against
+        self.context = self.budget + RESPONSE_TOKENS
+
+    def _record(self, kind: str, cls_name: str, method_name: str, prompt: str, level: str, original: str = None):
+        tokens = estimate_tokens(prompt)
+        METRICS.count("prompt.count")
+        METRICS.count("prompt.tokens", tokens)
+        METRICS.count(f"prompt.{kind}.{level}")
+        if self.report is None:
+            return
+        entry = {"kind": kind, "class": cls_name, "method": method_name, "level": level, "tokens": tokens}
+        if original is not None:
+            entry["original_tokens"] = estimate_tokens(original)
+        self.report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def class_prompt(self, pkg_name: str, cls_name: str, class_fields: list, methods_meta: list, source: str,
+                     original: str = None, record: bool = True) -> tuple:
+        """
+        Returns (prompt, classes used by the class). `original` (the prompt it replaces) is only used for the report;
+        record=False builds the prompt without counting it (structured mode fallbacks, mostly never sent).
+        """
+        fields = "\n".join(f"- {f['var_type']} {f['var_name']}" for f in class_fields) or "- None"
+        signatures = method_signatures(methods_meta)
+
+        def prompt(method_lines, code_section):
+            methods = "\n".join(method_lines) or "- None"
+            return (f"Package: {pkg_name}\n"
+                    f"Class: {cls_name}\n"
+                    f"Fields:\n{fields}\n"
+                    f"Methods:\n{methods}\n"
+                    f"{code_section}"
+                    f"Summarize the Java class `{cls_name}` from the AST and code above in 2-4 sentences:\n"
+                    f"1. What data it owns (fields).\n"
+                    f"2. Each listed method by its exact name, with its purpose in a short phrase.\n"
+                    f"3. The external classes it uses (parameters, calls, field types).\n"
+                    f"Only mention the listed methods. Stick to what is visible, no speculation.")
+
+        code = compact_code(source)
+        text, level = prompt(signatures, f"Code:\n{code}\n"), "full"
+        over = estimate_tokens(text) - self.budget
+        if over > 0:
+            code_budget = estimate_tokens(code) - over
+            if code_budget >= 64:
+                text, level = prompt(signatures, f"Code excerpt:\n{excerpt(code, code_budget)}\n"), "excerpt"
+            else:
+                text, level = prompt(signatures, ""), "ast"
+                over = estimate_tokens(text) - self.budget
+                if over > 0:
+                    # Not even the signatures fit : keep as many as the budget allows
+                    kept = excerpt("\n".join(signatures), max(0, estimate_tokens("\n".join(signatures)) - over))
+                    text = prompt(kept.splitlines(), "")
+
+        if record:
+            self._record("class", cls_name, None, text, level, original)
+        return text, used_classes(cls_name, methods_meta, class_fields)
+
+    def method_prompt(self, pkg_name: str, cls_name: str, method: dict, original: str = None, record: bool = True) -> str:
+        method_name = method.get("name", "")
+        calls = unique(method.get("methodCalls", []))
+        accesses = unique(method.get("methodFieldAccess", []))
+        local_vars = unique(f"{v['var_name']}: {v['var_type']}" for v in method.get("methodLocalVariables", []))
+
+        def section(title, items):
+            return f"{title}: {', '.join(items)}\n" if items else ""
+
+        def prompt(body_section):
+            return (f"Package: {pkg_name}\n"
+                    f"Method: {method_name}({', '.join(method.get('parameters', []))}) -> {method.get('returnType', 'void')}\n"
+                    f"{section('Field accesses', accesses)}"
+                    f"{section('Calls', calls)}"
+                    f"{section('Local variables', local_vars)}"
+                    f"{body_section}"
+                    f"In one sentence (at most 30 words) starting with a verb, describe what `{method_name}` does. "
+                    f"Say which other classes it uses (\"uses class X\"), without full call chains. "
+                    f"Only describe what is visible above, no speculation.")
+
+        body = compact_code(method.get("methodBody", ""))
+        text, level = prompt(f"Code:\n{body}\n"), "full"
+        over = estimate_tokens(text) - self.budget
+        if over > 0:
+            text, level = prompt(f"Code excerpt:\n{excerpt(body, max(0, estimate_tokens(body) - over))}\n"), "excerpt"
+
+        if record:
+            self._record("method", cls_name, method_name, text, level, original)
+        return text
+
+    def structured_prompt(self, classes: list) -> str:
+        """
+        One prompt asking for the summary of several classes and all their methods as JSON (see
+        parse_structured_response). classes: dicts with package, class, classFields, methods and source.
+        The code of each class gets an equal share of the budget left once the answer is accounted for.
+        """
+        header = ("Summarize each Java class below and each of its methods. Answer with JSON only, in this shape:\n"
+                  '{"classes": {"<class name>": {"summary": "<2-4 sentences: the data it owns, what its methods do, '
+                  'the external classes it uses>", "methods": {"<method name>": "<one sentence starting with a verb, '
+                  'at most 30 words>"}}}}\n'
+                  "Use exactly the class and method names listed, every one of them. Stick to what is visible, "
+                  "no speculation.\n")
+
+        sections = []
+        for cls in classes:
+            fields = "\n".join(f"- {f['var_type']} {f['var_name']}" for f in cls["classFields"]) or "- None"
+            methods = "\n".join(method_signatures(cls["methods"])) or "- None"
+            # Methods decided by rules (llm_generator.summarized_methods) are in the code but not asked for
+            asked = {m.get("name", "") for m in cls["methods"]}
+            skipped = unique(m.get("name", "") for m in cls.get("rule_methods", []) if m.get("name", "") not in asked)
+            skipped = f"Accessors and delegates (no summary needed): {', '.join(skipped)}\n" if skipped else ""
+            sections.append((f"### Class {cls['class']} (package {cls['package']})\n"
+                             f"Fields:\n{fields}\nMethods:\n{methods}\n{skipped}", compact_code(cls["source"])))
+
+        fixed = estimate_tokens(header) + sum(estimate_tokens(head) for head, _ in sections)
+        code_budget = (self.context - structured_response_tokens(classes) - fixed) // max(1, len(classes))
+
+        level = "full"
+        parts = [header]
+        for head, code in sections:
+            parts.append(head)
+            if estimate_tokens(code) <= code_budget:
+                parts.append(f"Code:\n{code}\n")
+            elif code_budget >= 64:
+                parts.append(f"Code excerpt:\n{excerpt(code, code_budget)}\n")
+                level = "excerpt" if level == "full" else level
+            else:
+                level = "ast"
+        text = "".join(parts)
+
+        self._record("group", ",".join(cls["class"] for cls in classes), None, text, level)
+        return text
+
+    def structured_cost(self, cls: dict):
+        """
+        Estimated context tokens a class takes in a structured request (its AST section, compacted code and expected
+        answer), or None when its answer alone would not fit the context
+        """
+        answer = structured_response_tokens([cls])
+        if answer + 512 > self.context:
+            return None
+        return (estimate_tokens("\n".join(method_signatures(cls["methods"]))) + estimate_tokens(compact_code(cls["source"]))
+                + answer + 64)
+
+    def group_classes(self, classes: list) -> list:
+        """
+        Split classes (in order) into groups asked for in one structured request: consecutive classes are grouped
+        while they fit the model context together and their names differ. Classes whose answer alone would not
+        fit are left out (they are summarized with single requests). Returns a list of groups.
+        """
+        groups, current, names, used = [], [], set(), STRUCTURED_HEADER_TOKENS
+        for cls in classes:
+            cost = self.structured_cost(cls)
+            if cost is None:
+                continue
+            if current and (used + cost > self.context or len(current) >= MAX_CLASSES_PER_GROUP or cls["class"] in names):
+                groups.append(current)
+                current, names, used = [], set(), STRUCTURED_HEADER_TOKENS
+            current.append(cls)
+            names.add(cls["class"])
+            used += cost
+        if current:
+            groups.append(current)
+        return groups
@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from embedding_store import DEFAULT_MAX_ROWS, EmbeddingStore, EmbeddingStoreError, MemoryEmbeddingStore
+from metrics import METRICS
+from refactor_recommendation import (ANN_PROBES, ANN_TOP_K, CANDIDATE_MODE, CODE_EMBEDDING, PRECISIONS, LazyModels,
+                                     build_ann_index, build_feature_index, embed_classes_and_methods, explain_record,
+                                     load_llm_summaries, plan_rescoring, recommend, rule_based_decisions, score_methods)
+from summary_records import default_summaries_path
+
+"""
+    Long running recommender for IDE / CI queries: the models, the project's vectors and its recommendations stay
+    in memory, so a query costs a dictionary lookup (a few milliseconds with its score explanation) instead of a
+    full refactor_recommendation.py run.
+
+    Run : python scripts/recommender_daemon.py [--summaries llm_code_summaries.jsonl] [--port 8765]
+
+    HTTP + JSON on localhost:
+      GET  /health      classes / methods loaded, when, and from which summaries file version
+      POST /recommend   {"class": C, "method": m} | {"class": C} | {"file": relative path}, optional "explain": true
+                        -> {"recommendations": [...], "explain": [...]}
+      POST /rescore     reload the summaries now (e.g. after llm_generator.py summarized an edited file)
+                        -> {"reloaded": bool, "rescored": n, "changed": [recommendations that changed]}
+
+    The summaries file is also watched (mtime, every --watch-interval seconds, once it stopped changing): a new
+    version is reloaded, only new or changed texts are embedded (the rest comes from the embedding store, or with
+    --no-embedding-store from the previous version's vectors held in memory) and only the methods plan_rescoring
+    selects are scored again. In ann mode the IVF index is built once per version. Queries keep using the previous
+    version until the new one is ready.
+"""
+
+class Recommender:
+    """
+    Recommendations of one summaries file, kept up to date by `reload`. The current version is one `state` dict
+    replaced as a whole, so request threads read it without locking; reloads run one at a time.
+    Without stores, vectors are kept in memory stores (embedding_store.MemoryEmbeddingStore) holding only the
+    current version's vectors.
+    """
+    def __init__(self, summaries_path: str, models: LazyModels, summary_store=None, code_store=None,
+                 candidate_mode=None, code_embedding=None, batch_size=32, explain_top_k=5, ann=None):
+        self.summaries_path = summaries_path
+        self.models = models
+        self.summary_store = summary_store if summary_store is not None else MemoryEmbeddingStore("summary")
+        self.code_store = code_store if code_store is not None else MemoryEmbeddingStore("code")
+        self.candidate_mode = candidate_mode or CANDIDATE_MODE
+        self.ann = ann
+        self.code_embedding = code_embedding or CODE_EMBEDDING
+        self.batch_size = batch_size
+        self.explain_top_k = explain_top_k
+        self.state = None
+        self._reload_lock = threading.Lock()
+
+    def summaries_mtime(self) -> int:
+        return os.stat(self.summaries_path).st_mtime_ns
+
+    def reload(self, force: bool = False) -> dict:
+        """
+        Load the summaries file when it changed since the last load, embed and re-score what changed.
+        Returns {"reloaded", "rescored", "changed"}.
+        """
+        with self._reload_lock:
+            state = self.state
+            mtime = self.summaries_mtime()
+            if state is not None and not force and mtime == state["mtime"]:
+                return {"reloaded": False, "rescored": 0, "changed": []}
+
+            started = time.perf_counter()
+            classes, methods = load_llm_summaries(self.summaries_path)
+            previous = state["recommendations"] if state is not None else None
+            rescore, manifest = plan_rescoring(classes, methods, state["manifest"] if state else None, previous,
+                                               self.candidate_mode, self.code_embedding, self.models.precision,
+                                               self.ann)
+
+            # Every scored method's vectors are needed for later queries; unchanged texts come from the stores, not the
+            # models. Methods decided by the rules are never scored, so never embedded
+            rules = rule_based_decisions(classes, methods)
+            embeddings = embed_classes_and_methods(classes, {key: methods[key] for key in rules[1]}, self.models,
+                                                   batch_size=self.batch_size, summary_store=self.summary_store,
+                                                   code_store=self.code_store, code_embedding=self.code_embedding,
+                                                   all_methods=methods)
+            for store in (self.summary_store, self.code_store):
+                store.save()
+                if isinstance(store, MemoryEmbeddingStore):
+                    store.retain()
+            if self.candidate_mode == "ann":
+                embeddings["ann_index"] = build_ann_index(embeddings, self.ann)
+
+            records = recommend(classes, methods, embeddings, candidate_mode=self.candidate_mode,
+                                previous=previous, rescore=rescore if previous else None, ann=self.ann, rules=rules)
+            recommendations = {(r["current_class"], r["method"]): r for r in records}
+            changed = [r for key, r in recommendations.items() if previous is None or previous.get(key) != r]
+
+            files = {}
+            for cls_name, info in classes.items():
+                files.setdefault(info.get("file"), []).append(cls_name)
+            rule_decided = set(rules[0])
+            class_methods = {}
+            for key in methods:
+                class_methods.setdefault(key[0], []).append(key)
+
+            self.state = {
+                "mtime": mtime,
+                "loaded_at": time.time(),
+                "classes": classes,
+                "methods": methods,
+                "embeddings": embeddings,
+                "manifest": manifest,
+                "recommendations": recommendations,
+                "files": files,
+                "class_methods": class_methods,
+                "rule_decided": rule_decided,
+            }
+            METRICS.count("daemon.reloads")
+            METRICS.count("daemon.rescored", len(rescore))
+            print(f"Loaded {len(classes)} classes, {len(methods)} methods from {self.summaries_path}: "
+                  f"{len(rescore)} re-scored, {len(changed)} recommendations changed "
+                  f"({time.perf_counter() - started:.2f}s)")
+            return {"reloaded": True, "rescored": len(rescore), "changed": changed}
+
+    def method_keys(self, state: dict, query: dict) -> list:
+        """
+        (class, method) keys a /recommend query asks for; KeyError names what was not found
+        """
+        if query.get("file") is not None:
+            class_names = state["files"].get(query["file"])
+            if class_names is None:
+                raise KeyError(f"file {query['file']}")
+            return [key for cls_name in class_names for key in state["class_methods"].get(cls_name, [])]
+        cls_name = query.get("class")
+        if cls_name not in state["classes"]:
+            raise KeyError(f"class {cls_name}")
+        if query.get("method") is None:
+            return list(state["class_methods"].get(cls_name, []))
+        key = (cls_name, query["method"])
+        if key not in state["methods"]:
+            raise KeyError(f"method {cls_name}.{query['method']}")
+        return [key]
+
+    def query(self, query: dict) -> dict:
+        state = self.state
+        keys = self.method_keys(state, query)
+        response = {"recommendations": [state["recommendations"][key] for key in keys]}
+
+        if query.get("explain"):
+            # Score components are not kept for every method : score the asked ones again (rule decided ones have none)
+            methods = {key: state["methods"][key] for key in keys}
+            features = build_feature_index(methods, state["classes"])
+            scored = [key for key in keys if key not in state["rule_decided"]]
+            explained = {}
+            for key, candidates, scores in score_methods(scored, methods, state["classes"], state["embeddings"],
+                                                         features=features, candidate_mode=self.candidate_mode,
+                                                         ann=self.ann):
+                record = state["recommendations"][key]
+                decision = (record["action"], record["best_class"], record["score"])
+                explained[key] = explain_record(key, candidates, scores, decision, self.explain_top_k)
+            response["explain"] = [explained.get(key) for key in keys]
+        return response
+
+    def health(self) -> dict:
+        state = self.state
+        return {"summaries": self.summaries_path, "classes": len(state["classes"]), "methods": len(state["methods"]),
+                "loaded_at": state["loaded_at"], "summaries_mtime_ns": state["mtime"],
+                "candidate_mode": self.candidate_mode, "ann": self.ann, "code_embedding": self.code_embedding,
+                "precision": self.models.precision}
+
+def watch_summaries(recommender: Recommender, interval: float, stop: threading.Event):
+    """
+    Reload the recommender once the summaries file changed and then stayed unchanged for one interval
+    (llm_generator.py appends to it while it runs)
+    """
+    last_seen = None
+    while not stop.wait(interval):
+        try:
+            mtime = recommender.summaries_mtime()
+            if mtime == last_seen and mtime != recommender.state["mtime"]:
+                recommender.reload()
+            last_seen = mtime
+        except Exception as e:
+            print(f"[Watch] reload failed: {e}", file=sys.stderr)
+
+class RecommenderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.recommender.health())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "body is not JSON"})
+            return
+
+        started = time.perf_counter()
+        METRICS.count("daemon.requests")
+        if self.path == "/recommend":
+            if not isinstance(body, dict) or (body.get("class") is None and body.get("file") is None):
+                self._send_json(400, {"error": "expected {\"class\": ..., \"method\": ...} or {\"file\": ...}"})
+                return
+            try:
+                with METRICS.timer("daemon.recommend"):
+                    response = self.server.recommender.query(body)
+            except KeyError as e:
+                self._send_json(404, {"error": f"unknown {e.args[0]}"})
+                return
+        elif self.path == "/rescore":
+            with METRICS.timer("daemon.rescore"):
+                response = self.server.recommender.reload()
+        else:
+            self._send_json(404, {"error": "not found"})
+            return
+        response["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        self._send_json(200, response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+def make_daemon_server(recommender: Recommender, host: str = "127.0.0.1", port: int = 8765,
+                       verbose: bool = False) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), RecommenderHandler)
+    server.daemon_threads = True
+    server.recommender = recommender
+    server.verbose = verbose
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve move method recommendations over HTTP with warm models")
+    parser.add_argument("--summaries", default=None,
+                        help="summaries written by llm_generator.py (default: llm_code_summaries.jsonl, or the legacy .json)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--watch-interval", type=float, default=2.0,
+                        help="seconds between checks of the summaries file (0: only reload on POST /rescore)")
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per SentenceTransformer/CodeBERT batch")
+    parser.add_argument("--embedding-store", default="embedding_store",
+                        help="directory of memory-mapped vectors reused across runs")
+    parser.add_argument("--no-embedding-store", action="store_true",
+                        help="do not read or write the store (vectors are only kept in memory between reloads)")
+    parser.add_argument("--embedding-store-max-rows", type=int, default=DEFAULT_MAX_ROWS,
+                        help="vectors kept per embedding space; past it, the oldest ones a reload did not use are "
+                             "dropped (0: no limit)")
+    parser.add_argument("--candidates", choices=["exhaustive", "pruned", "ann"], default=CANDIDATE_MODE,
+                        help="score every class, only the classes each method structurally depends on, or its "
+                             "semantically closest classes (see refactor_recommendation.py --candidates ann)")
+    parser.add_argument("--ann-k", type=int, default=ANN_TOP_K, help="classes kept per method with --candidates ann")
+    parser.add_argument("--ann-probes", type=int, default=ANN_PROBES,
+                        help="index lists searched per method with --candidates ann (more: better recall, slower)")
+    parser.add_argument("--ann-lists", type=int, default=None,
+                        help="index lists (default: square root of the class count)")
+    parser.add_argument("--code-embedding", choices=["truncated", "chunked"], default=CODE_EMBEDDING)
+    parser.add_argument("--fast-inference", choices=PRECISIONS, default="off",
+                        help="CPU inference with int8 dynamic quantization or bfloat16 weights (both models)")
+    parser.add_argument("--torch-threads", type=int, default=None, help="torch intra-op threads (default: all cores)")
+    parser.add_argument("--explain-top-k", type=int, default=5, help="candidates kept per method with \"explain\"")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    summaries_path = args.summaries or default_summaries_path()
+    if not os.path.exists(summaries_path):
+        sys.exit(f"{summaries_path} not found. Run llm_generator.py first")
+
+    models = LazyModels(precision=args.fast_inference, torch_threads=args.torch_threads)
+    # Warm both models now, so the first edit does not pay for loading them
+    models.prefetch("summary", "code")
+
+    summary_store = code_store = None
+    if not args.no_embedding_store:
+        try:
+            summary_store = EmbeddingStore(args.embedding_store, "summary", args.embedding_store_max_rows)
+            code_store = EmbeddingStore(args.embedding_store, "code", args.embedding_store_max_rows)
+        except EmbeddingStoreError as e:
+            sys.exit(str(e))
+
+    ann = {"top_k": args.ann_k, "probes": args.ann_probes, "lists": args.ann_lists}
+    recommender = Recommender(summaries_path, models, summary_store, code_store, args.candidates, args.code_embedding,
+                              args.batch_size, args.explain_top_k, ann)
+    recommender.reload(force=True)
+
+    stop = threading.Event()
+    if args.watch_interval > 0:
+        threading.Thread(target=watch_summaries, args=(recommender, args.watch_interval, stop), daemon=True).start()
+
+    server = make_daemon_server(recommender, args.host, args.port, args.verbose)
+    print(f"Recommender listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
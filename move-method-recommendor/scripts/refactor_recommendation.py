@@ -1,45 +1,63 @@
-import json, os, re, sys
+import argparse, contextlib, hashlib, io, json, multiprocessing, os, re, sys, tempfile, threading, time
 import numpy as np
 from collections import defaultdict
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from tabulate import tabulate
-from transformers import AutoTokenizer, AutoModel
-import torch
+
+from ann_index import IVFIndex
+from embedding_store import DEFAULT_MAX_ROWS, EmbeddingStore, EmbeddingStoreError, store_key
+from method_rules import is_getter_setter, is_interface, is_simple_delegate, rule_based_decisions
+from metrics import METRICS, enable_profiling
+from summary_records import default_summaries_path, iter_summary_records
 
 
 """
     Load and preprocess LLM-generated summaries for classes and methods.
 
+    Reads the JSONL records of llm_generator.py lazily, one line at a time (legacy llm_code_summaries.json
+    files are accepted too), so the whole document is never held in memory.
+
     Returns two structures:
-       - `classes`: mapping (class names) → { summary, package, body }
-       - `methods`: mapping (class_name, method_name) → { summary, …metadata }
+       - `classes`: mapping (class names) → { summary, package, body, fields, file }
+       - `methods`: mapping (class_name, method_name) → { summary, …metadata }; methods llm_generator left to the
+         structural rules have an empty summary and "decided_by": "rule"
 """
-def load_llm_summaries(path="llm_code_summaries.json"):
-    with open(path, encoding="utf-8") as file:
-        data = json.load(file)
-
-        classes, methods = {}, defaultdict(dict)
-        
-        # First pass: build cleaned summaries for classes and methods
-        for class_name, class_data in data.items():
+def load_llm_summaries(path=None):
+    classes, methods = {}, defaultdict(dict)
+    sources = {}  # file -> source code, kept only until the file's "done" record
+
+    for record in iter_summary_records(path or default_summaries_path()):
+        kind = record.get("type")
+
+        if kind == "source":
+            sources[record["file"]] = record.get("code", "")
+
+        elif kind == "class":
+            class_name = record["class"]
+            if class_name in classes:
+                # Same class name in another file : the last one wins, as with the old JSON dictionary
+                for key in [key for key in methods if key[0] == class_name]:
+                    del methods[key]
             classes[class_name] = {
-                "summary": summary_preprocessor(class_data["summary"]),
-                "package": class_data.get("package",""),
-                "classBody":class_data.get("classBody",""),
-                "classFields":class_data.get("classFields",[])
+                "summary": summary_preprocessor(record.get("summary") or ""),
+                "package": record.get("package",""),
+                "classBody": sources.get(record.get("file"), ""),
+                "classFields": record.get("classFields",[]),
+                "file": record.get("file")
             }
-            
-            for method_name, method_summary in class_data["methods"].items():
-                methods[(class_name,method_name)]["summary"] = summary_preprocessor(method_summary)
 
-        # Second pass: attach additional method metadata from “methods_meta”
-        for class_name, class_data in data.items():
-            for method_info in class_data.get("methods_meta",[]):
-                key = (class_name,method_info["name"])
-                methods[key].update(method_info)
+        elif kind == "method":
+            class_name = record["class"]
+            method_info = {key: value for key, value in record.items() if key not in ("type", "file", "class", "summary")}
+            # method metadata carries its class fields (shared with the class entry, not copied)
+            method_info["classFields"] = classes[class_name]["classFields"]
+            methods[(class_name, record["name"])] = {"summary": summary_preprocessor(record.get("summary") or ""),
+                                                     **method_info}
+
+        elif kind == "done":
+            sources.pop(record["file"], None)
 
-        return classes, methods
+    return classes, methods
 
 def summary_preprocessor(summary: str) -> str:
     """
@@ -57,52 +75,389 @@ def summary_preprocessor(summary: str) -> str:
         summary = re.sub(pattern, "", summary, flags=re.I)
     return " ".join(summary.split())
 
+def encode_sentences(texts, embedder, precision="off"):
+    """
+        SentenceTransformer vectors of a list of texts, as a float32 NumPy array (one row per text, one batch).
+        bf16 models (see LazyModels) return vectors numpy cannot hold: they come back as a tensor cast to float.
+    """
+    METRICS.count("summary_embedder.encode.texts", len(texts))
+    METRICS.count("summary_embedder.encode.chars", sum(len(text) for text in texts))
+    with METRICS.timer("summary_embedder.encode"):
+        if precision == "bf16":
+            return embedder.encode(texts, batch_size=len(texts), convert_to_tensor=True).float().cpu().numpy()
+        return embedder.encode(texts, batch_size=len(texts))
+
 def encode_codebert(code, tokenizer, model):
     """
         Generate vector representations for code snippets: 1. Tokenize the code. 2. Running through CodeBERT without gradients (just encoding not training).
         3. Extracte the [CLS] token embedding. 4. Return as a NumPy array.
     """
-    tokens = tokenizer(code, padding=True, truncation=True, return_tensors="pt")
-    with torch.no_grad():
-        outputs = model(**tokens)
-    return outputs.last_hidden_state[:, 0, :].cpu().numpy()   
+    import torch
 
-def is_interface(class_body: str) -> bool:
+    METRICS.count("encode_codebert.texts", len(code))
+    METRICS.count("encode_codebert.chars", sum(len(snippet) for snippet in code))
+    with METRICS.timer("encode_codebert"):
+        tokens = tokenizer(code, padding=True, truncation=True, return_tensors="pt")
+        with torch.no_grad():
+            outputs = model(**tokens)
+        # float() : bf16 models (see LazyModels) return hidden states numpy cannot hold
+        return outputs.last_hidden_state[:, 0, :].float().cpu().numpy()
+
+# CodeBERT reads 512 positions, two of them taken by <s> and </s>
+CODE_CHUNK_TOKENS = 510
+
+def encode_codebert_chunked(code, tokenizer, model, window=CODE_CHUNK_TOKENS, batch_size=32):
+    """
+        CodeBERT vectors for code snippets of any length, instead of truncating them at 512 tokens:
+        1. Split each snippet's tokens into windows of `window` tokens. 2. Encode all windows in batches (similar
+        lengths together). 3. Pool a snippet's window [CLS] vectors, weighted by window length.
+        A snippet that fits in one window gets the same vector as with encode_codebert.
+    """
+    import torch
+
+    windows, owners, weights = [], [], []
+    for owner, snippet in enumerate(code):
+        ids = tokenizer(snippet, add_special_tokens=False, verbose=False)["input_ids"]
+        for start in range(0, max(1, len(ids)), window):
+            piece = ids[start:start + window]
+            windows.append(tokenizer.build_inputs_with_special_tokens(piece))
+            owners.append(owner)
+            weights.append(max(1, len(piece)))
+
+    METRICS.count("encode_codebert.texts", len(code))
+    METRICS.count("encode_codebert.chars", sum(len(snippet) for snippet in code))
+    METRICS.count("encode_codebert.windows", len(windows))
+
+    vectors = None
+    order = sorted(range(len(windows)), key=lambda i: len(windows[i]))
+    with METRICS.timer("encode_codebert"):
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            tokens = tokenizer.pad({"input_ids": [windows[i] for i in rows]}, return_tensors="pt")
+            with torch.no_grad():
+                outputs = model(**tokens)
+            batch_vectors = outputs.last_hidden_state[:, 0, :].float().cpu().numpy()
+            if vectors is None:
+                vectors = np.empty((len(windows), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[rows] = batch_vectors
+
+    weights = np.asarray(weights, dtype=np.float32)
+    pooled = np.zeros((len(code), vectors.shape[1] if vectors is not None else 0), dtype=np.float32)
+    np.add.at(pooled, owners, vectors * weights[:, None])
+    return pooled / np.bincount(owners, weights=weights, minlength=len(code))[:, None].astype(np.float32)
+
+def encode_in_batches(texts, encode_batch, batch_size=32):
+    """
+        Encode a list of texts with `encode_batch` (list[str] -> 2D array) in batches of `batch_size`.
+        Texts are sorted by length first so each batch holds similar lengths (less padding), and the rows
+        are put back in input order in one contiguous float32 matrix.
     """
-        if the code is part of a java interface then return true (no move method for it as it is just a contract)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    matrix = None
+    for start in range(0, len(order), batch_size):
+        rows = order[start:start + batch_size]
+        vectors = np.asarray(encode_batch([texts[i] for i in rows]), dtype=np.float32)
+        if matrix is None:
+            matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+        matrix[rows] = vectors
+    return matrix if matrix is not None else np.empty((0, 0), dtype=np.float32)
+
+SUMMARY_MODEL_NAME = "all-MiniLM-L6-v2"
+CODE_MODEL_NAME = "microsoft/codebert-base"
+
+PRECISIONS = ("off", "int8", "bf16")
+
+def model_tag(model_name: str, precision: str = "off") -> str:
     """
-    lines = class_body.splitlines()
-    for line in lines:
-        if line.strip():
-            if re.search(r'\binterface\b', line, re.IGNORECASE):
-                return True
-            break
-    return False  
+        Model name used in embedding store keys: vectors of a reduced precision model are kept apart
+    """
+    return model_name if precision in (None, "off") else f"{model_name}@{precision}"
+
+_torch_settings_lock = threading.Lock()
+_torch_settings_applied = False
 
-def is_simple_delegate(method_meta):
+def configure_torch(threads=None, interop_threads=None):
     """
-     return True if the method is a one-line delegate (ie. a method having a single return or assignment statement)
+        Set torch's intra-op (per operation) and inter-op thread counts once per process, before the first model runs.
+        None leaves torch's default (one thread per core).
     """
-    if not method_meta:
-        return False
-    body = method_meta.get("methodBody","")
-    lines = [line.strip() for line in body.splitlines() if line.strip()]
-    return len(lines) == 1 and ("return" in lines[0] or "=" in lines[0] and ";" in lines[0])
+    global _torch_settings_applied
+    with _torch_settings_lock:
+        if _torch_settings_applied or not (threads or interop_threads):
+            return
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        if interop_threads:
+            torch.set_num_interop_threads(interop_threads)
+        _torch_settings_applied = True
+
+def reduce_precision(model, precision: str):
+    """
+        Fast CPU inference variant of a torch model: "int8" quantizes the weights of every Linear layer (dynamic
+        quantization, activations are quantized on the fly), "bf16" casts all weights to bfloat16.
+    """
+    import torch
 
-def is_getter_setter(method_meta, method_name):
+    if precision == "int8":
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if precision == "bf16":
+        return model.to(torch.bfloat16)
+    return model
+
+class LazyModels:
+    """
+        SentenceTransformer and CodeBERT, loaded on first use.
+
+        torch / transformers / sentence_transformers are only imported by the loaders, so a run whose vectors all
+        come from the embedding store never imports or loads them. `prefetch` loads several models in parallel
+        (background threads) before they are needed, `load` does the same and waits for them.
+
+        `precision` ("off", "int8", "bf16") is applied to both models once loaded, see reduce_precision.
+    """
+    def __init__(self, summary_model_name=SUMMARY_MODEL_NAME, code_model_name=CODE_MODEL_NAME, precision="off",
+                 torch_threads=None, torch_interop_threads=None):
+        self.summary_model_name = summary_model_name
+        self.code_model_name = code_model_name
+        self.precision = precision or "off"
+        self.torch_threads = torch_threads
+        self.torch_interop_threads = torch_interop_threads
+        self._loaders = {"summary": self._load_summary_model, "code": self._load_code_model}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(self._loaders), thread_name_prefix="model-loader")
+
+    def _load_summary_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        # Load class/method summary and transform it into a fixed length embedding vector
+        # Dynamically quantized layers only run on the CPU
+        device = "cpu" if self.precision == "int8" else None
+        return reduce_precision(SentenceTransformer(self.summary_model_name, device=device), self.precision)
+
+    def _load_code_model(self):
+        from transformers import AutoTokenizer, AutoModel
+
+        # Intialize tokenizer to split the source code into subword tokens
+        code_tokenizer = AutoTokenizer.from_pretrained(self.code_model_name)
+
+        # Load pretrained tranformer encoder and pass tokenized code to prodice embeddings
+        code_model = AutoModel.from_pretrained(self.code_model_name)
+        return code_tokenizer, reduce_precision(code_model, self.precision)
+
+    def _timed_load(self, name):
+        configure_torch(self.torch_threads, self.torch_interop_threads)
+        with METRICS.timer(f"load {name} model"):
+            return self._loaders[name]()
+
+    def _future(self, name):
+        with self._lock:
+            if name not in self._futures:
+                self._futures[name] = self._pool.submit(self._timed_load, name)
+            return self._futures[name]
+
+    def prefetch(self, *names):
+        for name in names:
+            self._future(name)
+
+    def load(self, *names):
+        """
+            Load the given models ("summary", "code") now, in parallel, and wait for them
+        """
+        self.prefetch(*names)
+        for name in names:
+            self._future(name).result()
+
+    def loaded(self, name) -> bool:
+        return name in self._futures
+
+    @property
+    def summary_embedder(self):
+        return self._future("summary").result()
+
+    @property
+    def code_tokenizer(self):
+        return self._future("code").result()[0]
+
+    @property
+    def code_model(self):
+        return self._future("code").result()[1]
+
+def embed_texts(texts, encode_batch, batch_size=32, store=None, keys=None):
     """
-     Checks if a method is a simple getter or setter with only one line of code.
+        Encode texts in batches; with an EmbeddingStore, only the texts whose key has no stored vector are encoded
+        (the new vectors are added to the store) and the rest is read from the memory-mapped store.
     """
+    if store is None:
+        return encode_in_batches(texts, encode_batch, batch_size)
 
-    GETTER_SETTER_PATTERN = re.compile(r"^(get|set|is)[A-Z].*")
+    rows = store.lookup(keys)
+    missing = np.flatnonzero(rows < 0)
+    store.reused += len(keys) - len(missing)
+    store.encoded += len(missing)
+    if len(missing):
+        store.add([keys[i] for i in missing], encode_in_batches([texts[i] for i in missing], encode_batch, batch_size))
+        rows = store.lookup(keys)
+    return store.take(rows)
 
-    if not GETTER_SETTER_PATTERN.match(method_name):
-        return False
-    body = method_meta.get("methodBody","")
-    lines = [l.strip() for l in body.splitlines() if l.strip() not in ["{", "}"]]
-    return len(lines) == 1 and ("return" in lines[0] or "=" in lines[0])
+CODE_EMBEDDING = "truncated"
 
-def structural_candidates(method_meta, all_classes):
+def code_model_tag(code_embedding=None, precision="off") -> str:
+    """
+        Model name used in the embedding store keys of code vectors, so both code embedding modes never share vectors
+    """
+    if (code_embedding or CODE_EMBEDDING) == "chunked":
+        return model_tag(f"{CODE_MODEL_NAME}/chunked-{CODE_CHUNK_TOKENS}", precision)
+    return model_tag(CODE_MODEL_NAME, precision)
+
+def embed_classes_and_methods(classes, methods, models, batch_size=32, summary_store=None, code_store=None,
+                              code_embedding=None, all_methods=None):
+    """
+        Embed every class and method summary (SentenceTransformer) and code body (CodeBERT, first 384 dims) in batches.
+        With embedding stores (embedding_store.EmbeddingStore), vectors of unchanged texts are reused from disk, and
+        a model of `models` (LazyModels) is only loaded when some of its vectors are missing.
+
+        code_embedding "truncated" encodes class bodies and method bodies as they are (cut at 512 tokens).
+        "chunked" encodes method bodies with encode_codebert_chunked and builds a class code vector as the mean
+        of its methods' code vectors (over all_methods, every method of the classes, when `methods` is a subset),
+        so class bodies are no longer run through CodeBERT; only classes without methods encode their body.
+
+        Returns a dict of contiguous matrices and the row index of each class / (class, method):
+            class_index, class_summary, class_code, method_index, method_summary, method_code
+    """
+    code_embedding = code_embedding or CODE_EMBEDDING
+
+    def encode_summaries(batch):
+        return encode_sentences(batch, models.summary_embedder, models.precision)
+
+    def encode_code(batch):
+        tokenizer, model = models.code_tokenizer, models.code_model
+        if code_embedding == "chunked":
+            return encode_codebert_chunked(batch, tokenizer, model, batch_size=batch_size)[:, :384]
+        return encode_codebert(batch, tokenizer, model)[:, :384]
+
+    class_names = list(classes)
+    method_keys = list(methods)
+    code_model_name = code_model_tag(code_embedding, models.precision)
+    summary_model_name = model_tag(SUMMARY_MODEL_NAME, models.precision)
+
+    def keys(names, texts, model_name):
+        return [store_key(*(name if isinstance(name, tuple) else (name, "")), text, model_name)
+                for name, text in zip(names, texts)]
+
+    # Classes and methods whose code is encoded; in chunked mode a class code vector is pooled from its methods
+    code_classes, code_methods, class_code_methods = class_names, method_keys, None
+    if code_embedding == "chunked":
+        all_methods = all_methods if all_methods is not None else methods
+        class_code_methods = defaultdict(list)
+        for key in all_methods:
+            if key[0] in classes:
+                class_code_methods[key[0]].append(key)
+        code_classes = [c for c in class_names if not class_code_methods[c]]
+        code_methods = list(dict.fromkeys(method_keys + [key for c in class_names for key in class_code_methods[c]]))
+
+    def method_body(key):
+        return (methods[key] if key in methods else all_methods[key]).get("methodBody", "")
+
+    class_summaries = [classes[c]["summary"] for c in class_names]
+    class_bodies = [classes[c].get("classBody") or "" for c in code_classes]
+    method_summaries = [methods[k].get("summary", "") for k in method_keys]
+    method_bodies = [method_body(k) for k in code_methods]
+
+    groups = {
+        "class_summary": (class_summaries, "summary", summary_store, keys(class_names, class_summaries, summary_model_name)),
+        "class_code": (class_bodies, "code", code_store, keys(code_classes, class_bodies, code_model_name)),
+        "method_summary": (method_summaries, "summary", summary_store, keys(method_keys, method_summaries, summary_model_name)),
+        "method_code": (method_bodies, "code", code_store, keys(code_methods, method_bodies, code_model_name)),
+    }
+
+    # Start loading (in parallel) only the models that have vectors to compute
+    needed_models = {model for texts, model, store, group_keys in groups.values()
+                     if texts and (store is None or (store.lookup(group_keys) < 0).any())}
+    models.prefetch(*sorted(needed_models))
+
+    embeddings = {
+        "class_index": {cls: row for row, cls in enumerate(class_names)},
+        "method_index": {key: row for row, key in enumerate(method_keys)},
+    }
+    for name, (texts, model, store, group_keys) in groups.items():
+        encode_batch = encode_summaries if model == "summary" else encode_code
+        embeddings[name] = embed_texts(texts, encode_batch, batch_size, store, group_keys)
+
+    if class_code_methods is not None:
+        code_rows = {key: row for row, key in enumerate(code_methods)}
+        method_code = embeddings["method_code"]
+        body_rows = {cls: row for row, cls in enumerate(code_classes)}
+        class_code = np.empty((len(class_names), method_code.shape[1] if len(method_code) else 384), dtype=np.float32)
+        for row, cls in enumerate(class_names):
+            if class_code_methods[cls]:
+                class_code[row] = method_code[[code_rows[key] for key in class_code_methods[cls]]].mean(axis=0)
+            else:
+                class_code[row] = embeddings["class_code"][body_rows[cls]]
+        embeddings["class_code"] = class_code
+        embeddings["method_code"] = method_code[[code_rows[key] for key in method_keys]]
+    return embeddings
+
+def verify_batched_embeddings(embeddings, classes, methods, models, sample_size=8, atol=1e-3, code_embedding=None):
+    """
+        Re-encode a few methods one at a time (the original batch size 1 path) and report the largest difference
+        with the batched vectors. Returns True when every sampled vector matches within `atol`.
+        Uses the encoders of embed_classes_and_methods, so reduced precision models are checked the same way.
+        Methods decided by rules when summarizing have no summary to compare and are not sampled.
+    """
+    worst = 0.0
+    for key in [key for key, method_meta in methods.items() if method_meta.get("decided_by") != "rule"][:sample_size]:
+        row = embeddings["method_index"][key]
+        summary_vector = encode_sentences([methods[key].get("summary", "")], models.summary_embedder, models.precision)[0]
+        encode = encode_codebert_chunked if (code_embedding or CODE_EMBEDDING) == "chunked" else encode_codebert
+        code_vector = encode([methods[key].get("methodBody", "")], models.code_tokenizer, models.code_model)[0][:384]
+        worst = max(worst,
+                    float(np.max(np.abs(summary_vector - embeddings["method_summary"][row]))),
+                    float(np.max(np.abs(code_vector - embeddings["method_code"][row]))))
+    print(f"Batched vs single embedding max abs difference: {worst:.2e} (tolerance {atol:.0e})")
+    return worst <= atol
+
+# "exhaustive" scores every method against every class, "pruned" only against the classes it structurally depends on
+CANDIDATE_MODE = "exhaustive"
+
+TYPE_NAME_PATTERN = re.compile(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*")
+NON_TYPE_WORDS = {"extends", "super", "final"}
+
+def type_names(type_string: str) -> list:
+    """
+    Split a declared java type into the type names it mentions, generics and array brackets stripped:
+    'Map<String, List<Order>>' -> ['Map', 'String', 'List', 'Order'], 'Order[]' -> ['Order']
+    """
+    return [name for name in TYPE_NAME_PATTERN.findall(type_string or "") if name not in NON_TYPE_WORDS]
+
+def build_class_name_index(all_classes):
+    """
+    Exact lookup table for structural_candidates:
+      - "names": simple and package-qualified class name -> class key in `all_classes`
+      - "order": class key -> position in `all_classes` (candidates keep the class order)
+    """
+    names, order = {}, {}
+    for position, class_name in enumerate(all_classes):
+        order[class_name] = position
+        names.setdefault(class_name, class_name)
+        package = all_classes[class_name].get("package", "") if isinstance(all_classes, dict) else ""
+        if package:
+            names[f"{package}.{class_name}"] = class_name
+    return {"names": names, "order": order}
+
+def resolve_class_name(type_name: str, class_name_index):
+    """
+    Exact match on the simple or qualified name; 'com.shop.Order' or 'Outer.Order' fall back to their last segment
+    """
+    names = class_name_index["names"]
+    if type_name in names:
+        return names[type_name]
+    if "." in type_name:
+        return names.get(type_name.rsplit(".", 1)[1])
+    return None
+
+def structural_candidates(method_meta, all_classes, mode=None, class_name_index=None, source_class=None):
     """
     Identifies candidate classes that are structurally related to the given method.
     It uses:
@@ -110,10 +465,16 @@ def structural_candidates(method_meta, all_classes):
     - Method call targets
     - Field access targets
 
-    If none are matched, returns all classes.
+    In "exhaustive" mode (CANDIDATE_MODE default) every class is a candidate. In "pruned" mode the types above are
+    matched exactly against a class name index (build_class_name_index) and the method's own class is always kept.
+    If nothing matches and no source class is given, returns all classes.
     """
-    if not method_meta:
+    mode = mode or CANDIDATE_MODE
+    if not method_meta or mode == "exhaustive":
         return list(all_classes)
+
+    if class_name_index is None:
+        class_name_index = build_class_name_index(all_classes)
     
     possible_candidate_class_filters = set()
 
@@ -146,226 +507,586 @@ def structural_candidates(method_meta, all_classes):
         if obj_name in field_name_to_type:
             possible_candidate_class_filters.add(field_name_to_type[obj_name])
 
-    # 6. Match filters to actual class names
-    candidate_classes = []
-    for class_name in all_classes:
-        for possible_type_filter in possible_candidate_class_filters:
-            if possible_type_filter in class_name:
-                candidate_classes.append(class_name)
-                break  # Avoid duplicates
+    # 6. Match the filters (generics stripped) exactly against the class name index
+    candidate_classes = set()
+    if source_class in class_name_index["order"]:
+        candidate_classes.add(source_class)
+    for possible_type_filter in possible_candidate_class_filters:
+        for type_name in type_names(possible_type_filter):
+            class_name = resolve_class_name(type_name, class_name_index)
+            if class_name is not None:
+                candidate_classes.add(class_name)
+
+    # 7. Return the filtered candidates in class order, or fallback to all
+    if not candidate_classes:
+        return list(all_classes)
+    return sorted(candidate_classes, key=class_name_index["order"].__getitem__)
 
-    # 7. Return the filtered candidates, or fallback to all
-#    return candidate_classes or list(all_classes)
-    return list(all_classes)
+SAME_PKG_BONUS     = 0.10
+FIELD_ACCESS_BONUS = 0.10
+# Cohesion bonus per setter access, getter access and other call on a field of the candidate's type
+COHESION_WRITE_BONUS = 0.05
+COHESION_READ_BONUS  = 0.01
+COHESION_CALL_BONUS  = 0.05
+# Bonus when the method uses the candidate class at all (calls or field accesses through a field of its type)
+USES_BONUS = 0.05
 
 def same_package_bonus(source_class_package:str, candidate_class_package:str) -> float:
     """
     Return a bonus if both classes belong to the same package.
     """
-    SAME_PKG_BONUS     = 0.10
     return SAME_PKG_BONUS if source_class_package == candidate_class_package and source_class_package else 0.0
 
-def field_bonus(method_metadata, candiate_class):
+GETTER_CALL_PATTERN = re.compile(r"^get[A-Z].*")
+SETTER_CALL_PATTERN = re.compile(r"^set[A-Z].*")
+
+def build_method_features(method_meta, source_class_fields=None):
     """
-     Return a bonus if the method accesses any field that belongs to the target candidate class.
+    One pass over a method's calls and field accesses, done once per method instead of once per candidate class.
+
+    Returns a compact record:
+      - "targets": field type -> (reads, writes, calls, accesses) made through fields of that type
+                   (object names resolved with the method's own `classFields`)
+      - "used_classes": field types the method reaches through calls or field accesses
+                   (object names resolved with `source_class_fields`, the method's class fields by default)
     """
-    FIELD_ACCESS_BONUS = 0.10
+    if not method_meta:
+        return {"targets": {}, "used_classes": frozenset()}
 
-    if not method_metadata:
-        return 0.0
-    
-    field_accesses = method_metadata.get("methodFieldAccess")
-    class_fields = method_metadata.get("classFields", [])
+    field_type_map = {field["var_name"]: field["var_type"] for field in method_meta.get("classFields", [])}
+    if source_class_fields is None:
+        used_type_map = field_type_map
+    else:
+        used_type_map = {field["var_name"]: field["var_type"] for field in source_class_fields}
 
-    # Map object name to its type
-    object_type_map = {field["var_name"]: field["var_type"] for field in class_fields}
+    counts = defaultdict(lambda: [0, 0, 0, 0])
+    used_classes = set()
 
-    for field_access in field_accesses:
+    for field_access in method_meta.get("methodFieldAccess") or []:
         if "." in field_access:
-            object_name = field_access.split(".")[0]
-            if object_type_map.get(object_name) == candiate_class:
-                return FIELD_ACCESS_BONUS
-    return 0.0
+            object_name, access_type = field_access.split(".", 1)
+            object_type = field_type_map.get(object_name)
+            if object_type is not None:
+                target = counts[object_type]
+                if SETTER_CALL_PATTERN.match(access_type):
+                    target[1] += 1
+                elif GETTER_CALL_PATTERN.match(access_type):
+                    target[0] += 1
+                target[3] += 1
+            if used_type_map.get(object_name):
+                used_classes.add(used_type_map[object_name])
 
-def cohesion_bonus(method_metadata, candiate_class, method_name=None):
+    for call in method_meta.get("methodCalls", []):
+        if "." in call:
+            object_name = call.split(".", 1)[0]
+            object_type = field_type_map.get(object_name)
+            if object_type is not None:
+                counts[object_type][2] += 1
+            if used_type_map.get(object_name):
+                used_classes.add(used_type_map[object_name])
+
+    return {
+        "targets": {object_type: tuple(target) for object_type, target in counts.items()},
+        "used_classes": frozenset(used_classes),
+    }
+
+def build_feature_index(methods, classes):
     """
-     Return a bonus based on how much a method interact with a particular candidate class
+    Feature record (see build_method_features) for every (class, method), resolved against its class fields
     """
+    return {
+        (cls_name, method_name): build_method_features(method_meta, classes[cls_name].get("classFields", []))
+        for (cls_name, method_name), method_meta in methods.items()
+    }
 
-    if not method_metadata:
-        return 0.0
-    
-    # Check if the method invokes the setter methods of the candidate class
-    class_fields = method_metadata.get("classFields", [])
-    field_type_map = {field["var_name"]: field["var_type"] for field in class_fields}
+def field_bonus_from_features(features, candiate_class):
+    target = features["targets"].get(candiate_class)
+    return FIELD_ACCESS_BONUS if target and target[3] else 0.0
 
-    write_calls = 0
-    read_calls = 0
+def cohesion_bonus_from_features(features, candiate_class):
+    target = features["targets"].get(candiate_class)
+    if not target:
+        return 0.0
+    read_calls, write_calls, external_calls, _ = target
+    return (COHESION_WRITE_BONUS * write_calls) + (COHESION_READ_BONUS * read_calls) + (COHESION_CALL_BONUS * external_calls)
 
-    for field_access in method_metadata.get("methodFieldAccess", []):
-        if "." in field_access:
-            object_name, access_type = field_access.split(".", 1)
-            object_type = field_type_map.get(object_name)
-            if object_type == candiate_class:
-                if re.match(r"^set[A-Z].*", access_type):
-                    write_calls += 1
-                elif re.match(r"^get[A-Z].*", access_type):
-                    read_calls += 1
-
-    external_calls = 0
-    for call in method_metadata.get("methodCalls", []):
-        if "." in call:
-            object_name, _ = call.split(".", 1)
-            object_type = field_type_map.get(object_name)
-            if object_type == candiate_class:
-                external_calls += 1
+def field_bonus(method_metadata, candiate_class):
+    """
+     Return a bonus if the method accesses any field that belongs to the target candidate class.
+    """
+    if not method_metadata:
+        return 0.0
+    return field_bonus_from_features(build_method_features(method_metadata), candiate_class)
 
-    bonus = (0.05 * write_calls) + (0.01 * read_calls) + (0.05 * external_calls)
-    
-    return bonus
+def cohesion_bonus(method_metadata, candiate_class, method_name=None):
+    """
+     Return a bonus based on how much a method interact with a particular candidate class
+     (0.05 per setter access and per call on a field of that type, 0.01 per getter access)
+    """
+    if not method_metadata:
+        return 0.0
+    return cohesion_bonus_from_features(build_method_features(method_metadata), candiate_class)
 
 def extract_method_used_classes(method_meta, class_field_map):
     """
     Returns a set of class names/types that the method depends on, based on:
-    - parameters
     - method calls on known field objects
     - field accesses on known field objects
     """
-    used_classes = set()
-
-    # Use parameter types directly
-#    used_classes.update(method_meta.get("parameters", []))
+    return set(build_method_features(method_meta, class_field_map)["used_classes"])
 
-    # Map field names → types
-    field_type_map = {f["var_name"]: f["var_type"] for f in class_field_map}
+MOVE_THRESHOLD = 0.75
+# final = BASE_FACTOR * (SUMMARY_WEIGHT * summary similarity + CODE_WEIGHT * code similarity) + bonuses
+SUMMARY_WEIGHT = 0.50
+CODE_WEIGHT = 0.50
+BASE_FACTOR = 0.8
 
-    # methodCalls like: objectName.methodCall
-    for call in method_meta.get("methodCalls", []):
-        if "." in call:
-            object_name = call.split(".")[0]
-            class_type = field_type_map.get(object_name)
-            if class_type:
-                used_classes.add(class_type)
-
-    # methodFieldAccess like: objectName.fieldAccess
-    for access in method_meta.get("methodFieldAccess", []):
-        if "." in access:
-            object_name = access.split(".")[0]
-            class_type = field_type_map.get(object_name)
-            if class_type:
-                used_classes.add(class_type)
+def normalize_rows(matrix):
+    """
+        Scale every row to unit length so a matrix product gives cosine similarities.
+        Zero rows stay zero (similarity 0), as with sklearn's cosine_similarity.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
 
-    return used_classes
+def structural_bonus_entries(features, class_index):
+    """
+        Field, cohesion and uses bonuses are only non zero for classes the method reaches through its class fields,
+        so they are returned sparsely as {class_row: (field_bonus, cohesion_bonus, uses_bonus)}
+    """
+    entries = {}
+    used_classes = features["used_classes"]
+    for candidate_class in (features["targets"].keys() | used_classes) & class_index.keys():
+        entries[class_index[candidate_class]] = (
+            field_bonus_from_features(features, candidate_class),
+            cohesion_bonus_from_features(features, candidate_class),
+            USES_BONUS if candidate_class in used_classes else 0.0,
+        )
+    return entries
+
+def candidate_components(summary_sim, code_sim, package_bonus, field_bonus_scores, cohesion_bonus_scores, uses_bonus_scores):
+    """
+        Final candidate scores from the similarity and bonus arrays: 0.8 * (0.50 * summary + 0.50 * code) + bonus
+        (BASE_FACTOR, SUMMARY_WEIGHT and CODE_WEIGHT)
+    """
+    base_score = SUMMARY_WEIGHT * summary_sim + CODE_WEIGHT * code_sim
+    bonus = package_bonus + field_bonus_scores + cohesion_bonus_scores + uses_bonus_scores
+    return {
+        "summary": summary_sim,
+        "code": code_sim,
+        "package": package_bonus,
+        "field": field_bonus_scores,
+        "cohesion": cohesion_bonus_scores,
+        "uses": uses_bonus_scores,
+        "final": (BASE_FACTOR * base_score) + bonus.astype(np.float32),
+    }
 
-if __name__ == "__main__":
-    
-    if not os.path.exists("llm_code_summaries.json"):
-        sys.exit("llm_code_summaries.json not found. Run llm_generator.py first")
-    
-    classes, methods = load_llm_summaries()
-    print(f"Loaded {len(classes)} classes, {len(methods)} methods")
+def scoring_block_size(class_count, block_size=256):
+    # Keep a block's dense matrices around a few million cells, whatever the class count
+    return max(1, min(block_size, (1 << 22) // max(1, class_count)))
 
-    print("Embedding summaries and code ...")
+# --candidates ann : semantically closest classes kept per method, and IVF lists probed per query (see ann_index)
+ANN_TOP_K = 20
+ANN_PROBES = 16
 
-    # Load class/method summary and transform it into a fixed length embedding vector
-    summary_embedder = SentenceTransformer("all-MiniLM-L6-v2")
+def ann_settings(ann=None) -> dict:
+    """
+        ANN options with their defaults: {"top_k", "probes", "lists"} (lists None: sqrt of the class count)
+    """
+    return {"top_k": ANN_TOP_K, "probes": ANN_PROBES, "lists": None, **(ann or {})}
 
-    # Intialize tokenizer to split the source code into subword tokens
-    code_tokenizer = AutoTokenizer.from_pretrained("microsoft/codebert-base")
+def ann_candidate_rows(index, method_summary, method_code, top_k, probes, source_rows):
+    """
+        Class rows scored for each method in ann mode: its top_k semantically closest classes (approximate) plus its
+        own class, in class order like the other modes (so ties resolve the same way)
+    """
+    found = index.search(0.5 * np.hstack([method_summary, method_code]), top_k, probes)
+    return [np.union1d(rows, [source]).astype(np.intp) for rows, source in zip(found, source_rows)]
 
-    # Load pretrained tranformer encoder and pass tokenized code to prodice embeddings
-    code_model = AutoModel.from_pretrained("microsoft/codebert-base")
+def build_ann_index(embeddings, ann=None):
+    """
+        IVF index over the [summary | code] class vectors of `embeddings`, as searched by --candidates ann.
+        Callers scoring many times with the same class vectors (the daemon) keep it in embeddings["ann_index"],
+        so score_methods does not run k-means again.
+    """
+    with METRICS.timer("ann.build"):
+        return IVFIndex(ann_class_vectors(embeddings), ann_settings(ann)["lists"])
 
-    class_vectors = {}
-    for cls, info in classes.items():
-        summary_vector = summary_embedder.encode(info["summary"])
-        code_vector = encode_codebert([info.get("classBody")], code_tokenizer, code_model)[0]
-        class_vectors[cls] = {
-                                "summary_vec": summary_vector,
-                                "code_vec": code_vector[:384]
-                            }
+def ann_class_vectors(embeddings):
+    return np.hstack([normalize_rows(embeddings["class_summary"]), normalize_rows(embeddings["class_code"])])
 
+def score_methods(method_keys, methods, classes, embeddings, block_size=256, features=None, candidate_mode=None,
+                  ann=None):
+    """
+        Score methods against their candidate classes with matrix operations instead of per pair cosine_similarity calls.
+
+        Exhaustive mode, for a block of methods: one matrix product each for summary and code similarity
+        (pre-normalized vectors), a dense same-package bonus matrix and sparse field/cohesion/uses bonuses.
+        Pruned mode: the same computations restricted to each method's structural candidates, so the cost follows
+        the method's dependencies instead of the class count.
+        Ann mode: an IVF index (ann_index.IVFIndex) over the [summary | code] class vectors gives each method its
+        `ann` top_k semantically closest classes; only those and the method's own class are scored, bonuses included.
+        The index is embeddings["ann_index"] when present (see build_ann_index), built here otherwise.
+
+        Yields (method_key, candidate_classes, components) per method in input order, where components maps
+        summary, code, package, field, cohesion, uses and final to arrays aligned with candidate_classes.
+        `features` is the build_feature_index output; it is built here when not given.
+    """
+    candidate_mode = candidate_mode or CANDIDATE_MODE
+    if features is None:
+        features = build_feature_index(methods, classes)
+
+    class_index = embeddings["class_index"]
+    class_names = list(class_index)
+    class_summary = normalize_rows(embeddings["class_summary"])
+    class_code = normalize_rows(embeddings["class_code"])
+
+    # Same package bonus as a comparison of integer package ids ("" never earns the bonus)
+    package_ids = {}
+    class_package = np.array([package_ids.setdefault(classes[c]["package"], len(package_ids)) for c in class_names])
+    empty_package = package_ids.get("", -1)
+
+    def package_bonus_for(source_packages, candidate_packages):
+        return np.where((source_packages == candidate_packages) & (source_packages != empty_package), SAME_PKG_BONUS, 0.0)
+
+    if candidate_mode == "pruned":
+        class_name_index = build_class_name_index(classes)
+        for key in method_keys:
+            candidates = structural_candidates(methods[key], classes, "pruned", class_name_index, key[0])
+            columns = np.array([class_index[c] for c in candidates], dtype=np.intp)
+            row = embeddings["method_index"][key]
+
+            summary_sim = class_summary[columns] @ normalize_rows(embeddings["method_summary"][[row]])[0]
+            code_sim = class_code[columns] @ normalize_rows(embeddings["method_code"][[row]])[0]
+            package_bonus = package_bonus_for(package_ids[classes[key[0]]["package"]], class_package[columns])
+
+            structural = np.zeros((3, len(columns)))
+            positions = {column: i for i, column in enumerate(columns.tolist())}
+            for column, scores in structural_bonus_entries(features[key], class_index).items():
+                if column in positions:
+                    structural[:, positions[column]] = scores
+
+            yield key, candidates, candidate_components(summary_sim, code_sim, package_bonus, *structural)
+        return
+
+    block_size = scoring_block_size(len(class_names), block_size)
+
+    if candidate_mode == "ann":
+        ann = ann_settings(ann)
+        index = embeddings.get("ann_index")
+        if index is None:
+            index = build_ann_index(embeddings, ann)
+        for start in range(0, len(method_keys), block_size):
+            block = method_keys[start:start + block_size]
+            rows = [embeddings["method_index"][key] for key in block]
+            method_summary = normalize_rows(embeddings["method_summary"][rows])
+            method_code = normalize_rows(embeddings["method_code"][rows])
+            with METRICS.timer("ann.search"):
+                candidate_rows = ann_candidate_rows(index, method_summary, method_code, ann["top_k"], ann["probes"],
+                                                    [class_index[cls_name] for cls_name, _ in block])
+
+            for i, (key, columns) in enumerate(zip(block, candidate_rows)):
+                summary_sim = class_summary[columns] @ method_summary[i]
+                code_sim = class_code[columns] @ method_code[i]
+                package_bonus = package_bonus_for(package_ids[classes[key[0]]["package"]], class_package[columns])
+
+                structural = np.zeros((3, len(columns)))
+                positions = {column: j for j, column in enumerate(columns.tolist())}
+                for column, scores in structural_bonus_entries(features[key], class_index).items():
+                    if column in positions:
+                        structural[:, positions[column]] = scores
+
+                yield key, [class_names[c] for c in columns], candidate_components(summary_sim, code_sim, package_bonus,
+                                                                                   *structural)
+        return
+
+    for start in range(0, len(method_keys), block_size):
+        block = method_keys[start:start + block_size]
+        rows = [embeddings["method_index"][key] for key in block]
+
+        summary_sim = normalize_rows(embeddings["method_summary"][rows]) @ class_summary.T
+        code_sim = normalize_rows(embeddings["method_code"][rows]) @ class_code.T
+
+        source_package = np.array([package_ids[classes[cls_name]["package"]] for cls_name, _ in block])
+        package_bonus = package_bonus_for(source_package[:, None], class_package[None, :])
+
+        structural = np.zeros((3,) + package_bonus.shape)
+        for i, key in enumerate(block):
+            for column, scores in structural_bonus_entries(features[key], class_index).items():
+                structural[:, i, column] = scores
+
+        for i, key in enumerate(block):
+            candidates = structural_candidates(methods[key], classes)
+            if len(candidates) == len(class_names):
+                columns = slice(None)
+            else:
+                columns = [class_index[c] for c in candidates]
+            yield key, candidates, candidate_components(summary_sim[i, columns], code_sim[i, columns],
+                                                        package_bonus[i, columns],
+                                                        *(structural[:, i, columns]))
+
+def pick_best_class(cls_name, candidates, final_scores):
+    """
+        Highest scoring candidate (first one on ties, like the previous strictly-greater loop) and the resulting action
+    """
+    best_cls, best_score = cls_name, -1.0
+    if len(candidates):
+        best = int(np.argmax(final_scores))
+        if final_scores[best] > best_score:
+            best_cls, best_score = candidates[best], final_scores[best]
+
+    if best_cls == cls_name:
+        action = "KEEP"
+    elif best_score >= MOVE_THRESHOLD:
+        action = f"MOVE to {best_cls}"
+    else:
+        action = "EXTRACT to new class"
+    return best_cls, best_score, action
+
+COMPONENTS = ("summary", "code", "package", "field", "cohesion", "uses", "final")
+
+def top_candidates(final_scores, k):
+    """
+        Positions of the k highest final scores, best first (lowest position first on ties, as pick_best_class)
+    """
+    k = min(k, len(final_scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-final_scores, k - 1)[:k] if k < len(final_scores) else np.arange(len(final_scores))
+    return top[np.lexsort((top, -final_scores[top]))]
 
-    method_vectors = {}
-    for (cls, method_name), info in methods.items():
-        summary_vector = summary_embedder.encode(info["summary"])
-        code_vector = encode_codebert([info.get("methodBody", "")], code_tokenizer, code_model)[0]
-        method_vectors[(cls, method_name)] = {
-                                                "summary_vec": summary_vector,
-                                                "code_vec": code_vector[:384]
-                                            }
+def explain_record(key, candidates, scores, decision, top_k=5):
+    """
+        Compact explanation of one scored method: the decision, then the top-k candidates and the same-class
+        candidate as columns (one list per score component, aligned with "candidates")
+    """
+    cls_name, method_name = key
+    action, best_cls, best_score = decision
+    top = top_candidates(scores["final"], top_k)
+
+    record = {
+        "class": cls_name,
+        "method": method_name,
+        "action": action,
+        "best_class": best_cls,
+        "score": round(best_score, 4),
+        "candidate_count": len(candidates),
+        "candidates": [candidates[i] for i in top],
+    }
+    for name in COMPONENTS:
+        record[name] = [round(float(value), 4) for value in scores[name][top]]
 
-    interface_classes = set()
+    if cls_name in candidates:
+        own = candidates.index(cls_name)
+        record["current"] = {name: round(float(scores[name][own]), 4) for name in COMPONENTS}
+    return record
 
-    for class_name, info in classes.items():
-        class_body = info.get("classBody", "")
-        if is_interface(class_body):
-            interface_classes.add(class_name)
+# Raw inputs of a candidate's final score, as saved by --save-components (see raw_components and weight_sweep.py)
+COMPONENT_COLUMNS = ("summary", "code", "same_package", "field_access", "read_calls", "write_calls", "external_calls",
+                     "uses")
 
-    if len(interface_classes) != 0 :
-        print(f'Interfaces found : {interface_classes}')
+def raw_components(key, candidates, scores, classes, features):
+    """
+        One row of COMPONENT_COLUMNS per candidate: the two similarities and the unweighted structural facts the
+        bonuses are made of, so any weights can be applied afterwards (same_package, field_access and uses are 0/1)
+    """
+    rows = np.zeros((len(candidates), len(COMPONENT_COLUMNS)), dtype=np.float32)
+    rows[:, 0] = scores["summary"]
+    rows[:, 1] = scores["code"]
+    source_package = classes[key[0]]["package"]
+    rows[:, 2] = [bool(source_package) and classes[c]["package"] == source_package for c in candidates]
+
+    positions = {c: i for i, c in enumerate(candidates)}
+    for candidate_class, (read_calls, write_calls, external_calls, field_access) in features["targets"].items():
+        if candidate_class in positions:
+            rows[positions[candidate_class], 3:7] = (bool(field_access), read_calls, write_calls, external_calls)
+    for candidate_class in features["used_classes"]:
+        if candidate_class in positions:
+            rows[positions[candidate_class], 7] = 1.0
+    return rows
+
+def save_components(path, components, recommendations):
+    """
+        Write the raw_components of every scored method (collected by score_decisions) with the actions of the
+        methods decided by the rules, as a compressed .npz file for weight_sweep.py
+    """
+    scored = {key for key, _, _ in components}
+    fixed = [r for r in recommendations if (r["current_class"], r["method"]) not in scored]
+    np.savez_compressed(
+        path,
+        columns=np.array(COMPONENT_COLUMNS),
+        method_class=np.array([key[0] for key, _, _ in components], dtype=str),
+        method_name=np.array([key[1] for key, _, _ in components], dtype=str),
+        offsets=np.cumsum([0] + [len(candidates) for _, candidates, _ in components]),
+        candidates=np.array([c for _, candidates, _ in components for c in candidates], dtype=str),
+        rows=(np.concatenate([rows for _, _, rows in components]) if components
+              else np.zeros((0, len(COMPONENT_COLUMNS)), dtype=np.float32)),
+        rule_class=np.array([r["current_class"] for r in fixed], dtype=str),
+        rule_method=np.array([r["method"] for r in fixed], dtype=str),
+        rule_action=np.array([r["action"] for r in fixed], dtype=str),
+    )
+
+def score_decisions(to_score, methods, classes, embeddings, candidate_mode=None, verbosity=0, explain=None,
+                    explain_top_k=5, ann=None, components=None):
+    """
+        Scoring engine decision (action, best class, score) of each method of to_score: {(class, method): decision}.
+        verbosity and explain as in recommend; with a `components` list, (key, candidates, raw_components) of every
+        method is appended to it.
+    """
+    decisions = {}
+    # Core logic to decide whether to keep, move, or extract a method based on its similarity and structural fit with other classes
+    for (cls_name, method_name), candidates, scores in score_methods(to_score, methods, classes, embeddings,
+                                                                     candidate_mode=candidate_mode, ann=ann):
+        METRICS.count("scoring.methods")
+        METRICS.count("scoring.candidates", len(candidates))
+        if verbosity >= 2:
+            for i, candiate_class in enumerate(candidates):
+                print(f"[{method_name}] {cls_name} → {candiate_class} | summary: {scores['summary'][i]:.4f}, code: {scores['code'][i]:.4f}, "
+                f"package: {scores['package'][i]:.3f}, field: {scores['field'][i]:.3f}, cohesion: {scores['cohesion'][i]:.3f}, uses: {scores['uses'][i]:.3f} "
+                f"→ final: {scores['final'][i]:.4f}")
+
+        best_cls, best_score, action = pick_best_class(cls_name, candidates, scores["final"])
+        decision = (action, best_cls, float(round(best_score, 3)))
+        decisions[(cls_name, method_name)] = decision
+
+        if verbosity >= 1:
+            print(f"[{method_name}] {cls_name}: {action} (best {best_cls}, {best_score:.4f}, {len(candidates)} candidates)")
+        if explain is not None:
+            explain.write(json.dumps(explain_record((cls_name, method_name), candidates, scores, decision, explain_top_k),
+                                     ensure_ascii=False))
+            explain.write("\n")
+        if components is not None:
+            features = build_method_features(methods[(cls_name, method_name)], classes[cls_name].get("classFields", []))
+            components.append(((cls_name, method_name), candidates,
+                               raw_components((cls_name, method_name), candidates, scores, classes, features)))
+    return decisions
+
+# Matrices of embed_classes_and_methods shared with the scoring worker processes through memory-mapped .npy files
+SHARED_MATRICES = ("class_summary", "class_code", "method_summary", "method_code")
+# In ann mode, the parent's IVF index lists (see IVFIndex.from_lists), so workers do not each run k-means
+SHARED_ANN_LISTS = ("ann_centroids", "ann_assignment")
+_worker_state = {}
+
+def _init_scoring_worker(directory, class_index, method_index, classes, methods, candidate_mode, verbosity, explain_top_k,
+                         ann):
+    embeddings = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in SHARED_MATRICES}
+    if candidate_mode == "ann":
+        centroids, assignment = (np.load(os.path.join(directory, f"{name}.npy")) for name in SHARED_ANN_LISTS)
+        embeddings["ann_index"] = IVFIndex.from_lists(ann_class_vectors(embeddings), centroids, assignment)
+    embeddings["class_index"] = class_index
+    embeddings["method_index"] = method_index
+    _worker_state.update(classes=classes, methods=methods, embeddings=embeddings, candidate_mode=candidate_mode,
+                         verbosity=verbosity, explain_top_k=explain_top_k, ann=ann)
+
+def _score_chunk(keys, explain):
+    state = _worker_state
+    explain_lines = io.StringIO() if explain else None
+    # Verbose lines go back to the parent, which prints them in to_score order instead of interleaved by process
+    log = io.StringIO()
+    candidates_before = METRICS.counters.get("scoring.candidates", 0)
+    with contextlib.redirect_stdout(log):
+        decisions = score_decisions(keys, state["methods"], state["classes"], state["embeddings"],
+                                    state["candidate_mode"], state["verbosity"], explain_lines, state["explain_top_k"],
+                                    state["ann"])
+    candidates = METRICS.counters.get("scoring.candidates", 0) - candidates_before
+    return decisions, explain_lines.getvalue() if explain else "", candidates, log.getvalue()
+
+def shard_slice(to_score, shard, shards):
+    """
+        Methods of to_score scored by shard `shard` of `shards` (1-based): a contiguous run of about
+        len(to_score) / shards methods. Scoring blocks (see scoring_block_size) start at the shard's first method.
+    """
+    return to_score[(shard - 1) * len(to_score) // shards:shard * len(to_score) // shards]
 
+def score_decisions_parallel(to_score, methods, classes, embeddings, workers, candidate_mode=None, verbosity=0,
+                             explain=None, explain_top_k=5, ann=None, chunks_per_worker=4):
+    """
+        score_decisions over a pool of `workers` processes. The vectors are written once as .npy files that every
+        worker memory-maps (the OS shares their pages), and each worker gets the class and method metadata once
+        (without class bodies, which scoring does not read). In ann mode the IVF index is built here once and its
+        lists are shared the same way. Methods are scored in contiguous chunks and the results, explanations and
+        verbose output included, are put back in to_score order, so the outcome is the same as score_decisions.
+        Workers are spawned rather than forked: the parent has loaded torch models and started its thread pools, which
+        a forked child inherits in whatever state they were in.
+    """
+    chunk_count = min(len(to_score), workers * chunks_per_worker)
+    chunks = [shard_slice(to_score, shard, chunk_count) for shard in range(1, chunk_count + 1)]
+    chunks = [chunk for chunk in chunks if chunk]
+    scoring_classes = {cls: {k: v for k, v in info.items() if k != "classBody"} for cls, info in classes.items()}
+    scoring_methods = {key: methods[key] for key in to_score}
+
+    decisions = {}
+    with tempfile.TemporaryDirectory(prefix="scoring-") as directory:
+        shared = {name: embeddings[name] for name in SHARED_MATRICES}
+        if candidate_mode == "ann":
+            index = embeddings.get("ann_index")
+            if index is None:
+                index = build_ann_index(embeddings, ann)
+            shared.update(ann_centroids=index.centroids, ann_assignment=index.assignment)
+        for name, matrix in shared.items():
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(matrix))
+        initargs = (directory, embeddings["class_index"], embeddings["method_index"], scoring_classes, scoring_methods,
+                    candidate_mode, verbosity, explain_top_k, ann)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_scoring_worker, initargs=initargs) as pool:
+            for chunk_decisions, explain_text, candidates, log in pool.map(_score_chunk, chunks,
+                                                                           [explain is not None] * len(chunks)):
+                decisions.update(chunk_decisions)
+                print(log, end="")
+                if explain is not None:
+                    explain.write(explain_text)
+                METRICS.count("scoring.methods", len(chunk_decisions))
+                METRICS.count("scoring.candidates", candidates)
+    return decisions
+
+def recommend(classes, methods, embeddings, candidate_mode=None, previous=None, rescore=None,
+              verbosity=0, explain=None, explain_top_k=5, workers=1, ann=None, components=None, rules=None):
+    """
+        KEEP / MOVE / EXTRACT recommendation for every method, in method order.
+
+        Incremental runs pass `rescore` (methods to score again, see plan_rescoring) and `previous`
+        ({(class, method): recommendation} of the last run): other methods keep their previous recommendation,
+        and only the methods in `rescore` need vectors in `embeddings`.
+
+        The scoring loop prints nothing by default: verbosity 1 prints one line per scored method, verbosity 2 every
+        (method, candidate) score. With `explain` (a text file), each scored method's explain_record is written to it
+        as a JSON line. With workers > 1 the methods are scored by a process pool (score_decisions_parallel).
+        `ann` holds the --candidates ann options (see ann_settings). A `components` list collects the raw score
+        inputs of every scored method (see score_decisions; always in this process).
+        `rules` is the rule_based_decisions result when the caller already applied the rules (to skip embedding
+        the methods they decide); rule decided methods need no vectors in `embeddings`.
+    """
+    # Rule based decisions first, everything else goes through the scoring engine
+    decisions, to_score = rule_based_decisions(classes, methods) if rules is None else (dict(rules[0]), list(rules[1]))
+    METRICS.count("rules.decided", len(decisions))
+
+    if rescore is not None:
+        for key in to_score:
+            if key not in rescore:
+                decisions[key] = previous[key]
+        to_score = [key for key in to_score if key in rescore]
+
+    if workers > 1 and len(to_score) > 1 and components is None:
+        decisions.update(score_decisions_parallel(to_score, methods, classes, embeddings, workers, candidate_mode,
+                                                  verbosity, explain, explain_top_k, ann))
+    else:
+        decisions.update(score_decisions(to_score, methods, classes, embeddings, candidate_mode, verbosity, explain,
+                                         explain_top_k, ann, components))
+    return recommendation_records(methods, decisions)
+
+def recommendation_records(methods, decisions):
+    """
+        Output records of every method, in method order, from its rule action, scoring decision or previous record
+    """
     recommendations = []
 
-    for (cls_name, method_name), method_vector in method_vectors.items():
-        method_meta = methods[(cls_name, method_name)]
-        source_package = classes[cls_name]["package"]
-
-        recommendation_score = 1.0
-        if cls_name in interface_classes:
-            action = "KEEP (inteface)"
-        elif is_simple_delegate(method_meta):
-            action = "KEEP (simple delegate)"
-        elif is_getter_setter(method_meta, method_name):
-            action = "KEEP"
-        
-        # Core logic to decide whether to keep, move, or extract a method based on its similarity and structural fit with other classes
-        else:
-            # first let the current class itself be the methods best class with a dummy score
-            best_cls, best_score = cls_name, -1.0
-            MOVE_THRESHOLD     = 0.75
-
-            for candiate_class in structural_candidates(method_meta, classes):
-                # Compute semantic similarity between the method and candidate class using vector embeddings
-                summary_sim = cosine_similarity(
-                                                    [method_vector["summary_vec"]],
-                                                    [class_vectors[candiate_class]["summary_vec"]]
-                                                )[0][0]
-
-                code_sim = cosine_similarity(
-                                                [method_vector["code_vec"]],
-                                                [class_vectors[candiate_class]["code_vec"]]
-                                            )[0][0]
-
-                base_score = 0.50 * summary_sim + 0.50 * code_sim
-
-                # Add bonus points if the method is closely related to the candidate class (same package, uses its fields, or has similar logic)
-                package_bonus_score = same_package_bonus(source_package, classes[candiate_class]["package"])
-                field_bonus_score = field_bonus(method_meta, candiate_class)
-                cohesion_bonus_score = cohesion_bonus(method_meta, candiate_class, method_name)
-
-                # bonus if the class is used by the method's current class
-                method_used_classes = extract_method_used_classes(method_meta, classes[cls_name].get("classFields", []))
-                use_class_bonus_score = 0.05 if candiate_class in method_used_classes else 0.0
-
-                bonus_score = package_bonus_score + field_bonus_score + cohesion_bonus_score + use_class_bonus_score
-
-                candidate_score = (0.8 * base_score) + bonus_score
-#                candidate_score = base_score
-                print(f"[{method_name}] {cls_name} → {candiate_class} | summary: {summary_sim:.4f}, code: {code_sim:.4f}, "
-                f"package: {package_bonus_score:.3f}, field: {field_bonus_score:.3f}, cohesion: {cohesion_bonus_score:.3f}, uses: {use_class_bonus_score:.3f} "
-                f"→ final: {candidate_score:.4f}")
-
-                if candidate_score > best_score:
-                    best_cls, best_score = candiate_class, candidate_score
-    
-            if best_cls == cls_name:
-                action = "KEEP"
-            elif best_score >= MOVE_THRESHOLD:
-                action = f"MOVE to {best_cls}"
-            elif best_score < MOVE_THRESHOLD:
-                action = "EXTRACT to new class"
-            recommendation_score = float(round(best_score, 3))
+    for (cls_name, method_name) in methods:
+        decision = decisions[(cls_name, method_name)]
+        if isinstance(decision, dict):
+            recommendations.append(decision)
+            continue
+        action, best_cls, recommendation_score = decision if isinstance(decision, tuple) else (decision, cls_name, 1.0)
 
         recommendations.append({
             "method":        method_name,
@@ -374,13 +1095,442 @@ if __name__ == "__main__":
             "score":         recommendation_score,
             "action":        action
         })
+    return recommendations
+
+RECOMMENDATIONS_JSON = "recactor_recommendations.json"
+
+def manifest_path(recommendations_path: str) -> str:
+    return os.path.splitext(recommendations_path)[0] + ".manifest.json"
+
+def parse_shard(text: str) -> tuple:
+    """
+        "i/N" -> (i, N), with 1 <= i <= N
+    """
+    try:
+        shard, shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, got {text!r}")
+    if not 1 <= shard <= shards:
+        raise argparse.ArgumentTypeError(f"shard {shard} is not in 1..{shards}")
+    return shard, shards
+
+def shard_path(recommendations_path: str, shard: int, shards: int) -> str:
+    return f"{os.path.splitext(recommendations_path)[0]}.shard-{shard}-of-{shards}.json"
+
+def write_shard(path, shard, shards, keys, decisions):
+    """
+        Scoring decisions of one shard, as [class, method, action, best class, score] rows in scoring order
+    """
+    with open(path, "w", encoding="utf-8") as file_out:
+        json.dump({"shard": shard, "shards": shards,
+                   "decisions": [[*key, *decisions[key]] for key in keys]}, file_out, ensure_ascii=False)
+
+def merge_shards(classes, methods, recommendations_path, shards):
+    """
+        Recommendations of a sharded run: rule decisions are taken again here (cheap), scoring decisions from the
+        `shards` shard files. Raises ValueError when a shard file is missing or does not match these summaries.
+    """
+    decisions, to_score = rule_based_decisions(classes, methods)
+    for shard in range(1, shards + 1):
+        path = shard_path(recommendations_path, shard, shards)
+        if not os.path.exists(path):
+            raise ValueError(f"{path} not found (run --shard {shard}/{shards})")
+        with open(path, encoding="utf-8") as file:
+            rows = json.load(file)["decisions"]
+        expected = shard_slice(to_score, shard, shards)
+        if [tuple(row[:2]) for row in rows] != expected:
+            raise ValueError(f"{path} does not hold the methods of shard {shard}/{shards} of these summaries")
+        for cls_name, method_name, action, best_cls, score in rows:
+            decisions[(cls_name, method_name)] = (action, best_cls, score)
+    return recommendation_records(methods, decisions)
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def plan_rescoring(classes, methods, manifest=None, previous=None, candidate_mode=None, code_embedding=None,
+                   precision="off", ann=None):
+    """
+        Decide which methods an incremental run has to score again, by comparing content fingerprints with the
+        manifest written by the previous run. A method is re-scored when
+          - it is new, or its summary / code / metadata changed
+          - its own class changed (summary, body, package or fields)
+          - one of its candidate classes changed, was added or was removed (any class change in exhaustive and
+            ann mode, where the ANN index and so the candidates depend on every class)
+
+        Returns (set of (class, method) to re-score, manifest describing the current inputs)
+    """
+    candidate_mode = candidate_mode or CANDIDATE_MODE
+    class_fingerprints = {
+        cls: fingerprint(info["summary"], info.get("classBody", ""), info.get("package", ""), info.get("classFields", []))
+        for cls, info in classes.items()
+    }
+    class_name_index = build_class_name_index(classes)
+
+    code_embedding = code_embedding or CODE_EMBEDDING
+    new_manifest = {"candidate_mode": candidate_mode, "code_embedding": code_embedding, "precision": precision,
+                    "classes": class_fingerprints, "methods": {}}
+    if candidate_mode == "ann":
+        new_manifest["ann"] = ann_settings(ann)
+    for key, method_meta in methods.items():
+        entry = {"fingerprint": fingerprint({k: v for k, v in method_meta.items() if k != "classFields"})}
+        if candidate_mode == "pruned":
+            entry["candidates"] = structural_candidates(method_meta, classes, "pruned", class_name_index, key[0])
+        new_manifest["methods"][f"{key[0]}.{key[1]}"] = entry
+
+    if (not manifest or not previous or manifest.get("candidate_mode") != candidate_mode
+            or manifest.get("code_embedding", "truncated") != code_embedding
+            or manifest.get("precision", "off") != precision or manifest.get("ann") != new_manifest.get("ann")):
+        return set(methods), new_manifest
+
+    old_classes = manifest.get("classes", {})
+    changed_classes = {cls for cls, fp in class_fingerprints.items() if old_classes.get(cls) != fp}
+    changed_classes |= old_classes.keys() - class_fingerprints.keys()
+
+    rescore = set()
+    for key in methods:
+        entry = new_manifest["methods"][f"{key[0]}.{key[1]}"]
+        old_entry = manifest["methods"].get(f"{key[0]}.{key[1]}")
+        if key not in previous or old_entry is None or old_entry["fingerprint"] != entry["fingerprint"]:
+            rescore.add(key)
+        elif key[0] in changed_classes:
+            rescore.add(key)
+        elif candidate_mode != "pruned":
+            if changed_classes:
+                rescore.add(key)
+        elif set(entry["candidates"]) != set(old_entry.get("candidates", [])) or changed_classes & set(entry["candidates"]):
+            rescore.add(key)
+    return rescore, new_manifest
+
+def compare_precision(classes, methods, precision, batch_size=32, code_embedding=None, candidate_mode=None,
+                      torch_threads=None, torch_interop_threads=None):
+    """
+        Embed and score the whole project with full precision models and with `precision` ones (no embedding store,
+        models loaded before timing), and report the encoding speedup and how often the recommendation changes.
+        Like a normal run, methods decided by the rules are not embedded.
+    """
+    rules = rule_based_decisions(classes, methods)
+    scored_methods = {key: methods[key] for key in rules[1]}
+    runs = {}
+    for run_precision in ("off", precision):
+        models = LazyModels(precision=run_precision, torch_threads=torch_threads,
+                            torch_interop_threads=torch_interop_threads)
+        # Loaded before the clock starts: only the encoding is timed
+        models.load("summary", "code")
+
+        start = time.perf_counter()
+        embeddings = embed_classes_and_methods(classes, scored_methods, models, batch_size, code_embedding=code_embedding,
+                                               all_methods=methods)
+        seconds = time.perf_counter() - start
+        recommendations = recommend(classes, methods, embeddings, candidate_mode=candidate_mode, rules=rules)
+        runs[run_precision] = seconds, {(r["current_class"], r["method"]): r for r in recommendations}
+
+    full_seconds, full = runs["off"]
+    fast_seconds, fast = runs[precision]
+    best_changed = [key for key in full if full[key]["best_class"] != fast[key]["best_class"]]
+    action_changed = [key for key in full if full[key]["action"] != fast[key]["action"]]
+    changed = set(best_changed) | set(action_changed)
+
+    def summary(r):
+        return {"action": r["action"], "best_class": r["best_class"], "score": r["score"]}
+
+    return {
+        "precision": precision,
+        "methods": len(full),
+        "full_precision_seconds": round(full_seconds, 3),
+        "fast_seconds": round(fast_seconds, 3),
+        "speedup": round(full_seconds / fast_seconds, 2) if fast_seconds else None,
+        "best_class_changed": len(best_changed),
+        "best_class_change_rate": round(len(best_changed) / len(full), 4) if full else 0.0,
+        "action_changed": len(action_changed),
+        "action_change_rate": round(len(action_changed) / len(full), 4) if full else 0.0,
+        "max_score_difference": round(max((abs(full[key]["score"] - fast[key]["score"]) for key in full), default=0.0), 4),
+        "changes": [{"class": key[0], "method": key[1], "full": summary(full[key]), "fast": summary(fast[key])}
+                    for key in full if key in changed],
+    }
+
+def ann_recall_report(classes, methods, embeddings, to_score, ks, ann=None):
+    """
+        Compare --candidates ann with exhaustive scoring on the methods of to_score, for every top_k of `ks`:
+          - neighbour_recall: share of the exact top_k semantically closest classes the index returns
+          - best_class_recall: share of methods whose exhaustive best class is among their ann candidates
+          - same_decision: share of methods getting the same action and best class
+          - seconds / speedup of the scoring itself
+    """
+    features = build_feature_index({key: methods[key] for key in to_score}, classes)
+    start = time.perf_counter()
+    exact = {key: pick_best_class(key[0], candidates, scores["final"])[::2]
+             for key, candidates, scores in score_methods(to_score, methods, classes, embeddings, features=features,
+                                                          candidate_mode="exhaustive")}
+    exhaustive_seconds = time.perf_counter() - start
+
+    # The index is built once for every k; the exact top k come from one block of methods at a time (as in
+    # score_methods), so no methods x classes matrix is held
+    ann = ann_settings(ann)
+    index = build_ann_index(embeddings, ann)
+    embeddings = {**embeddings, "ann_index": index}
+    class_vectors = ann_class_vectors(embeddings)
+    ks = [min(k, len(classes)) for k in ks]
+    neighbours_found = np.zeros(len(ks))
+    block_size = scoring_block_size(len(classes))
+    for start in range(0, len(to_score), block_size):
+        rows = [embeddings["method_index"][key] for key in to_score[start:start + block_size]]
+        queries = 0.5 * np.hstack([normalize_rows(embeddings["method_summary"][rows]),
+                                   normalize_rows(embeddings["method_code"][rows])])
+        semantic = queries @ class_vectors.T
+        for i, k in enumerate(ks):
+            if k >= len(classes):
+                neighbours_found[i] += len(rows) * k
+                continue
+            exact_top = np.argpartition(-semantic, k - 1, axis=1)[:, :k]
+            neighbours_found[i] += sum(len(np.intersect1d(found, exact))
+                                       for found, exact in zip(index.search(queries, k, ann["probes"]), exact_top))
+
+    report = {"methods": len(to_score), "classes": len(classes), "lists": index.lists, "probes": ann["probes"],
+              "exhaustive_seconds": round(exhaustive_seconds, 3), "k": []}
+    for k, found in zip(ks, neighbours_found):
+        neighbour_recall = found / (len(to_score) * k) if to_score else 1.0
+
+        start = time.perf_counter()
+        approximate = {key: (candidates, pick_best_class(key[0], candidates, scores["final"])[::2])
+                       for key, candidates, scores in score_methods(to_score, methods, classes, embeddings,
+                                                                    features=features, candidate_mode="ann",
+                                                                    ann={**ann, "top_k": k})}
+        seconds = time.perf_counter() - start
+        best_found = sum(exact[key][0] in approximate[key][0] for key in to_score)
+        same = sum(exact[key] == approximate[key][1] for key in to_score)
+        report["k"].append({
+            "top_k": k,
+            "neighbour_recall": round(float(neighbour_recall), 4),
+            "best_class_recall": round(best_found / len(to_score), 4) if to_score else 1.0,
+            "same_decision": round(same / len(to_score), 4) if to_score else 1.0,
+            "seconds": round(seconds, 3),
+            "speedup": round(exhaustive_seconds / seconds, 2) if seconds else None,
+        })
+    return report
 
+def write_recommendations(recommendations, path, manifest):
     print(tabulate(
         [(r["method"], r["current_class"], r["action"], r["score"]) for r in recommendations],
         headers=["Method", "Current", "Action", "Score"],
         tablefmt="github"
     ))
 
-    with open("recactor_recommendations.json", "w", encoding="utf-8") as file_out:
+    with open(path, "w", encoding="utf-8") as file_out:
         json.dump(recommendations, file_out, indent=2, ensure_ascii=False)
-    print("\nRecommendations written to recommendations.json")
\ No newline at end of file
+    with open(manifest_path(path), "w", encoding="utf-8") as file_out:
+        json.dump(manifest, file_out, ensure_ascii=False)
+    print(f"\nRecommendations written to {path}")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Recommend move method refactorings from the llm_generator.py summaries")
+    parser.add_argument("--summaries", default=None,
+                        help="summaries written by llm_generator.py (default: llm_code_summaries.jsonl, or the legacy .json)")
+    parser.add_argument("--batch-size", type=int, default=32, help="texts per SentenceTransformer/CodeBERT batch")
+    parser.add_argument("--embedding-store", default="embedding_store",
+                        help="directory of memory-mapped vectors reused across runs")
+    parser.add_argument("--no-embedding-store", action="store_true", help="encode everything, do not read or write the store")
+    parser.add_argument("--embedding-store-max-rows", type=int, default=DEFAULT_MAX_ROWS,
+                        help="vectors kept per embedding space; past it, the oldest ones this run did not use are dropped "
+                             "(0: no limit)")
+    parser.add_argument("--compact-embedding-store", action="store_true",
+                        help="keep only the vectors this run used in the store (drops vectors of older versions)")
+    parser.add_argument("--candidates", choices=["exhaustive", "pruned", "ann"], default=CANDIDATE_MODE,
+                        help="score every class, only the classes each method structurally depends on, or only its "
+                             "--ann-k semantically closest classes (approximate nearest neighbour index) and its own")
+    parser.add_argument("--ann-k", type=int, default=ANN_TOP_K, help="classes kept per method with --candidates ann")
+    parser.add_argument("--ann-probes", type=int, default=ANN_PROBES,
+                        help="index lists searched per method with --candidates ann (more: better recall, slower)")
+    parser.add_argument("--ann-lists", type=int, default=None,
+                        help="index lists (default: square root of the class count)")
+    parser.add_argument("--ann-recall", metavar="PATH", default=None,
+                        help="only compare ann candidates with exhaustive scoring for each --ann-recall-k "
+                             "(recall and decision agreement), written as JSON")
+    parser.add_argument("--ann-recall-k", default="5,10,20,50", help="comma separated top-k values for --ann-recall")
+    parser.add_argument("--code-embedding", choices=["truncated", "chunked"], default=CODE_EMBEDDING,
+                        help="truncated: CodeBERT on the first 512 tokens of each class/method body; chunked: method "
+                             "bodies split into 512 token windows and pooled, class vectors pooled from their methods")
+    parser.add_argument("--fast-inference", choices=PRECISIONS, default="off",
+                        help="CPU inference with int8 dynamic quantization or bfloat16 weights (both models)")
+    parser.add_argument("--torch-threads", type=int, default=None, help="torch intra-op threads (default: all cores)")
+    parser.add_argument("--torch-interop-threads", type=int, default=None, help="torch inter-op threads")
+    parser.add_argument("--compare-precision", metavar="PATH", default=None,
+                        help="only compare full precision with --fast-inference (int8 when off) on this project: "
+                             "speedup and changed recommendations, written as JSON")
+    parser.add_argument("--output", default=RECOMMENDATIONS_JSON, help="recommendations file (plus its .manifest.json)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="re-score only methods whose inputs or candidate classes changed since the last run "
+                             "and merge them into the existing recommendations")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="score methods with this many processes (memory-mapped vectors shared between them)")
+    parser.add_argument("--shard", metavar="I/N", type=parse_shard, default=None,
+                        help="score only the I-th of N method shards (e.g. one per machine) into "
+                             "<output>.shard-I-of-N.json; combine them with --merge-shards N")
+    parser.add_argument("--merge-shards", metavar="N", type=int, default=None,
+                        help="write the recommendations (and table) of a run split with --shard I/N, from its N shard files")
+    parser.add_argument("--verify-embeddings", action="store_true",
+                        help="compare a sample of batched vectors against one-at-a-time encoding")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="-v: one line per scored method, -vv: every (method, candidate) score")
+    parser.add_argument("--explain", metavar="PATH", default=None,
+                        help="write the top candidates and score components of each scored method as JSONL")
+    parser.add_argument("--explain-top-k", type=int, default=5, help="candidates kept per method in --explain")
+    parser.add_argument("--save-components", metavar="PATH", default=None,
+                        help="save the raw score components of every (method, candidate) as .npz, to tune weights and "
+                             "thresholds with weight_sweep.py without embedding again")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="write timers, counters and peak memory of the run as JSON")
+    parser.add_argument("--cprofile", metavar="PATH", default=None, help="run under cProfile and dump the stats here")
+    args = parser.parse_args()
+    if (args.shard or args.merge_shards) and args.incremental:
+        parser.error("--shard and --merge-shards score every method, they cannot be combined with --incremental")
+    if args.compact_embedding_store and (args.incremental or args.shard or args.no_embedding_store):
+        parser.error("--compact-embedding-store keeps the vectors a run looks up: it needs a full run with a store "
+                     "(no --incremental or --shard)")
+    if args.save_components and (args.incremental or args.shard or args.merge_shards):
+        parser.error("--save-components needs a full run (no --incremental, --shard or --merge-shards)")
+    if args.save_components and args.workers > 1:
+        parser.error("--save-components collects the score components in one process, it cannot be combined with "
+                     "--workers")
+
+    enable_profiling(args.profile, args.cprofile)
+    ann = {"top_k": args.ann_k, "probes": args.ann_probes, "lists": args.ann_lists}
+
+    summaries_path = args.summaries or default_summaries_path()
+    if not os.path.exists(summaries_path):
+        sys.exit(f"{summaries_path} not found. Run llm_generator.py first")
+    
+    with METRICS.timer("load summaries"):
+        classes, methods = load_llm_summaries(summaries_path)
+    print(f"Loaded {len(classes)} classes, {len(methods)} methods")
+
+    if args.compare_precision:
+        precision = args.fast_inference if args.fast_inference != "off" else "int8"
+        report = compare_precision(classes, methods, precision, args.batch_size, args.code_embedding, args.candidates,
+                                   args.torch_threads, args.torch_interop_threads)
+        with open(args.compare_precision, "w", encoding="utf-8") as file_out:
+            json.dump(report, file_out, indent=2, ensure_ascii=False)
+        print(tabulate([(key, value) for key, value in report.items() if key != "changes"],
+                       headers=["Precision comparison", ""], tablefmt="github"))
+        print(f"{len(report['changes'])} changed recommendations written to {args.compare_precision}")
+        sys.exit(0)
+
+    if args.merge_shards:
+        try:
+            recommendations = merge_shards(classes, methods, args.output, args.merge_shards)
+        except ValueError as e:
+            sys.exit(str(e))
+        new_manifest = plan_rescoring(classes, methods, None, None, args.candidates, args.code_embedding,
+                                      args.fast_inference, ann)[1]
+        write_recommendations(recommendations, args.output, new_manifest)
+        sys.exit(0)
+
+    # Methods decided by the structural rules keep their action whatever their vectors: they are never embedded
+    with METRICS.timer("rules"):
+        rules = rule_based_decisions(classes, methods)
+    rule_decided = rules[0]
+    print(f"Rules decided {len(rule_decided)} of {len(methods)} methods (interfaces, delegates, getters/setters)")
+
+    previous = manifest = None
+    if args.incremental and os.path.exists(args.output) and os.path.exists(manifest_path(args.output)):
+        with open(args.output, encoding="utf-8") as file:
+            previous = {(r["current_class"], r["method"]): r for r in json.load(file)}
+        with open(manifest_path(args.output), encoding="utf-8") as file:
+            manifest = json.load(file)
+
+    rescore, new_manifest = plan_rescoring(classes, methods, manifest, previous, args.candidates, args.code_embedding,
+                                           args.fast_inference, ann)
+    if args.incremental:
+        print(f"Incremental run: re-scoring {len(rescore)} of {len(methods)} methods")
+    shard_keys = None
+    if args.shard:
+        shard_keys = shard_slice(rules[1], *args.shard)
+        rescore = set(shard_keys)
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: scoring {len(shard_keys)} methods")
+
+    print("Embedding summaries and code ...")
+
+    # Models are loaded lazily, only if some vectors are not in the embedding store
+    models = LazyModels(precision=args.fast_inference, torch_threads=args.torch_threads,
+                        torch_interop_threads=args.torch_interop_threads)
+
+    summary_store = code_store = None
+    if not args.no_embedding_store:
+        with METRICS.timer("open embedding store"):
+            try:
+                summary_store = EmbeddingStore(args.embedding_store, "summary", args.embedding_store_max_rows)
+                code_store = EmbeddingStore(args.embedding_store, "code", args.embedding_store_max_rows)
+            except EmbeddingStoreError as e:
+                sys.exit(str(e))
+
+    with METRICS.timer("embedding"):
+        to_embed = {key: methods[key] for key in methods if key in rescore and key not in rule_decided}
+        embeddings = embed_classes_and_methods(classes, to_embed, models,
+                                               batch_size=args.batch_size,
+                                               summary_store=summary_store, code_store=code_store,
+                                               code_embedding=args.code_embedding, all_methods=methods)
+
+    # Chunked class code vectors are pooled from every method of the class: rule decided bodies are still encoded
+    skipped_summaries = sum(key in rescore for key in rule_decided)
+    skipped_code = 0 if args.code_embedding == "chunked" else skipped_summaries
+    METRICS.set("rules.skipped_summary_vectors", skipped_summaries)
+    METRICS.set("rules.skipped_code_vectors", skipped_code)
+    print(f"Not embedded (decided by rules): {skipped_summaries} method summaries, {skipped_code} method bodies")
+
+    for store in (summary_store, code_store):
+        if store is not None:
+            print(f"Embedding store '{store.space}': {store.reused} vectors reused, {store.encoded} encoded")
+            METRICS.set(f"embedding_store.{store.space}.reused", store.reused)
+            METRICS.set(f"embedding_store.{store.space}.encoded", store.encoded)
+            try:
+                store.save(compact=args.compact_embedding_store)
+            except EmbeddingStoreError as e:
+                sys.exit(str(e))
+            if store.dropped:
+                print(f"Embedding store '{store.space}': {store.dropped} unused vectors dropped, {len(store)} kept")
+
+    if args.verify_embeddings:
+        verify_batched_embeddings(embeddings, classes, {key: methods[key] for key in embeddings["method_index"]}, models,
+                                  code_embedding=args.code_embedding)
+
+    if args.ann_recall:
+        to_score = [key for key in rules[1] if key in embeddings["method_index"]]
+        report = ann_recall_report(classes, methods, embeddings, to_score,
+                                   [int(k) for k in args.ann_recall_k.split(",")], ann)
+        with open(args.ann_recall, "w", encoding="utf-8") as file_out:
+            json.dump(report, file_out, indent=2)
+        print(tabulate(report["k"], headers="keys", tablefmt="github"))
+        print(f"ANN recall report ({report['methods']} methods, {report['classes']} classes, {report['lists']} lists, "
+              f"{report['probes']} probes) written to {args.ann_recall}")
+        sys.exit(0)
+
+    explain_file = open(args.explain, "w", encoding="utf-8") if args.explain else None
+    components = [] if args.save_components else None
+    with METRICS.timer("scoring"):
+        if shard_keys is not None:
+            if args.workers > 1:
+                decisions = score_decisions_parallel(shard_keys, methods, classes, embeddings, args.workers,
+                                                     args.candidates, args.verbose, explain_file, args.explain_top_k, ann)
+            else:
+                decisions = score_decisions(shard_keys, methods, classes, embeddings, args.candidates, args.verbose,
+                                            explain_file, args.explain_top_k, ann)
+        else:
+            recommendations = recommend(classes, methods, embeddings, candidate_mode=args.candidates,
+                                        previous=previous, rescore=rescore if previous else None,
+                                        verbosity=args.verbose, explain=explain_file, explain_top_k=args.explain_top_k,
+                                        workers=args.workers, ann=ann, components=components, rules=rules)
+    if explain_file is not None:
+        explain_file.close()
+        print(f"Explanations written to {args.explain}")
+
+    if shard_keys is not None:
+        path = shard_path(args.output, *args.shard)
+        write_shard(path, *args.shard, shard_keys, decisions)
+        print(f"Shard decisions written to {path}")
+    else:
+        write_recommendations(recommendations, args.output, new_manifest)
+    if components is not None:
+        save_components(args.save_components, components, recommendations)
+        print(f"Score components of {len(components)} methods written to {args.save_components}")
+
+    print(tabulate(METRICS.table(), headers=["Timer", "Calls", "Seconds"], tablefmt="github", floatfmt=".3f"))
\ No newline at end of file
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+"""
+    Content-addressed on-disk cache for LLM summaries (sqlite, standard library only).
+
+    An entry is keyed by the hash of the model name and the full prompt. The prompt is built only from the
+    package, the class/method AST metadata and the code body, so any change to those (or to the prompt
+    template) produces a new key, while unchanged code is served from the cache on the next run.
+"""
+
+def summary_cache_key(model: str, prompt: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class SummaryCache:
+    """
+    LRU cache of summaries bounded by entry count and total summary size.
+    Entries are evicted least-recently-used first when the cache is closed (end of run).
+    """
+    def __init__(self, path: str, max_entries: int = 100_000, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key       TEXT PRIMARY KEY,
+                summary   TEXT NOT NULL,
+                size      INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries(last_used)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, summary: str):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO summaries (key, summary, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, summary, len(summary.encode("utf-8")), time.time()))
+        self._conn.commit()
+
+    def evict(self):
+        """
+        Drop least recently used entries until both the entry and size limits hold
+        """
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        to_delete = []
+        for key, size in self._conn.execute("SELECT key, size FROM summaries ORDER BY last_used ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            count -= 1
+            total -= size
+
+        self._conn.executemany("DELETE FROM summaries WHERE key = ?", to_delete)
+        self._conn.commit()
+        self.evictions += len(to_delete)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        if self._conn is None:
+            return
+        self.evict()
+        self._conn.commit()
+        self._conn.close()
+        self._conn = None
@@ -0,0 +1,209 @@
+import json
+import os
+
+"""
+    Append-only JSONL format shared by llm_generator.py (writer) and refactor_recommendation.py (reader).
+
+    One record per line, written while the run goes:
+        {"type": "source", "file": ..., "sha256": ..., "code": ...}        java file source, once per file
+        {"type": "class",  "file": ..., "class": ..., "summary": ..., "uses_classes": [...], "package": ...,
+                           "classFields": [...]}
+        {"type": "method", "file": ..., "class": ..., "name": ..., "summary": ..., "parameters": [...],
+                           "methodCalls": [...], "methodFieldAccess": [...], "methodBody": ...}
+                           + "decided_by": "rule" for a method the structural rules decide, which is not summarized
+                           (its summary is "")
+        {"type": "done",   "file": ..., "sha256": ..., "settings": {...}}    every record of the file is written
+
+    A class's body is its file source (as in llm_code_summaries.json) and is stored once per file; method records
+    no longer repeat the class fields. Records after the last "done" belong to a file interrupted by a crash, and
+    are dropped when the writer resumes. "settings" are the summarization settings (model, prompt style, ...) the
+    file was summarized with: a later run with other settings summarizes it again.
+    Records of a file are contiguous, and files are in source order (sort_files after an incremental run).
+"""
+
+SUMMARIES_JSONL = "llm_code_summaries.jsonl"
+SUMMARIES_JSON = "llm_code_summaries.json"
+
+def iter_summary_records(path: str):
+    """
+    Lazily yield the records of a JSONL summaries file. A truncated last line (crash mid-write) is skipped.
+    Legacy llm_code_summaries.json documents are converted to the same records.
+    """
+    if not path.endswith(".jsonl"):
+        yield from _iter_legacy_records(path)
+        return
+
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                return
+
+def _iter_legacy_records(path: str):
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+
+    for class_name, class_data in data.items():
+        yield {"type": "source", "file": class_name, "code": class_data.get("classBody", "")}
+        yield {
+            "type": "class",
+            "file": class_name,
+            "class": class_name,
+            "summary": class_data["summary"],
+            "uses_classes": class_data.get("uses_classes", []),
+            "package": class_data.get("package", ""),
+            "classFields": class_data.get("classFields", []),
+        }
+        methods_meta = {meta["name"]: meta for meta in class_data.get("methods_meta", [])}
+        for method_name, method_summary in class_data["methods"].items():
+            record = {"type": "method", "file": class_name, "class": class_name, "name": method_name,
+                      "summary": method_summary}
+            record.update({k: v for k, v in methods_meta.get(method_name, {}).items() if k not in ("name", "classFields")})
+            yield record
+
+def default_summaries_path() -> str:
+    """
+    The JSONL output of llm_generator.py, or the legacy JSON document when only that one exists
+    """
+    if os.path.exists(SUMMARIES_JSONL) or not os.path.exists(SUMMARIES_JSON):
+        return SUMMARIES_JSONL
+    return SUMMARIES_JSON
+
+class SummaryRecordWriter:
+    """
+    Appends summary records to a JSONL file, making each finished java file durable (flush + fsync).
+
+    With resume=True an existing file is kept: it is cut back to its last "done" record, and
+    `completed_files` (java file -> sha256 of its source when summarized) and `completed_settings` (java file ->
+    settings it was summarized with) are the manifest the caller compares against the current sources and settings
+    to skip unchanged files.
+    """
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self.completed_files = {}
+        self.completed_settings = {}
+
+        if resume and os.path.exists(path):
+            self._truncate_to_last_done()
+            self._file = open(path, "a", encoding="utf-8")
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+
+    def _truncate_to_last_done(self):
+        keep = 0
+        with open(self.path, "rb") as file:
+            offset = 0
+            for line in file:
+                offset += len(line)
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record.get("type") == "done":
+                    self.completed_files[record["file"]] = record.get("sha256")
+                    self.completed_settings[record["file"]] = record.get("settings")
+                    keep = offset
+        with open(self.path, "r+b") as file:
+            file.truncate(keep)
+
+    def drop_files(self, java_files):
+        """
+        Remove every record of the given files (changed or deleted since they were summarized), so they can be
+        summarized again. The remaining records keep their order.
+        """
+        java_files = set(java_files)
+        if not java_files:
+            return
+
+        self._file.close()
+        tmp_path = self.path + ".tmp"
+        with open(self.path, encoding="utf-8") as source, open(tmp_path, "w", encoding="utf-8") as target:
+            for line in source:
+                if json.loads(line).get("file") not in java_files:
+                    target.write(line)
+        os.replace(tmp_path, self.path)
+
+        for java_file in java_files:
+            self.completed_files.pop(java_file, None)
+            self.completed_settings.pop(java_file, None)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def sort_files(self, java_files):
+        """
+        Rewrite the file with each java file's records in the given order (files not listed keep their order, after
+        them), e.g. so that an incremental run, which appends the files it summarized again, gives the same file as
+        a fresh run. Only the byte ranges of the files are held in memory.
+        """
+        self._file.flush()
+        spans, order = {}, []
+        with open(self.path, "rb") as source:
+            offset = 0
+            for line in source:
+                java_file = json.loads(line).get("file")
+                if java_file not in spans:
+                    spans[java_file] = []
+                    order.append(java_file)
+                if spans[java_file] and spans[java_file][-1][1] == offset:
+                    spans[java_file][-1][1] = offset + len(line)
+                else:
+                    spans[java_file].append([offset, offset + len(line)])
+                offset += len(line)
+
+        rank = {java_file: i for i, java_file in enumerate(java_files)}
+        ordered = sorted(order, key=lambda java_file: rank.get(java_file, len(rank)))  # stable: unlisted keep order
+        if ordered == order:
+            return
+
+        self._file.close()
+        tmp_path = self.path + ".tmp"
+        with open(self.path, "rb") as source, open(tmp_path, "wb") as target:
+            for java_file in ordered:
+                for start, end in spans[java_file]:
+                    source.seek(start)
+                    target.write(source.read(end - start))
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False))
+        self._file.write("\n")
+
+    def write_source(self, java_file: str, sha256: str, code: str):
+        self.write({"type": "source", "file": java_file, "sha256": sha256, "code": code})
+
+    def write_class(self, java_file: str, class_name: str, entry: dict):
+        self.write({"type": "class", "file": java_file, "class": class_name, **entry})
+
+    def write_method(self, java_file: str, class_name: str, method_summary: str, method_meta: dict,
+                     decided_by: str = None):
+        record = {"type": "method", "file": java_file, "class": class_name,
+                  "name": method_meta.get("name", ""), "summary": method_summary,
+                  **{k: v for k, v in method_meta.items() if k != "name"}}
+        if decided_by:
+            record["decided_by"] = decided_by
+        self.write(record)
+
+    def finish_file(self, java_file: str, sha256: str, settings: dict = None):
+        self.write({"type": "done", "file": java_file, "sha256": sha256, "settings": settings})
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.completed_files[java_file] = sha256
+        self.completed_settings[java_file] = settings
+
+    def close(self):
+        if not self._file.closed:
+            self._file.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,282 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+from tabulate import tabulate
+
+import refactor_recommendation as rr
+
+"""
+    Weight / threshold sweep over saved score components: tune the scoring constants of refactor_recommendation.py
+    against labeled recommendations without embedding or scoring the project again.
+
+    1. python scripts/refactor_recommendation.py --summaries <project summaries> --save-components components.npz
+    2. python scripts/weight_sweep.py components.npz --labels <reviewed recactor_recommendations.json> [--grid grid.json]
+
+    Labels use the recactor_recommendations.json format (e.g. report-submitted-data/*/recactor_recommendations.json):
+    the action of each record (KEEP / MOVE to X / EXTRACT to new class) is the expected one. A grid is a JSON object
+    {parameter: [values]} over PARAMETERS (missing parameters keep the current constant); every combination is
+    evaluated with matrix products, block by block, so the scores held at once stay under --cell-budget whatever
+    the project and grid size.
+
+    Scores: a method predicted MOVE / EXTRACT is a true positive when the label has the same action (and, for
+    MOVE, the same target class). precision = true positives / predicted refactorings, recall = true positives /
+    labeled refactorings, accuracy = share of labeled methods whose action (and target) is predicted exactly.
+    Methods the rules decide (getters, setters, delegates, interfaces) keep their rule action whatever the weights.
+"""
+
+# Sweepable constants of refactor_recommendation.py
+PARAMETERS = {
+    "summary_weight": "SUMMARY_WEIGHT",
+    "code_weight": "CODE_WEIGHT",
+    "base_factor": "BASE_FACTOR",
+    "move_threshold": "MOVE_THRESHOLD",
+    "package_bonus": "SAME_PKG_BONUS",
+    "field_bonus": "FIELD_ACCESS_BONUS",
+    "read_bonus": "COHESION_READ_BONUS",
+    "write_bonus": "COHESION_WRITE_BONUS",
+    "call_bonus": "COHESION_CALL_BONUS",
+    "uses_bonus": "USES_BONUS",
+}
+
+DEFAULT_GRID = {
+    "summary_weight": [0.3, 0.4, 0.5, 0.6, 0.7],
+    "base_factor": [0.7, 0.8, 0.9],
+    "move_threshold": [0.6, 0.65, 0.7, 0.75, 0.8, 0.85],
+    "package_bonus": [0.0, 0.05, 0.1, 0.15],
+    "field_bonus": [0.0, 0.05, 0.1, 0.15],
+    "uses_bonus": [0.0, 0.05, 0.1],
+}
+
+KEEP, MOVE, EXTRACT = 0, 1, 2
+
+# Scores held at once while sweeping (configs x methods x candidates float32 cells, 1M cells = 4 MB), and configs
+# scored together (one matrix product per method block)
+SWEEP_CELL_BUDGET = 1_000_000
+CONFIGS_PER_BLOCK = 64
+
+def current_config() -> dict:
+    return {name: getattr(rr, constant) for name, constant in PARAMETERS.items()}
+
+def expand_grid(grid: dict) -> list:
+    """
+    Every combination of the grid values, as full configs (current constants for the missing parameters).
+    A grid without code_weight ties it to summary_weight (code_weight = 1 - summary_weight).
+    """
+    unknown = set(grid) - set(PARAMETERS)
+    if unknown:
+        raise ValueError(f"unknown parameters {sorted(unknown)}, expected some of {sorted(PARAMETERS)}")
+    names = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        config = {**current_config(), **dict(zip(names, values))}
+        if "summary_weight" in grid and "code_weight" not in grid:
+            config["code_weight"] = round(1.0 - config["summary_weight"], 6)
+        configs.append(config)
+    return configs
+
+def action_kind(action: str) -> int:
+    if action.startswith("MOVE"):
+        return MOVE
+    if action.startswith("EXTRACT"):
+        return EXTRACT
+    return KEEP
+
+def load_labels(path: str) -> dict:
+    """
+    {(class, method): (kind, target class or None)} from a recactor_recommendations.json style file
+    """
+    with open(path, encoding="utf-8") as file:
+        records = json.load(file)
+    labels = {}
+    for record in records:
+        kind = action_kind(record["action"])
+        labels[(record["current_class"], record["method"])] = (kind, record.get("best_class") if kind == MOVE else None)
+    return labels
+
+def load_components(path: str) -> dict:
+    with np.load(path) as data:
+        components = {name: data[name] for name in data.files}
+    if tuple(components["columns"]) != rr.COMPONENT_COLUMNS:
+        raise ValueError(f"{path} holds columns {tuple(components['columns'])}, expected {rr.COMPONENT_COLUMNS}")
+    return components
+
+class Sweep:
+    """
+    Saved components laid out once as dense (method x candidate x column) arrays, then evaluated for any number of
+    configs with a matrix product and an argmax per block (first candidate on ties, like pick_best_class)
+    """
+    def __init__(self, components: dict, labels: dict):
+        offsets = components["offsets"]
+        method_keys = list(zip(components["method_class"].tolist(), components["method_name"].tolist()))
+        labeled = [i for i, key in enumerate(method_keys) if key in labels]
+        widths = np.diff(offsets)[labeled] if labeled else np.zeros(0, dtype=int)
+        width = int(widths.max()) if len(widths) else 1
+
+        self.values = np.zeros((len(labeled), width, len(rr.COMPONENT_COLUMNS)), dtype=np.float32)
+        self.valid = np.zeros((len(labeled), width), dtype=bool)
+        self.source = np.full(len(labeled), -1)         # column of the method's own class, -1 when not a candidate
+        self.label_kind = np.zeros(len(labeled), dtype=int)
+        self.label_target = np.full(len(labeled), -2)   # column of the labeled MOVE target, -1 when not a candidate
+        candidates = components["candidates"].tolist()
+
+        for row, i in enumerate(labeled):
+            start, end = offsets[i], offsets[i + 1]
+            method_candidates = candidates[start:end]
+            self.values[row, :end - start] = components["rows"][start:end]
+            self.valid[row, :end - start] = True
+            key = method_keys[i]
+            if key[0] in method_candidates:
+                self.source[row] = method_candidates.index(key[0])
+            kind, target = labels[key]
+            self.label_kind[row] = kind
+            if kind == MOVE:
+                self.label_target[row] = method_candidates.index(target) if target in method_candidates else -1
+
+        # Rule decided methods: fixed predictions
+        rule_keys = list(zip(components["rule_class"].tolist(), components["rule_method"].tolist()))
+        rule_labeled = [(key, action) for key, action in zip(rule_keys, components["rule_action"].tolist())
+                        if key in labels]
+        self.fixed_correct = sum(action_kind(action) == labels[key][0] == KEEP for key, action in rule_labeled)
+        self.fixed_label_positive = sum(labels[key][0] != KEEP for key, _ in rule_labeled)
+        self.methods = len(labeled) + len(rule_labeled)
+        self.unmatched = len(set(labels) - set(method_keys) - set(rule_keys))
+
+    def weights(self, configs: list) -> tuple:
+        """
+        (configs x columns) weights of the raw components, and the MOVE threshold of each config
+        """
+        columns = {
+            "summary": lambda c: c["base_factor"] * c["summary_weight"],
+            "code": lambda c: c["base_factor"] * c["code_weight"],
+            "same_package": lambda c: c["package_bonus"],
+            "field_access": lambda c: c["field_bonus"],
+            "read_calls": lambda c: c["read_bonus"],
+            "write_calls": lambda c: c["write_bonus"],
+            "external_calls": lambda c: c["call_bonus"],
+            "uses": lambda c: c["uses_bonus"],
+        }
+        weights = np.array([[columns[name](config) for name in rr.COMPONENT_COLUMNS] for config in configs],
+                           dtype=np.float32)
+        return weights, np.array([config["move_threshold"] for config in configs], dtype=np.float32)
+
+    def blocks(self, config_count: int, cell_budget: int = SWEEP_CELL_BUDGET) -> tuple:
+        """
+        (configs, methods) per block, so one block's configs x methods x candidates scores stay under cell_budget
+        """
+        width = max(1, self.values.shape[1])
+        configs = max(1, min(config_count, CONFIGS_PER_BLOCK, cell_budget // width))
+        methods = max(1, cell_budget // (configs * width))
+        return configs, methods
+
+    def evaluate(self, configs: list, cell_budget: int = SWEEP_CELL_BUDGET) -> list:
+        """
+        Precision, recall, F1, accuracy and predicted action counts of every config.
+        Scored block by block (see blocks): each block is reduced to the per method action at once, only per config
+        counts are kept.
+        """
+        weights, thresholds = self.weights(configs)
+        label_positive = int((self.label_kind != KEEP).sum()) + self.fixed_label_positive
+        config_block, method_block = self.blocks(len(configs), cell_budget)
+        counts = {name: np.zeros(len(configs), dtype=np.int64)
+                  for name in ("true_positive", "predicted_positive", "correct", "moves", "extracts")}
+
+        for start in range(0, len(configs), config_block):
+            chunk = slice(start, start + config_block)
+            chunk_weights, chunk_thresholds = weights[chunk].T, thresholds[chunk]
+            for first in range(0, len(self.values), method_block):
+                rows = slice(first, first + method_block)
+                # (methods x candidates x configs) final scores of this block
+                scores = self.values[rows] @ chunk_weights
+                scores[~self.valid[rows]] = -np.inf
+                best = np.argmax(scores, axis=1)
+                best_score = np.take_along_axis(scores, best[:, None, :], axis=1)[:, 0, :]
+                del scores
+
+                kind = np.where(best_score >= chunk_thresholds[None, :], MOVE, EXTRACT)
+                kind = np.where(best == self.source[rows, None], KEEP, kind)
+                exact = (kind == self.label_kind[rows, None]) & ((kind != MOVE) | (best == self.label_target[rows, None]))
+                counts["true_positive"][chunk] += (exact & (kind != KEEP)).sum(axis=0)
+                counts["predicted_positive"][chunk] += (kind != KEEP).sum(axis=0)
+                counts["correct"][chunk] += exact.sum(axis=0)
+                counts["moves"][chunk] += (kind == MOVE).sum(axis=0)
+                counts["extracts"][chunk] += (kind == EXTRACT).sum(axis=0)
+
+        results = []
+        for i in range(len(configs)):
+            true_positive, predicted_positive = counts["true_positive"][i], counts["predicted_positive"][i]
+            precision = true_positive / predicted_positive if predicted_positive else 0.0
+            recall = true_positive / label_positive if label_positive else 0.0
+            results.append({
+                "precision": round(float(precision), 4),
+                "recall": round(float(recall), 4),
+                "f1": round(float(2 * precision * recall / (precision + recall)) if precision + recall else 0.0, 4),
+                "accuracy": round(float((counts["correct"][i] + self.fixed_correct) / self.methods), 4)
+                            if self.methods else 0.0,
+                "moves": int(counts["moves"][i]),
+                "extracts": int(counts["extracts"][i]),
+            })
+        return results
+
+def sweep(components: dict, labels: dict, configs: list, cell_budget: int = SWEEP_CELL_BUDGET) -> dict:
+    """
+    Evaluate the current constants and every config; returns the report with the configs ranked by F1, then accuracy
+    """
+    started = time.perf_counter()
+    evaluator = Sweep(components, labels)
+    baseline = evaluator.evaluate([current_config()], cell_budget)[0]
+    results = evaluator.evaluate(configs, cell_budget)
+    seconds = time.perf_counter() - started
+
+    ranked = sorted(({**config, **metrics} for config, metrics in zip(configs, results)),
+                    key=lambda entry: (-entry["f1"], -entry["accuracy"]))
+    return {
+        "methods": evaluator.methods,
+        "labeled_refactorings": int((evaluator.label_kind != KEEP).sum()) + evaluator.fixed_label_positive,
+        "unmatched_labels": evaluator.unmatched,
+        "configs": len(configs),
+        "seconds": round(seconds, 3),
+        "baseline": {**current_config(), **baseline},
+        "ranked": ranked,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate scoring weights and thresholds on saved score components")
+    parser.add_argument("components", help=".npz written by refactor_recommendation.py --save-components")
+    parser.add_argument("--labels", required=True,
+                        help="expected recommendations, in the recactor_recommendations.json format")
+    parser.add_argument("--grid", default=None,
+                        help="JSON file {parameter: [values]} (default: a grid over weights, threshold and bonuses)")
+    parser.add_argument("--cell-budget", type=int, default=SWEEP_CELL_BUDGET,
+                        help="scores (configs x methods x candidates) held in memory at once")
+    parser.add_argument("--top", type=int, default=10, help="configurations shown (and kept in --output)")
+    parser.add_argument("--output", default=None, help="write the report (baseline and top configurations) as JSON")
+    args = parser.parse_args()
+
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid, encoding="utf-8") as file:
+            grid = json.load(file)
+    try:
+        configs = expand_grid(grid)
+        components = load_components(args.components)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    report = sweep(components, load_labels(args.labels), configs, args.cell_budget)
+    report["ranked"] = report["ranked"][:args.top]
+
+    print(f"{report['configs']} configurations on {report['methods']} labeled methods "
+          f"({report['labeled_refactorings']} refactorings) in {report['seconds']:.2f}s")
+    if report["unmatched_labels"]:
+        print(f"{report['unmatched_labels']} labeled methods are not in the components file", file=sys.stderr)
+    print(tabulate([report["baseline"]] + report["ranked"], headers="keys", tablefmt="github",
+                   showindex=["current"] + list(range(1, len(report["ranked"]) + 1))))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file_out:
+            json.dump(report, file_out, indent=2)
+        print(f"Sweep report written to {args.output}")
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+import refactor_recommendation as rr
+
+"""
+    The scoring loop refactor_recommendation.py started from (one cosine_similarity call and one call of each bonus
+    function per (method, candidate class)), and seeded vectors to run it and the scoring engine on.
+"""
+
+def synthetic_embeddings(classes, to_score, dim=32, seed=0):
+    """
+    Embeddings as embed_classes_and_methods returns them: random class vectors, and every method close to its
+    own class (half of them) or to a random class, so that every action occurs
+    """
+    rng = np.random.default_rng(seed)
+    class_index = {cls: row for row, cls in enumerate(classes)}
+    class_summary = rng.standard_normal((len(classes), dim)).astype(np.float32)
+    class_code = rng.standard_normal((len(classes), dim)).astype(np.float32)
+    near = np.array([class_index[cls] if rng.random() < 0.5 else rng.integers(len(classes)) for cls, _ in to_score])
+    noise = 0.6 * rng.standard_normal((2, len(to_score), dim)).astype(np.float32)
+    return {
+        "class_index": class_index,
+        "method_index": {key: row for row, key in enumerate(to_score)},
+        "class_summary": class_summary,
+        "class_code": class_code,
+        "method_summary": class_summary[near] + noise[0],
+        "method_code": class_code[near] + noise[1],
+    }
+
+def baseline_recommendations(classes, methods, embeddings):
+    """
+    The original per pair loop, best candidate by strictly greater score
+    """
+    decisions, to_score = rr.rule_based_decisions(classes, methods)
+    class_index, method_index = embeddings["class_index"], embeddings["method_index"]
+    for cls_name, method_name in to_score:
+        method_meta = methods[(cls_name, method_name)]
+        row = method_index[(cls_name, method_name)]
+        used_classes = rr.extract_method_used_classes(method_meta, classes[cls_name].get("classFields", []))
+        best_cls, best_score = cls_name, -1.0
+        for candidate in rr.structural_candidates(method_meta, classes):
+            column = class_index[candidate]
+            summary_sim = cosine_similarity([embeddings["method_summary"][row]], [embeddings["class_summary"][column]])[0][0]
+            code_sim = cosine_similarity([embeddings["method_code"][row]], [embeddings["class_code"][column]])[0][0]
+            base_score = 0.50 * summary_sim + 0.50 * code_sim
+            bonus_score = (rr.same_package_bonus(classes[cls_name]["package"], classes[candidate]["package"])
+                           + rr.field_bonus(method_meta, candidate)
+                           + rr.cohesion_bonus(method_meta, candidate, method_name)
+                           + (0.05 if candidate in used_classes else 0.0))
+            candidate_score = (0.8 * base_score) + bonus_score
+            if candidate_score > best_score:
+                best_cls, best_score = candidate, candidate_score
+
+        if best_cls == cls_name:
+            action = "KEEP"
+        elif best_score >= rr.MOVE_THRESHOLD:
+            action = f"MOVE to {best_cls}"
+        else:
+            action = "EXTRACT to new class"
+        decisions[(cls_name, method_name)] = (action, best_cls, float(round(best_score, 3)))
+    return rr.recommendation_records(methods, decisions)
+
+def assert_same_recommendations(actual, expected):
+    assert [(r["current_class"], r["method"]) for r in actual] == [(r["current_class"], r["method"]) for r in expected]
+    for got, want in zip(actual, expected):
+        assert (got["action"], got["best_class"]) == (want["action"], want["best_class"]), got
+        # float32 matrix products against float64 per pair similarities: at most a rounding step apart
+        assert got["score"] == pytest.approx(want["score"], abs=1.001e-3), got
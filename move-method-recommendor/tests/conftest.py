@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# The scripts import each other as siblings, as when run from scripts/
+for directory in ("scripts", "benchmarks"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+from ollama_stub import make_stub_server
+from synthetic_project import generate_project
+
+LLM_GENERATOR = os.path.join(ROOT, "scripts", "llm_generator.py")
+
+FAKE_JAVA = """#!{python}
+import json, sys
+
+# Stands in for `java ... scripts.GenerateAST --batch` (see test_ast_server.py for the real one): one AST record
+# per path read on stdin, from the records synthetic_project.py generated next to the sources
+records = {{}}
+with open({ast_jsonl!r}, encoding="utf-8") as file:
+    for line in file:
+        record = json.loads(line)
+        records[record["path"]] = record
+for index, line in enumerate(sys.stdin):
+    print(json.dumps({{**records[line.strip()], "index": index}}), flush=True)
+"""
+
+@pytest.fixture(scope="session")
+def stub():
+    server = make_stub_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+def make_project(directory, classes=30):
+    """
+    Synthetic java project under directory/src, with a `java` in directory/bin answering its AST records
+    """
+    counts = generate_project(str(directory), classes, methods_per_class=8, coupling=0.3, packages=4, seed=0)
+    bin_dir = directory / "bin"
+    bin_dir.mkdir()
+    java = bin_dir / "java"
+    java.write_text(FAKE_JAVA.format(python=sys.executable, ast_jsonl=str(directory / "ast.jsonl")))
+    java.chmod(0o755)
+    return {"dir": directory, "src": counts["src_dir"], "bin": str(bin_dir)}
+
+@pytest.fixture
+def project(tmp_path):
+    return make_project(tmp_path)
+
+@pytest.fixture(scope="session")
+def summarize(stub):
+    """
+    summarize(project, output, *args) runs llm_generator.py on the project against the stub LLM and returns the
+    number of LLM requests it made
+    """
+    def run(project, output, *args):
+        before = stub.request_count
+        env = {**os.environ, "PATH": project["bin"] + os.pathsep + os.environ.get("PATH", "")}
+        subprocess.run([sys.executable, LLM_GENERATOR, project["src"], "--output", str(output),
+                        "--ollama-host", f"http://127.0.0.1:{stub.server_address[1]}", "--model", "stub",
+                        "--no-cache", "--ast-workers", "2", *args],
+                       env=env, cwd=str(project["dir"]), check=True, capture_output=True, text=True)
+        return stub.request_count - before
+    return run
+
+@pytest.fixture(scope="session")
+def scoring_inputs(tmp_path_factory, summarize):
+    """
+    (classes, methods, rule_based_decisions, embeddings) of a summarized synthetic project, with seeded vectors
+    """
+    import refactor_recommendation as rr
+    from baseline_scoring import synthetic_embeddings
+
+    project = make_project(tmp_path_factory.mktemp("scoring"))
+    summaries = project["dir"] / "summaries.jsonl"
+    summarize(project, summaries)
+    classes, methods = rr.load_llm_summaries(str(summaries))
+    rules = rr.rule_based_decisions(classes, methods)
+    return classes, methods, rules, synthetic_embeddings(classes, rules[1])
+
+@pytest.fixture(scope="session")
+def baseline(scoring_inputs):
+    """
+    Recommendations of the original per pair scoring loop on scoring_inputs
+    """
+    from baseline_scoring import baseline_recommendations
+
+    classes, methods, _, embeddings = scoring_inputs
+    recommendations = baseline_recommendations(classes, methods, embeddings)
+    actions = {r["action"].split(" ")[0] for r in recommendations}
+    assert {"KEEP", "MOVE", "EXTRACT"} <= actions, "the synthetic project should exercise every action"
+    return recommendations
@@ -0,0 +1,46 @@
+import numpy as np
+
+import refactor_recommendation as rr
+from ann_index import IVFIndex
+from baseline_scoring import assert_same_recommendations
+
+def brute_force(vectors, queries, k):
+    scores = queries @ vectors.T
+    return [np.lexsort((np.arange(len(vectors)), -row))[:k] for row in scores]
+
+def test_search_with_every_list_probed_is_exact():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, 16)).astype(np.float32)
+    vectors[10] = vectors[200]  # a tie, won by the lowest row
+    queries = np.vstack([vectors[200], rng.standard_normal((40, 16)).astype(np.float32)])
+    index = IVFIndex(vectors, lists=12)
+    for k in (1, 7, 300):
+        found = index.search(queries, k, probes=12)
+        assert all(np.array_equal(got, want) for got, want in zip(found, brute_force(vectors, queries, k)))
+    assert list(index.search(queries[:1], 2, probes=12)[0]) == [10, 200]
+
+def test_search_only_returns_probed_lists():
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((500, 8)).astype(np.float32)
+    queries = rng.standard_normal((30, 8)).astype(np.float32)
+    index = IVFIndex(vectors, lists=20)
+    found = index.search(queries, 10, probes=3)
+    for query, rows in zip(queries, found):
+        probed = np.argsort(-(index.centroids @ query))[:3]
+        members = np.sort(np.concatenate([index.members[i] for i in probed]))
+        assert len(rows) == 10 and set(rows) <= set(members)
+        # The best of the probed vectors, best first
+        assert np.array_equal(rows, members[brute_force(vectors[members], query[None], 10)[0]])
+
+def test_exact_ann_matches_baseline(scoring_inputs, baseline):
+    classes, methods, rules, embeddings = scoring_inputs
+    recommendations = rr.recommend(classes, methods, embeddings, candidate_mode="ann", rules=rules,
+                                   ann={"top_k": len(classes), "probes": len(classes)})
+    assert_same_recommendations(recommendations, baseline)
+
+def test_ann_workers_match_single_process(scoring_inputs):
+    classes, methods, rules, embeddings = scoring_inputs
+    ann = {"top_k": 5, "probes": 2}
+    single = rr.recommend(classes, methods, embeddings, candidate_mode="ann", rules=rules, ann=ann)
+    parallel = rr.recommend(classes, methods, embeddings, candidate_mode="ann", rules=rules, ann=ann, workers=3)
+    assert parallel == single
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+import llm_generator
+from llm_generator import ASTServer
+from metrics import METRICS
+from synthetic_project import generate_project
+
+"""
+    GenerateAST --batch and llm_generator.ASTServer.
+
+    The JVM tests run the real GenerateAST (test_out/, or compiled here when javac is available) and are skipped
+    without java. The protocol tests replace the JVM with a small script, to make it answer out of order, die or
+    go silent.
+"""
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LIBS = [os.path.join(ROOT, "libs", "gson-2.10.1.jar"), os.path.join(ROOT, "libs", "javaparser-core-3.25.4.jar")]
+
+@pytest.fixture(scope="module")
+def generate_ast_cmd(tmp_path_factory):
+    if shutil.which("java") is None:
+        pytest.skip("java is not available")
+    classes_dir = os.path.join(ROOT, "test_out")
+    if not os.path.exists(os.path.join(classes_dir, "scripts", "GenerateAST.class")):
+        if shutil.which("javac") is None:
+            pytest.skip("GenerateAST is not compiled (test_out/) and javac is not available")
+        classes_dir = str(tmp_path_factory.mktemp("classes"))
+        subprocess.run(["javac", "-cp", os.pathsep.join(LIBS), "-d", classes_dir,
+                        os.path.join(ROOT, "scripts", "GenerateAST.java")], check=True)
+    return lambda *args: ["java", "-cp", os.pathsep.join([classes_dir, *LIBS]), "scripts.GenerateAST", *args]
+
+@pytest.fixture
+def java_project(tmp_path):
+    generate_project(str(tmp_path), 24, methods_per_class=4, packages=3, seed=1)
+    with open(tmp_path / "ast.jsonl", encoding="utf-8") as file:
+        expected = [json.loads(line) for line in file]
+    return [record["path"] for record in expected], expected
+
+def outline(ast):
+    return [(cls["class"], [method["name"] for method in cls["methods"]]) for cls in ast.get("classes", [])]
+
+@pytest.mark.parametrize("threads", [1, 4])
+def test_parse_many_yields_every_file_in_input_order(generate_ast_cmd, java_project, monkeypatch, threads):
+    monkeypatch.setattr(llm_generator, "ast_generator_cmd", generate_ast_cmd)
+    paths, expected = java_project
+    paths, expected = paths[::-1], expected[::-1]
+
+    with ASTServer(threads=threads) as server:
+        parsed = list(server.parse_many(paths))
+
+    assert [path for path, _ in parsed] == paths
+    assert [outline(ast) for _, ast in parsed] == [outline(record) for record in expected]
+    assert [ast["package"] for _, ast in parsed] == [record["package"] for record in expected]
+
+def test_broken_file_gets_an_error_record(generate_ast_cmd, java_project, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_generator, "ast_generator_cmd", generate_ast_cmd)
+    paths, expected = java_project
+    broken = tmp_path / "Broken.java"
+    broken.write_text("public class Broken { void run( { }\n")
+    missing = str(tmp_path / "Missing.java")
+
+    errors = METRICS.counters.get("ast.errors", 0)
+    with ASTServer(threads=4) as server:
+        parsed = dict(server.parse_many([paths[0], str(broken), missing, paths[1]]))
+        # The JVM is still in sync after the errors
+        assert outline(server.parse(paths[2])) == outline(expected[2])
+
+    assert parsed[str(broken)] == {} and parsed[missing] == {}
+    assert outline(parsed[paths[0]]) == outline(expected[0])
+    assert outline(parsed[paths[1]]) == outline(expected[1])
+    assert METRICS.counters.get("ast.errors", 0) - errors == 2
+
+# --- protocol, with a scripted JVM ---
+
+SCRIPTED_JVM = """import json, sys, time
+
+# Answers GenerateAST --batch requests ({{"path", "index", "package", "classes"}}) {behaviour}
+pending = []
+for index, line in enumerate(sys.stdin):
+    path = line.strip()
+    pending.append({{"path": path, "index": index, "package": "", "classes": [{{"class": path, "methods": []}}]}})
+    {on_request}
+"""
+
+def scripted_jvm(tmp_path, monkeypatch, behaviour, on_request):
+    script = tmp_path / "jvm.py"
+    script.write_text(SCRIPTED_JVM.format(behaviour=behaviour, on_request=on_request))
+    monkeypatch.setattr(llm_generator, "ast_generator_cmd", lambda *args: [sys.executable, str(script), *args])
+
+def class_of(ast):
+    return ast["classes"][0]["class"] if ast else None
+
+def test_out_of_order_records_are_matched_by_index(tmp_path, monkeypatch):
+    # Reversed in groups of three, and with a path that does not echo back as sent
+    scripted_jvm(tmp_path, monkeypatch, "in reverse order, three at a time", """if len(pending) == 3:
+        for record in reversed(pending):
+            print(json.dumps({**record, "path": "elsewhere"}), flush=True)
+        pending = []""")
+    paths = [str(tmp_path / f"F{i}.java") for i in range(6)]
+
+    with ASTServer(threads=3, record_timeout=10) as server:
+        parsed = list(server.parse_many(paths))
+
+    assert [(path, class_of(ast)) for path, ast in parsed] == [(path, path) for path in paths]
+
+def test_paths_that_cannot_round_trip_are_not_sent(tmp_path, monkeypatch):
+    scripted_jvm(tmp_path, monkeypatch, "one by one", """print(json.dumps(pending.pop()), flush=True)""")
+    paths = [str(tmp_path / "A.java"), str(tmp_path / "B.java "), str(tmp_path / "C\nD.java"), str(tmp_path / "E.java")]
+
+    with ASTServer(record_timeout=10) as server:
+        parsed = list(server.parse_many(paths))
+        assert server.parse(str(tmp_path / "F.java ")) == {}
+        assert class_of(server.parse(str(tmp_path / "G.java"))) == str(tmp_path / "G.java")
+
+    assert [class_of(ast) for _, ast in parsed] == [paths[0], None, None, paths[3]]
+
+def test_dead_jvm_ends_the_run_and_the_next_request_starts_a_new_one(tmp_path, monkeypatch, capsys):
+    scripted_jvm(tmp_path, monkeypatch, "one by one, and dies at the third request", """if index == 2:
+        sys.exit(1)
+    print(json.dumps(pending.pop()), flush=True)""")
+    paths = [str(tmp_path / f"F{i}.java") for i in range(5)]
+
+    with ASTServer(record_timeout=30) as server:
+        start = time.perf_counter()
+        parsed = list(server.parse_many(paths))
+        assert time.perf_counter() - start < 10
+        assert "AST server exited unexpectedly" in capsys.readouterr().err
+        assert [class_of(ast) for _, ast in parsed] == paths[:2]
+
+        assert class_of(server.parse(paths[4])) == paths[4]
+
+def test_silent_jvm_times_out(tmp_path, monkeypatch, capsys):
+    # Never answers the second request (a parser thread lost to an error), but stays alive
+    scripted_jvm(tmp_path, monkeypatch, "except the second one, and never exits", """if index != 1:
+        print(json.dumps(pending.pop()), flush=True)
+    if index == 2:
+        time.sleep(600)""")
+    paths = [str(tmp_path / f"F{i}.java") for i in range(3)]
+
+    with ASTServer(record_timeout=1) as server:
+        start = time.perf_counter()
+        parsed = list(server.parse_many(paths))
+        assert time.perf_counter() - start < 10
+
+    assert [class_of(ast) for _, ast in parsed] == paths[:1]
+    assert "AST server sent nothing for 1s" in capsys.readouterr().err
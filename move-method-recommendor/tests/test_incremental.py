@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+import refactor_recommendation as rr
+from baseline_scoring import assert_same_recommendations
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as file:
+        return file.readlines()
+
+def test_incremental_run_only_summarizes_changed_files(project, summarize):
+    output = project["dir"] / "summaries.jsonl"
+    summarize(project, output, "--fresh")
+    first = read_lines(output)
+
+    assert summarize(project, output) == 0
+    assert read_lines(output) == first
+
+    # Change one file: only its prompts are sent again, and the output is the one of a fresh run
+    changed = sorted(os.path.join(root, name) for root, _, names in os.walk(project["src"]) for name in names)[5]
+    with open(changed, "a", encoding="utf-8") as file:
+        file.write("// changed\n")
+    requests = summarize(project, output)
+    fresh = project["dir"] / "fresh.jsonl"
+    fresh_requests = summarize(project, fresh, "--fresh")
+    assert read_lines(output) == read_lines(fresh)
+    assert 0 < requests < fresh_requests / 10
+
+    # Other summarization settings: every file is summarized again
+    assert summarize(project, output, "--summarize-all") > fresh_requests
+
+def rerun(classes, methods, embeddings, manifest, previous):
+    rules = rr.rule_based_decisions(classes, methods)
+    rescore, _ = rr.plan_rescoring(classes, methods, manifest, previous, candidate_mode="pruned")
+    incremental = rr.recommend(classes, methods, embeddings, candidate_mode="pruned", previous=previous,
+                               rescore=rescore, rules=rules)
+    full = rr.recommend(classes, methods, embeddings, candidate_mode="pruned", rules=rules)
+    assert_same_recommendations(incremental, full)
+    return rescore
+
+def test_incremental_scoring_matches_a_full_run(scoring_inputs):
+    classes, methods, rules, embeddings = scoring_inputs
+    first = rr.recommend(classes, methods, embeddings, candidate_mode="pruned", rules=rules)
+    _, manifest = rr.plan_rescoring(classes, methods, candidate_mode="pruned")
+    previous = {(r["current_class"], r["method"]): r for r in first}
+
+    assert rerun(classes, methods, embeddings, manifest, previous) == set()
+
+    # A changed method summary (and so vector): only that method is scored again
+    key = rules[1][len(rules[1]) // 2]
+    changed_methods = {**methods, key: {**methods[key], "summary": "Now does something else entirely."}}
+    changed_embeddings = {**embeddings, "method_summary": embeddings["method_summary"].copy()}
+    changed_embeddings["method_summary"][embeddings["method_index"][key]] *= -1
+    assert rerun(classes, changed_methods, changed_embeddings, manifest, previous) == {key}
+
+    # A changed class: the methods it is a candidate of, a small part of the project
+    cls = key[0]
+    changed_classes = {**classes, cls: {**classes[cls], "summary": "Now holds something else entirely."}}
+    changed_embeddings = {**embeddings, "class_summary": embeddings["class_summary"].copy()}
+    changed_embeddings["class_summary"][embeddings["class_index"][cls]] = np.flip(embeddings["class_summary"][0])
+    rescore = rerun(changed_classes, methods, changed_embeddings, manifest, previous)
+    assert {k for k in methods if k[0] == cls} <= rescore
+    assert len(rescore) < len(methods) / 2
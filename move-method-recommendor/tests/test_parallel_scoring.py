@@ -0,0 +1,37 @@
+import io
+import json
+
+import pytest
+
+import refactor_recommendation as rr
+from baseline_scoring import assert_same_recommendations
+
+def test_workers_match_single_process(scoring_inputs, baseline):
+    classes, methods, rules, embeddings = scoring_inputs
+    single_explain, parallel_explain = io.StringIO(), io.StringIO()
+    single = rr.recommend(classes, methods, embeddings, rules=rules, explain=single_explain)
+    parallel = rr.recommend(classes, methods, embeddings, rules=rules, workers=3, explain=parallel_explain)
+    assert parallel == single
+    # Same explanations, up to float32 rounding: chunks start scoring blocks at other methods
+    single_records = [json.loads(line) for line in single_explain.getvalue().splitlines()]
+    parallel_records = [json.loads(line) for line in parallel_explain.getvalue().splitlines()]
+    assert len(parallel_records) == len(single_records) == len(rules[1])
+    for got, want in zip(parallel_records, single_records):
+        assert (got["class"], got["method"], got["action"], got["candidates"]) == \
+               (want["class"], want["method"], want["action"], want["candidates"])
+        assert got["current"] == pytest.approx(want["current"], abs=1e-3)
+    assert_same_recommendations(parallel, baseline)
+
+@pytest.mark.parametrize("shards", [2, 3, 7])
+def test_merged_shards_match_baseline(scoring_inputs, baseline, tmp_path, shards):
+    classes, methods, rules, embeddings = scoring_inputs
+    output = str(tmp_path / "recommendations.json")
+    for shard in range(1, shards + 1):
+        keys = rr.shard_slice(rules[1], shard, shards)
+        assert keys, f"shard {shard}/{shards} is empty"
+        decisions = rr.score_decisions(keys, methods, classes, embeddings)
+        rr.write_shard(rr.shard_path(output, shard, shards), shard, shards, keys, decisions)
+
+    merged = rr.merge_shards(classes, methods, output, shards)
+    assert merged == rr.recommend(classes, methods, embeddings, rules=rules)
+    assert_same_recommendations(merged, baseline)
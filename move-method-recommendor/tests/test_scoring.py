@@ -0,0 +1,33 @@
+import numpy as np
+
+import refactor_recommendation as rr
+from baseline_scoring import assert_same_recommendations
+
+def test_exhaustive_matches_baseline(scoring_inputs, baseline):
+    classes, methods, rules, embeddings = scoring_inputs
+    recommendations = rr.recommend(classes, methods, embeddings, candidate_mode="exhaustive", rules=rules)
+    assert_same_recommendations(recommendations, baseline)
+
+def test_scores_match_per_pair_components(scoring_inputs):
+    classes, methods, rules, embeddings = scoring_inputs
+    keys = rules[1][:40]
+    for (cls_name, method_name), candidates, scores in rr.score_methods(keys, methods, classes, embeddings,
+                                                                        candidate_mode="exhaustive"):
+        assert candidates == list(classes)
+        row = embeddings["method_index"][(cls_name, method_name)]
+        method_meta = methods[(cls_name, method_name)]
+        for i, candidate in enumerate(candidates):
+            column = embeddings["class_index"][candidate]
+            summary_sim = np.dot(embeddings["method_summary"][row], embeddings["class_summary"][column]) / (
+                np.linalg.norm(embeddings["method_summary"][row]) * np.linalg.norm(embeddings["class_summary"][column]))
+            assert scores["summary"][i] == np.float32(summary_sim) or abs(scores["summary"][i] - summary_sim) < 1e-5
+            assert scores["package"][i] == rr.same_package_bonus(classes[cls_name]["package"], classes[candidate]["package"])
+            assert scores["field"][i] == rr.field_bonus(method_meta, candidate)
+            assert abs(scores["cohesion"][i] - rr.cohesion_bonus(method_meta, candidate, method_name)) < 1e-9
+
+def test_block_size_does_not_change_scores(scoring_inputs):
+    classes, methods, _, embeddings = scoring_inputs
+    keys = rr.rule_based_decisions(classes, methods)[1]
+    whole = [scores["final"] for _, _, scores in rr.score_methods(keys, methods, classes, embeddings)]
+    small = [scores["final"] for _, _, scores in rr.score_methods(keys, methods, classes, embeddings, block_size=7)]
+    assert all(np.allclose(a, b, atol=1e-6) for a, b in zip(whole, small))
@@ -0,0 +1,22 @@
+from ollama_client import OllamaClient, StructuredJob, SummaryEngine
+from summary_cache import SummaryCache
+
+def test_group_answers_are_cached_apart_from_single_answers(stub, tmp_path):
+    cache = SummaryCache(str(tmp_path / "cache.sqlite"))
+    engine = SummaryEngine(OllamaClient(f"http://127.0.0.1:{stub.server_address[1]}"), "stub", workers=2, cache=cache)
+    prompt = "Summarize the method total of class Order."
+    group = StructuredJob([("Summarize the methods of class Order as JSON.", lambda response: {"total": "From the group."})],
+                          {"total": prompt})
+
+    def run(jobs):
+        before = stub.request_count
+        return dict(engine.map(jobs)), stub.request_count - before
+
+    single, requests = run([("single", prompt)])
+    assert requests == 1 and single["single"] != "From the group."
+
+    # The single answer cached for the same prompt is not taken for the group, and the other way round
+    assert run([("group", group)]) == ({"group": {"total": "From the group."}}, 1)
+    assert run([("group", group)]) == ({"group": {"total": "From the group."}}, 0)
+    assert run([("single", prompt)]) == (single, 0)
+    cache.close()
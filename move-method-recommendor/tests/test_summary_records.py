@@ -0,0 +1,80 @@
+import json
+
+import refactor_recommendation as rr
+from summary_records import SummaryRecordWriter, iter_summary_records
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as file:
+        return file.readlines()
+
+def test_resume_after_interrupted_run(project, summarize):
+    full = project["dir"] / "full.jsonl"
+    requests = summarize(project, full, "--fresh")
+    lines = read_lines(full)
+
+    # A crash after the third file: a few records of the fourth one and half a line
+    done = [i for i, line in enumerate(lines) if json.loads(line)["type"] == "done"]
+    interrupted = project["dir"] / "interrupted.jsonl"
+    with open(interrupted, "w", encoding="utf-8") as file:
+        file.writelines(lines[:done[2] + 3])
+        file.write(lines[done[2] + 3][:20])
+
+    resumed_requests = summarize(project, interrupted)
+    assert read_lines(interrupted) == lines
+    assert 0 < resumed_requests < requests
+
+def test_writer_keeps_finished_files_only(tmp_path):
+    path = str(tmp_path / "summaries.jsonl")
+    with SummaryRecordWriter(path, resume=False) as writer:
+        writer.write_source("A.java", "sha-a", "class A {}")
+        writer.write_class("A.java", "A", {"summary": "A class.", "package": "p"})
+        writer.finish_file("A.java", "sha-a")
+        writer.write_source("B.java", "sha-b", "class B {}")
+        writer.write_class("B.java", "B", {"summary": "B class.", "package": "p"})
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"type": "method", "file": "B.ja')
+
+    # Reading stops at the torn line, resuming drops the unfinished file
+    assert [record["type"] for record in iter_summary_records(path)] == ["source", "class", "done", "source", "class"]
+    with SummaryRecordWriter(path) as writer:
+        assert writer.completed_files == {"A.java": "sha-a"}
+    assert [record["file"] for record in iter_summary_records(path)] == ["A.java"] * 3
+
+def test_jsonl_and_legacy_json_load_the_same(tmp_path):
+    jsonl = str(tmp_path / "summaries.jsonl")
+    with SummaryRecordWriter(jsonl, resume=False) as writer:
+        writer.write_source("Order.java", "sha", "class Order {}")
+        writer.write_class("Order.java", "Order", {"summary": "Holds an order.", "package": "shop", "uses_classes": [],
+                                                   "classFields": [{"var_name": "total", "var_type": "int"}]})
+        writer.write_method("Order.java", "Order", "Returns the total.", {"name": "total", "parameters": [],
+                                                                        "methodCalls": [], "methodBody": "{ return total; }"})
+        writer.finish_file("Order.java", "sha")
+
+    legacy = str(tmp_path / "llm_code_summaries.json")
+    with open(legacy, "w", encoding="utf-8") as file:
+        json.dump({"Order": {"summary": "Holds an order.", "package": "shop", "classBody": "class Order {}",
+                             "uses_classes": [], "classFields": [{"var_name": "total", "var_type": "int"}],
+                             "methods": {"total": "Returns the total."},
+                             "methods_meta": [{"name": "total", "parameters": [], "methodCalls": [],
+                                               "methodBody": "{ return total; }"}]}}, file)
+
+    jsonl_classes, jsonl_methods = rr.load_llm_summaries(jsonl)
+    legacy_classes, legacy_methods = rr.load_llm_summaries(legacy)
+    assert dict(jsonl_methods) == dict(legacy_methods)
+    assert {name: {k: v for k, v in info.items() if k != "file"} for name, info in jsonl_classes.items()} == \
+           {name: {k: v for k, v in info.items() if k != "file"} for name, info in legacy_classes.items()}
+
+def test_rule_decided_methods_are_marked(project, summarize):
+    output = project["dir"] / "summaries.jsonl"
+    summarize(project, output, "--fresh")
+    methods = [record for record in iter_summary_records(str(output)) if record["type"] == "method"]
+    marked = {(record["class"], record["name"]) for record in methods if record.get("decided_by") == "rule"}
+
+    # Exactly the methods the recommender's rules decide, and the only ones without a summary
+    classes, loaded = rr.load_llm_summaries(str(output))
+    decisions, _ = rr.rule_based_decisions(classes, loaded)
+    assert marked and marked == set(decisions)
+    assert {(record["class"], record["name"]) for record in methods if not record["summary"]} == marked
+
+    summarize(project, output, "--fresh", "--summarize-all")
+    assert not any("decided_by" in record for record in iter_summary_records(str(output)))